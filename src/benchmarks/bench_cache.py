@@ -0,0 +1,127 @@
+"""
+Benchmark bytes on disk and load latency of cached items, plain and zstd-compressed.
+
+Items from the synthetic corpus (see `benchmarks.fake_hn`) are trimmed and
+saved to both cache backends as plain JSON, then compressed in place with a
+dictionary trained on a sample of them. For each combination it reports the
+bytes allocated on disk (whole filesystem blocks, which is what competes for
+the page cache), the apparent file sizes, and the time to load every entry in
+batches, as the pipeline does.
+
+Run from the `src` directory:
+
+    python -m benchmarks.bench_cache --items 100000
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from typing import Any
+
+from benchmarks.fake_hn import Corpus
+from magpie.fscache import CacheBackend, FSCache, SQLiteBackend, compress, make_backend, zstandard
+from magpie.records import dumps, loads, trim_item
+
+
+def disk_usage(path: str) -> tuple[int, int]:
+    """Get (allocated bytes, apparent bytes) of a file, or of every file under a directory."""
+    paths = [path] if os.path.isfile(path) else []
+    for root, _, files in os.walk(path):
+        paths += [os.path.join(root, name) for name in files]
+    stats = [os.stat(p) for p in paths]
+    return sum(st.st_blocks * 512 for st in stats), sum(st.st_size for st in stats)
+
+
+def compact(backend: CacheBackend) -> None:
+    """Reclaim free pages in a SQLite cache and fold its write-ahead log back in."""
+    if isinstance(backend, SQLiteBackend):
+        with contextlib.closing(sqlite3.connect(backend.path)) as conn:
+            conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def measure(cache: FSCache, keys: list[str], storage: str, batch_size: int) -> dict[str, Any]:
+    """Load and decode every entry in batches, and report size and timings."""
+    allocated, apparent = disk_usage(storage)
+    start = time.perf_counter()
+    loaded = 0
+    for offset in range(0, len(keys), batch_size):
+        found = cache.get_many(keys[offset : offset + batch_size], lifetime=float("inf"))
+        loaded += sum(1 for content in found.values() if loads(content) is not None)
+    elapsed = time.perf_counter() - start
+    assert loaded == len(keys)
+
+    return {
+        "allocated_mib": allocated / 2**20,
+        "apparent_mib": apparent / 2**20,
+        "load_seconds": elapsed,
+        "load_us_per_item": elapsed / len(keys) * 1e6,
+    }
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark compressed cache entries")
+    parser.add_argument("--items", type=int, default=50_000, help="Number of items to cache")
+    parser.add_argument("--story-density", type=float, default=0.2, help="Fraction of stories")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Entries per batched load")
+    parser.add_argument("--sample-size", type=int, default=5000, help="Items to train on")
+    parser.add_argument("--dict-size", type=int, default=16384, help="Dictionary size in bytes")
+    parser.add_argument("--output", default=None, help="Append results as a JSON line here")
+    args = parser.parse_args(argv)
+
+    if zstandard is None:
+        parser.error("the zstandard package is not installed")
+
+    corpus = Corpus(args.items, args.story_density)
+    item_ids = range(corpus.first_id, corpus.max_id + 1)
+    results: dict[str, Any] = {"items": args.items, "story_density": args.story_density}
+
+    for name in ["directory", "sqlite"]:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache_dir = os.path.join(tmp_dir, "cache")
+            backend = make_backend(name, cache_dir)
+            storage = cache_dir if name == "directory" else tmp_dir
+            cache = FSCache(backend)
+
+            entries = {
+                cache.path(f"https://hn.test/v0/item/{item_id}.json", cache_dir): dumps(
+                    trim_item(corpus.item(item_id))
+                )
+                for item_id in item_ids
+            }
+            cache.save_many(entries)
+            keys = list(entries)
+
+            compact(backend)
+            plain = measure(cache, keys, storage, args.batch_size)
+            start = time.perf_counter()
+            compress(cache, cache_dir, sample_size=args.sample_size, dict_size=args.dict_size)
+            compress_seconds = time.perf_counter() - start
+            compact(backend)
+            compressed = measure(cache, keys, storage, args.batch_size)
+
+            results[name] = {
+                "plain": plain,
+                "zstd": compressed,
+                "compress_seconds": compress_seconds,
+            }
+            for label, stats in [("plain", plain), ("zstd", compressed)]:
+                print(
+                    f"{name:<9} {label:<5} {stats['allocated_mib']:9.1f} MiB on disk "
+                    f"{stats['apparent_mib']:9.1f} MiB apparent "
+                    f"{stats['load_us_per_item']:7.1f} us/item load"
+                )
+            if isinstance(backend, SQLiteBackend):
+                backend.close()
+
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"timestamp": time.time(), **results}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark parsing of upvoted pages against the original implementation.
+
+Run from the `src` directory:
+
+    python -m benchmarks.bench_parse --pages 50
+"""
+
+import argparse
+import random
+import time
+from collections.abc import Callable
+
+import dateparser
+from bs4 import BeautifulSoup
+
+from magpie.parsing import page_parsers
+from magpie.prepare_dataset import parse_upvote
+
+units = ["minute", "hour", "day", "month", "year"]
+
+
+def synthetic_page(first_id: int, rows: int = 30, seed: int = 0) -> str:
+    """Build an upvoted page with the same markup HN serves."""
+    rng = random.Random(seed + first_id)
+    now = int(time.time())
+    body = []
+    for i in range(rows):
+        item_id = first_id - i
+        n, unit = rng.randint(1, 11), rng.choice(units)
+        words = f"{n} {unit}{'s' if n > 1 else ''} ago"
+        posted = now - rng.randint(60, 10**8)
+        iso = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(posted))
+        body.append(
+            f'<tr class="athing submission" id="{item_id}">'
+            f'<td class="title"><span class="rank">{i + 1}.</span></td>'
+            f'<td class="votelinks"><center><a id="up_{item_id}"></a></center></td>'
+            f'<td class="title"><span class="titleline">'
+            f'<a href="https://example{i}.com/post/{item_id}">Story number {item_id}</a>'
+            f'<span class="sitebit comhead"> (<a href="from?site=example{i}.com">'
+            f'<span class="sitestr">example{i}.com</span></a>)</span></span></td></tr>'
+            f'<tr><td colspan="2"></td><td class="subtext"><span class="subline">'
+            f'<span class="score" id="score_{item_id}">{rng.randint(1, 900)} points</span> by '
+            f'<a href="user?id=someone" class="hnuser">someone</a> '
+            f'<span class="age" title="{iso} {posted}"><a href="item?id={item_id}">{words}</a>'
+            f'</span> | <a href="item?id={item_id}">{rng.randint(0, 400)}&nbsp;comments</a>'
+            f"</span></td></tr><tr class='spacer' style='height:5px'></tr>"
+        )
+    return f"<html><body><table>{''.join(body)}</table></body></html>"
+
+
+def legacy_parse(page: str) -> list[dict]:
+    """The original implementation: BeautifulSoup plus dateparser for every row."""
+    tree = BeautifulSoup(page, features="html.parser")
+    meta = [(x["href"], x.contents[0].text) for x in tree.select(".subtext .age a")]
+    links = [(x.get("href"), x.contents[0].text) for x in tree.select("td.title > .titleline > a")]
+    results = []
+    for d in zip(meta, links, strict=False):
+        parsed_time = dateparser.parse(d[0][1], languages=["en"])
+        results.append(
+            {
+                "id": int(d[0][0].split("=")[1]),
+                "link": d[1][0],
+                "title": d[1][1],
+                "time": time.time() if parsed_time is None else parsed_time.timestamp(),
+            }
+        )
+    return results
+
+
+def timed(fn: Callable[[str], list], pages: list[str]) -> tuple[float, int]:
+    start = time.perf_counter()
+    rows = sum(len(fn(page)) for page in pages)
+    return time.perf_counter() - start, rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark upvoted page parsing")
+    parser.add_argument("--pages", type=int, default=50, help="Number of pages to parse")
+    args = parser.parse_args()
+
+    pages = [synthetic_page(10**7 - 30 * p) for p in range(args.pages)]
+
+    # Warm up dateparser's language data so its one-off load isn't counted per row
+    dateparser.parse("3 hours ago", languages=["en"])
+
+    candidates: dict[str, Callable[[str], list]] = {"legacy (bs4 + dateparser)": legacy_parse}
+    for name, page_parser in page_parsers.items():
+        candidates[f"{name} + fast time"] = lambda page, p=page_parser: [
+            parse_upvote(d) for d in p(page)
+        ]
+
+    baseline = None
+    print(f"{'parser':<28}{'rows':>8}{'seconds':>10}{'rows/s':>12}{'speedup':>9}")
+    for name, fn in candidates.items():
+        elapsed, rows = timed(fn, pages)
+        baseline = baseline or elapsed
+        print(
+            f"{name:<28}{rows:>8}{elapsed:>10.3f}{rows / elapsed:>12.0f}{baseline / elapsed:>8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Benchmark the whole prepare pipeline against a local HackerNews stand-in.
+
+Each run starts a fake HN server (see `benchmarks.fake_hn`) and runs
+`prepare_dataset.run()` in a fresh subprocess inside a scratch directory: once
+with a cold cache, then again with the cache it left behind. For each run it
+reports wall time, requests the server saw, item cache hit rate and the
+worker's peak RSS.
+
+Run from the `src` directory:
+
+    python -m benchmarks.bench_pipeline --size 20000 --upvotes 200 --latency 0.01
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any
+
+from benchmarks.fake_hn import Corpus, FakeHN
+
+
+def worker(requests_per_second: float, max_in_flight: int) -> None:
+    """Run the pipeline in this process and print its stats as JSON on the last line."""
+    import resource
+
+    from magpie import prepare_dataset
+    from magpie.fetch import fetcher
+    from magpie.fscache import fscache
+
+    prepare_dataset.upvote_page_delay = 0
+    fetcher.configure(requests_per_second=requests_per_second, max_in_flight=max_in_flight)
+
+    lookups = {"requested": 0, "hits": 0}
+    get_many = fscache.get_many
+
+    def counting_get_many(paths, *args, **kwargs):
+        found = get_many(paths, *args, **kwargs)
+        lookups["requested"] += len(paths)
+        lookups["hits"] += len(found)
+        return found
+
+    fscache.get_many = counting_get_many  # type: ignore[method-assign]
+
+    start = time.perf_counter()
+    datasets = prepare_dataset.run()
+    elapsed = time.perf_counter() - start
+
+    # ru_maxrss is in KiB on Linux
+    stats = {
+        "wall_seconds": elapsed,
+        "cache_lookups": lookups["requested"],
+        "cache_hits": lookups["hits"],
+        "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "rows": sum(len(split) for dataset in datasets.values() for split in dataset.values()),
+    }
+    print(json.dumps(stats))
+
+
+def run_once(fake: FakeHN, workdir: str, args: argparse.Namespace) -> dict[str, Any]:
+    """Run the pipeline once in a subprocess and combine its stats with the server's."""
+    fake.requests.clear()
+    src_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = os.environ | {
+        "HN_API_URL": fake.api_url,
+        "HN_WEB_URL": fake.web_url,
+        "HN_USER_COOKIE": "benchmark",
+        "PYTHONPATH": os.pathsep.join(filter(None, [src_dir, os.environ.get("PYTHONPATH")])),
+    }
+    command = [
+        sys.executable,
+        "-m",
+        "benchmarks.bench_pipeline",
+        "--worker",
+        "--requests-per-second",
+        str(args.requests_per_second),
+        "--max-in-flight",
+        str(args.max_in_flight),
+    ]
+    result = subprocess.run(
+        command, cwd=workdir, env=env, capture_output=True, text=True, check=False
+    )
+    if result.returncode != 0:
+        print(result.stderr, file=sys.stderr)
+        result.check_returncode()
+
+    stats = json.loads(result.stdout.strip().splitlines()[-1])
+    stats["requests"] = dict(fake.requests)
+    stats["hit_rate"] = (
+        stats["cache_hits"] / stats["cache_lookups"] if stats["cache_lookups"] else 0
+    )
+    return stats
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the prepare pipeline on a fake HN")
+    parser.add_argument("--size", type=int, default=20_000, help="Number of items in the corpus")
+    parser.add_argument("--story-density", type=float, default=0.2, help="Fraction of stories")
+    parser.add_argument("--upvotes", type=int, default=200, help="Number of upvoted stories")
+    parser.add_argument("--latency", type=float, default=0.005, help="Seconds added per request")
+    parser.add_argument("--requests-per-second", type=float, default=2000.0)
+    parser.add_argument("--max-in-flight", type=int, default=50)
+    parser.add_argument("--output", default=None, help="Append results as a JSON line here")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        worker(args.requests_per_second, args.max_in_flight)
+        return
+
+    corpus = Corpus(args.size, args.story_density, args.upvotes)
+    results: dict[str, Any] = {
+        "size": args.size,
+        "story_density": args.story_density,
+        "upvotes": len(corpus.upvoted),
+        "latency": args.latency,
+    }
+    with FakeHN(corpus, args.latency) as fake, tempfile.TemporaryDirectory() as workdir:
+        for name in ["cold", "warm"]:
+            stats = run_once(fake, workdir, args)
+            results[name] = stats
+            print(
+                f"{name:<5} {stats['wall_seconds']:8.2f}s "
+                f"{sum(stats['requests'].values()):7d} requests "
+                f"{stats['hit_rate']:6.1%} cache hits "
+                f"{stats['peak_rss_mib']:7.1f} MiB peak RSS "
+                f"{stats['rows']:6d} rows"
+            )
+
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"timestamp": time.time(), **results}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""
+Local stand-in for the HackerNews Firebase API, the Algolia search API and
+`upvoted` pages.
+
+Items come from a synthetic, deterministic corpus of configurable size and
+story density, and every response can be delayed to mimic network latency.
+Edits to corpus items show up in the `updates` change feed. The server counts
+the requests it serves so benchmarks can report them.
+
+Run standalone from the `src` directory:
+
+    python -m benchmarks.fake_hn --size 100000 --latency 0.02 --port 8341
+"""
+
+import argparse
+import json
+import operator
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import parse_qs, urlparse
+
+words = [
+    "rust", "python", "startup", "database", "compiler", "linux", "gpu", "llm", "privacy",
+    "browser", "postgres", "sqlite", "kernel", "design", "open", "source", "security", "ai",
+]  # fmt: skip
+
+
+comparisons = {
+    ">=": operator.ge,
+    "<=": operator.le,
+    ">": operator.gt,
+    "<": operator.lt,
+    "=": operator.eq,
+}
+
+
+class Corpus:
+    """Deterministic synthetic HN items with IDs `first_id` to `first_id + size - 1`."""
+
+    def __init__(
+        self,
+        size: int = 10_000,
+        story_density: float = 0.2,
+        upvotes: int = 60,
+        *,
+        first_id: int = 1_000_000,
+        start_time: float = 1_700_000_000.0,
+        seed: int = 0,
+    ):
+        self.size = size
+        self.story_density = story_density
+        self.first_id = first_id
+        self.start_time = start_time
+        self.seed = seed
+
+        rng = random.Random(seed)
+        story_ids = [i for i in range(first_id, first_id + size) if self.is_story(i)]
+        self.upvoted = sorted(rng.sample(story_ids, min(upvotes, len(story_ids))), reverse=True)
+        self.story_ids = story_ids
+
+        # Edits made after generation, and the change feed listing the edited IDs
+        self.changes: dict[int, dict[str, Any]] = {}
+        self.updates: list[int] = []
+
+    @property
+    def max_id(self) -> int:
+        return self.first_id + self.size - 1
+
+    def is_story(self, item_id: int) -> bool:
+        return random.Random(self.seed * 1_000_003 + item_id).random() < self.story_density
+
+    def item(self, item_id: int) -> dict[str, Any] | None:
+        """Get an item by ID, or None outside the corpus."""
+        if not self.first_id <= item_id <= self.max_id:
+            return None
+
+        rng = random.Random(self.seed * 1_000_003 + item_id)
+        is_story = rng.random() < self.story_density
+        # Roughly one item every 7 seconds, like the real site
+        item = {"id": item_id, "time": int(self.start_time + (item_id - self.first_id) * 7)}
+        if is_story:
+            title = " ".join(rng.choice(words) for _ in range(rng.randint(3, 9))).capitalize()
+            item |= {
+                "type": "story",
+                "by": f"user{rng.randint(1, 500)}",
+                "title": title,
+                "url": f"https://{rng.choice(words)}{rng.randint(1, 50)}.example.com/{item_id}",
+                "score": int(rng.paretovariate(1.2)),
+                "descendants": rng.randint(0, 300),
+            }
+        else:
+            item |= {
+                "type": "comment",
+                "by": f"user{rng.randint(1, 500)}",
+                "parent": max(self.first_id, item_id - rng.randint(1, 50)),
+                "text": " ".join(rng.choice(words) for _ in range(rng.randint(5, 40))),
+            }
+        return item | self.changes.get(item_id, {})
+
+    def update(self, item_id: int, **fields: Any) -> None:
+        """Edit an item (e.g. its score) and list it in the change feed."""
+        self.changes.setdefault(item_id, {}).update(fields)
+        self.updates = [item_id, *(i for i in self.updates if i != item_id)]
+
+    def search(self, numeric_filters: str, hits_per_page: int = 20) -> dict[str, Any]:
+        """
+        Answer a `search_by_date` query for stories, newest first.
+
+        Args:
+            numeric_filters: Comma-separated filters on `created_at_i` and `points`
+            hits_per_page: Maximum hits to return
+
+        Returns:
+            Search response with Algolia-style hits
+        """
+        filters = [
+            (field, comparisons[op], float(value))
+            for field, op, value in re.findall(r"(\w+)(>=|<=|>|<|=)(-?[\d.]+)", numeric_filters)
+        ]
+        hits = []
+        for item_id in reversed(self.story_ids):
+            item = self.item(item_id)
+            assert item is not None
+            hit = {
+                "objectID": str(item_id),
+                "title": item["title"],
+                "url": item["url"],
+                "author": item["by"],
+                "points": item["score"],
+                "created_at_i": item["time"],
+                "num_comments": item["descendants"],
+            }
+            if all(compare(hit[field], value) for field, compare, value in filters):
+                hits.append(hit)
+                if len(hits) >= hits_per_page:
+                    break
+        return {"hits": hits, "hitsPerPage": hits_per_page}
+
+    def upvoted_page(self, page: int, per_page: int = 30) -> str:
+        """Render one page of the user's upvotes, newest first, with HN's markup."""
+        rows = []
+        for rank, item_id in enumerate(
+            self.upvoted[(page - 1) * per_page : page * per_page], (page - 1) * per_page + 1
+        ):
+            item = self.item(item_id)
+            assert item is not None
+            posted = item["time"]
+            iso = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(posted))
+            rows.append(
+                f'<tr class="athing submission" id="{item_id}">'
+                f'<td class="title"><span class="rank">{rank}.</span></td>'
+                f'<td class="title"><span class="titleline">'
+                f'<a href="{item["url"]}">{item["title"]}</a></span></td></tr>'
+                f'<tr><td colspan="2"></td><td class="subtext"><span class="subline">'
+                f'<span class="score">{item["score"]} points</span> '
+                f'<span class="age" title="{iso} {posted}"><a href="item?id={item_id}">'
+                f"some time ago</a></span></span></td></tr>"
+            )
+        return f"<html><body><table>{''.join(rows)}</table></body></html>"
+
+
+class QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients that are killed mid-request (e.g. resume benchmarks) reset their connections
+        pass
+
+
+class FakeHN:
+    """Threaded HTTP server for a corpus, with per-request latency and request counts."""
+
+    def __init__(self, corpus: Corpus, latency: float = 0.0, port: int = 0):
+        self.corpus = corpus
+        self.latency = latency
+        self.requests: Counter[str] = Counter()
+        self._lock = threading.Lock()
+        self.server = QuietServer(("127.0.0.1", port), self._handler())
+
+    @property
+    def port(self) -> int:
+        return self.server.server_address[1]
+
+    @property
+    def api_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v0"
+
+    @property
+    def search_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/api/v1"
+
+    @property
+    def web_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def count(self, kind: str) -> None:
+        with self._lock:
+            self.requests[kind] += 1
+
+    def respond(self, path: str, query: dict[str, list[str]]) -> tuple[str, str, str]:
+        """Route a request to (kind, content type, body)."""
+        if path == "/upvoted":
+            page = int(query.get("p", ["1"])[0])
+            return "upvoted", "text/html", self.corpus.upvoted_page(page)
+        kind, payload = self.respond_json(path, query)
+        if kind == "other":
+            return kind, "text/plain", ""
+        return kind, "application/json", json.dumps(payload)
+
+    def respond_json(self, path: str, query: dict[str, list[str]]) -> tuple[str, Any]:
+        """Route an API request to (kind, JSON payload)."""
+        corpus = self.corpus
+        if path.startswith("/v0/item/") and path.endswith(".json"):
+            return "item", corpus.item(int(path.removeprefix("/v0/item/").removesuffix(".json")))
+        if path == "/v0/updates.json":
+            return "updates", {"items": corpus.updates}
+        if path == "/v0/maxitem.json":
+            return "maxitem", corpus.max_id
+        if path in ("/v0/topstories.json", "/v0/newstories.json"):
+            return "lists", corpus.story_ids[::-1][:500]
+        if path == "/api/v1/search_by_date":
+            filters = query.get("numericFilters", [""])[0]
+            hits_per_page = int(query.get("hitsPerPage", ["20"])[0])
+            return "search", corpus.search(filters, hits_per_page)
+        return "other", None
+
+    def _handler(self) -> type[BaseHTTPRequestHandler]:
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                kind, content_type, body = fake.respond(url.path, parse_qs(url.query))
+                fake.count(kind)
+                if fake.latency:
+                    time.sleep(fake.latency)
+
+                data = body.encode()
+                self.send_response(404 if kind == "other" else 200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "FakeHN":
+        threading.Thread(target=self.server.serve_forever, name="fake-hn", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "FakeHN":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Serve a synthetic HackerNews API locally")
+    parser.add_argument("--size", type=int, default=10_000, help="Number of items")
+    parser.add_argument("--story-density", type=float, default=0.2, help="Fraction of stories")
+    parser.add_argument("--upvotes", type=int, default=60, help="Number of upvoted stories")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added per request")
+    parser.add_argument("--port", type=int, default=8341, help="Port to listen on")
+    args = parser.parse_args(argv)
+
+    corpus = Corpus(args.size, args.story_density, args.upvotes)
+    fake = FakeHN(corpus, args.latency, args.port)
+    print(
+        f"Serving {args.size} items: HN_API_URL={fake.api_url} HN_WEB_URL={fake.web_url} "
+        f"HN_SEARCH_URL={fake.search_url}"
+    )
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
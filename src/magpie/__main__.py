@@ -0,0 +1,47 @@
+"""
+Command line entry point for Magpie.
+
+Each command lives in its own module and is only imported once it's chosen,
+so `python -m magpie --help` doesn't pay for torch or datasets.
+"""
+
+import argparse
+import importlib
+
+# Command name -> (module with a `main(argv)` function, help)
+commands = {
+    "prepare": ("magpie.prepare_dataset", "Scrape upvotes and prepare the dataset"),
+    "harvest": ("magpie.harvest", "Harvest stories into the local story index"),
+    "backfill": ("magpie.search", "Backfill the story index from the HN search API"),
+    "refresh": ("magpie.refresh", "Keep the item cache fresh from the change feed"),
+    "cache": ("magpie.fscache", "Migrate cache entries between backends"),
+    "train": ("magpie.train.model", "Train the upvote classifier"),
+    "infer": ("magpie.infer", "Export the model for CPU inference and benchmark it"),
+    "distill": ("magpie.distill", "Distill the classifier into a fast student model"),
+    "score": ("magpie.feed", "Keep a ranked feed of front-page stories"),
+}
+
+
+def main(argv: list[str] | None = None) -> None:
+    """
+    Run a Magpie command.
+
+    Args:
+        argv: Command line arguments (defaults to `sys.argv[1:]`)
+    """
+    parser = argparse.ArgumentParser(
+        prog="magpie",
+        description="Predict which HackerNews stories you'd upvote",
+        epilog="\n".join(f"  {name:<10}{text}" for name, (_, text) in commands.items()),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("command", choices=commands, help="Command to run")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="Arguments for the command")
+    args = parser.parse_args(argv)
+
+    module = importlib.import_module(commands[args.command][0])
+    module.main(args.args)
+
+
+if __name__ == "__main__":
+    main()
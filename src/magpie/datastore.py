@@ -0,0 +1,207 @@
+"""
+Versioned local storage for prepared datasets.
+
+Each prepared dataset is saved under `<dataset_dir>/<version>`, where the
+version is a hash of the sample data, and `<dataset_dir>/LATEST` points at
+the most recent one. Datasets built for other users live in their own
+directories under `<dataset_dir>/users`. Pushing to the hub is a separate,
+optional step.
+"""
+
+import hashlib
+import os
+import shutil
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from datasets import Dataset, DatasetDict
+
+dataset_dir = "./data/hn-upvote-data"
+
+# Bump when the way samples are split or stored changes, so old versions aren't reused
+format_version = "2"
+
+# Fraction of items held out for evaluation
+test_fraction = 0.2
+
+
+def content_hash(path: str) -> str:
+    """
+    Hash a file's content into a short dataset version.
+
+    Args:
+        path: File to hash
+
+    Returns:
+        Hex digest identifying the content
+    """
+    digest = hashlib.sha256(format_version.encode())
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def hashed_split(item_id: int, test_fraction: float = test_fraction) -> str:
+    """Assign an item to "train" or "test" by a hash of its ID, the same way every time."""
+    digest = hashlib.sha256(str(item_id).encode()).digest()
+    return "test" if int.from_bytes(digest[:8], "big") < test_fraction * 2**64 else "train"
+
+
+def split_by_id(
+    dataset: "Dataset", previous: "DatasetDict | None" = None, test_fraction: float = test_fraction
+) -> "DatasetDict":
+    """
+    Split samples into train and test sets that stay stable across dataset versions.
+
+    Items that are in a previous version keep the split they had there; new
+    items are assigned by `hashed_split`. So a sample never moves from the test
+    set into training when the dataset grows, and warm-started models are
+    evaluated on the same held-out items.
+
+    Args:
+        dataset: The samples to split
+        previous: The previous dataset version, if any
+        test_fraction: Fraction of new items to hold out for evaluation
+
+    Returns:
+        The train and test splits, each shuffled
+    """
+    from datasets import DatasetDict
+
+    assigned = {}
+    if previous is not None:
+        for name, split in previous.items():
+            assigned.update(dict.fromkeys(split["id"], name))
+
+    rows: dict[str, list[int]] = {"train": [], "test": []}
+    for row, item_id in enumerate(dataset["id"]):
+        name = assigned.get(item_id) or hashed_split(item_id, test_fraction)
+        rows[name].append(row)
+
+    return DatasetDict(
+        {name: dataset.select(indices).shuffle(seed=96) for name, indices in rows.items()}
+    )
+
+
+def version_path(version: str, root: str | None = None) -> str:
+    """Return the directory a dataset version is stored in."""
+    return os.path.join(root or dataset_dir, version)
+
+
+def user_dir(username: str, root: str | None = None) -> str:
+    """Return the dataset directory for one user's datasets, under `users/` in the root."""
+    return os.path.join(root or dataset_dir, "users", username)
+
+
+def has_version(version: str, root: str | None = None) -> bool:
+    """Check whether a dataset version has been saved."""
+    return os.path.exists(os.path.join(version_path(version, root), "dataset_dict.json"))
+
+
+def latest_version(root: str | None = None) -> str | None:
+    """
+    Get the most recently prepared dataset version.
+
+    Args:
+        root: Dataset directory (defaults to `dataset_dir`)
+
+    Returns:
+        The version, or None if nothing has been prepared yet
+    """
+    root = root or dataset_dir
+    try:
+        with open(os.path.join(root, "LATEST"), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def set_latest_version(version: str, root: str | None = None) -> None:
+    """Point `LATEST` at a dataset version."""
+    root = root or dataset_dir
+    os.makedirs(root, exist_ok=True)
+    tmp_path = os.path.join(root, "LATEST.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(root, "LATEST"))
+
+
+def save_version(dataset: "DatasetDict", version: str, root: str | None = None) -> str:
+    """
+    Save a dataset version and make it the latest.
+
+    Args:
+        dataset: The dataset splits to save
+        version: The dataset version
+        root: Dataset directory (defaults to `dataset_dir`)
+
+    Returns:
+        The directory the dataset was saved to
+    """
+    root = root or dataset_dir
+    path = version_path(version, root)
+    tmp_path = f"{path}.tmp"
+    for stale in (tmp_path, path):
+        if os.path.exists(stale):
+            shutil.rmtree(stale)
+
+    # Save next to the final location first so a crash never leaves a partial version
+    dataset.save_to_disk(tmp_path)
+    os.replace(tmp_path, path)
+    set_latest_version(version, root)
+    return path
+
+
+def load_version(version: str | None = None, root: str | None = None) -> "DatasetDict":
+    """
+    Load a dataset version, memory-mapped from disk.
+
+    Args:
+        version: The dataset version (defaults to the latest)
+        root: Dataset directory (defaults to `dataset_dir`)
+
+    Returns:
+        The dataset splits
+    """
+    root = root or dataset_dir
+    version = version or latest_version(root)
+    if version is None:
+        raise FileNotFoundError(os.path.join(root, "LATEST"))
+
+    from datasets import DatasetDict, load_from_disk
+
+    dataset = load_from_disk(version_path(version, root))
+    assert isinstance(dataset, DatasetDict)
+    return dataset
+
+
+def push_version(repo_id: str, version: str | None = None, root: str | None = None) -> bool:
+    """
+    Push a dataset version to the hub, unless it was already pushed there.
+
+    Args:
+        repo_id: Hub dataset repository to push to
+        version: The dataset version (defaults to the latest)
+        root: Dataset directory (defaults to `dataset_dir`)
+
+    Returns:
+        True if the dataset was pushed, False if it was already up to date
+    """
+    root = root or dataset_dir
+    version = version or latest_version(root)
+    if version is None:
+        raise FileNotFoundError(os.path.join(root, "LATEST"))
+
+    marker = os.path.join(root, f"{version}.pushed")
+    pushed_to = set()
+    if os.path.exists(marker):
+        with open(marker, encoding="utf-8") as f:
+            pushed_to = set(f.read().split())
+    if repo_id in pushed_to:
+        return False
+
+    load_version(version, root).push_to_hub(repo_id)
+    with open(marker, "a", encoding="utf-8") as f:
+        f.write(f"{repo_id}\n")
+    return True
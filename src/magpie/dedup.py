@@ -0,0 +1,250 @@
+"""
+Collapse reposts and near-duplicate stories before the dataset is split.
+
+The same link is often submitted several times, and the same story turns up
+under slightly different titles. Left in, the copies waste training compute,
+leak between the train and test splits, and add label noise when one copy is
+an upvote and another a neighbor.
+
+Samples are streamed through a `Deduplicator`, which keeps the first copy it
+sees and drops later ones with the same item ID, the same normalized URL, or
+a title whose MinHash signature is estimated to be at least `threshold`
+similar (Jaccard over short byte shingles). Near-duplicate titles are found
+through LSH buckets, so each sample is only compared against the few kept
+samples that share a bucket with it, in near-linear time overall. Upvotes
+come first in the stream, so when copies disagree the upvote is kept.
+"""
+
+import re
+from collections import Counter
+from collections.abc import Iterator
+from typing import Any
+from urllib.parse import parse_qsl, urlencode, urlparse
+
+import numpy as np
+
+from magpie.metrics import metrics
+
+# Query parameters that only track where a click came from
+tracking_params = re.compile(r"^(utm_\w+|ref|ref_src|fbclid|gclid|mc_cid|mc_eid)$")
+
+# Host prefixes that serve the same pages as the bare host
+host_prefixes = ("www.", "m.", "mobile.", "amp.")
+
+# Paths that serve the same page as their directory
+index_pages = re.compile(r"/(index|default)\.(html?|php|aspx?)$")
+
+# Tags HN titles carry that say nothing about the story, e.g. "[pdf]" or "(2019)"
+title_tags = re.compile(r"\[[^\]]*\]|\((?:\d{4}|pdf|video|audio)\)")
+
+
+def normalize_url(url: str | None) -> str | None:
+    """
+    Canonicalize a story URL so that reposts of the same page compare equal.
+
+    The scheme, common mobile/`www.` host prefixes, fragments, trailing slashes,
+    index pages and tracking parameters are dropped; remaining query
+    parameters are sorted.
+
+    Args:
+        url: The story link
+
+    Returns:
+        The canonical form, or None for stories without a link
+    """
+    if not url:
+        return None
+    parsed = urlparse(url.strip())
+    host = parsed.netloc.lower().rsplit("@", 1)[-1].removesuffix(":80").removesuffix(":443")
+    if not host:
+        return None
+    for prefix in host_prefixes:
+        host = host.removeprefix(prefix)
+
+    path = index_pages.sub("/", parsed.path).rstrip("/")
+    query = urlencode(
+        sorted((k, v) for k, v in parse_qsl(parsed.query) if not tracking_params.match(k))
+    )
+    return f"{host}{path}?{query}" if query else f"{host}{path}"
+
+
+def normalize_title(title: str | None) -> str:
+    """Lowercase a title and strip tags and punctuation, keeping single spaces between words."""
+    if not title:
+        return ""
+    return " ".join(re.findall(r"\w+", title_tags.sub(" ", title).lower()))
+
+
+class Deduplicator:
+    """Streaming filter that drops repeated items, reposted URLs and near-duplicate titles."""
+
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        num_perm: int = 72,
+        bands: int = 12,
+        shingle_size: int = 5,
+        *,
+        min_words: int = 3,
+        seed: int = 1,
+    ):
+        """
+        Set up an empty index.
+
+        Args:
+            threshold: Minimum estimated Jaccard similarity for titles to be duplicates
+            num_perm: Number of MinHash permutations per signature
+            bands: Number of LSH bands; `num_perm` must be a multiple of it. More
+                bands find less similar candidates, at the cost of more comparisons
+            shingle_size: Length in bytes of the shingles titles are split into
+            min_words: Titles with fewer words say too little to tell stories apart,
+                so they are only matched by ID and URL
+            seed: Seed of the MinHash permutations, fixed so results are reproducible
+        """
+        assert num_perm % bands == 0, "num_perm must be a multiple of bands"
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.min_words = min_words
+
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(0, 1 << 64, num_perm, dtype=np.uint64, endpoint=False) | np.uint64(1)
+        self.b = rng.integers(0, 1 << 64, num_perm, dtype=np.uint64, endpoint=False)
+
+        self.ids: dict[Any, int] = {}
+        self.urls: dict[str, int] = {}
+        # Signatures of kept titles, one row each, grown by doubling
+        self.signatures = np.zeros((1024, num_perm), dtype=np.uint32)
+        self.labels: list[int] = []
+        self.buckets: list[dict[bytes, list[int]]] = [{} for _ in range(bands)]
+        self.counts: Counter[str] = Counter()
+
+    def signature(self, title: str) -> np.ndarray:
+        """Compute the MinHash signature of a normalized title's byte shingles."""
+        data = np.frombuffer(title.encode(), dtype=np.uint8).astype(np.uint64)
+        k = min(self.shingle_size, len(data))
+        count = len(data) - k + 1
+
+        # Polynomial hash of every k-byte shingle at once
+        hashes = np.zeros(count, dtype=np.uint64)
+        for j in range(k):
+            hashes = hashes * np.uint64(257) + data[j : j + count]
+
+        # Multiply-shift hashing, one random odd multiplier per permutation (wrapping is intended)
+        permuted = (np.outer(hashes, self.a) + self.b) >> np.uint64(32)
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def similar_title(self, signature: np.ndarray) -> int | None:
+        """Find a kept sample whose title is near-identical, returning its index."""
+        candidates: set[int] = set()
+        for band, buckets in enumerate(self.buckets):
+            key = signature[band * self.rows : (band + 1) * self.rows].tobytes()
+            candidates.update(buckets.get(key, ()))
+        if not candidates:
+            return None
+
+        indices = np.fromiter(sorted(candidates), dtype=np.int64, count=len(candidates))
+        similarity = (self.signatures[indices] == signature).mean(axis=1)
+        best = int(similarity.argmax())
+        return int(indices[best]) if similarity[best] >= self.threshold else None
+
+    def add_title(self, signature: np.ndarray, label: int) -> None:
+        """Index a kept sample's title signature."""
+        index = len(self.labels)
+        self.labels.append(label)
+        if index == len(self.signatures):
+            self.signatures = np.concatenate([self.signatures, np.zeros_like(self.signatures)])
+        self.signatures[index] = signature
+        for band, buckets in enumerate(self.buckets):
+            key = signature[band * self.rows : (band + 1) * self.rows].tobytes()
+            buckets.setdefault(key, []).append(index)
+
+    def duplicate_of(self, sample: dict[str, Any]) -> tuple[str, int] | None:
+        """
+        Check a sample against everything kept so far, and keep it if it's new.
+
+        Args:
+            sample: Sample with `id`, `link`, `title` and `label`
+
+        Returns:
+            None if the sample was kept, otherwise what it duplicates ("id", "url"
+            or "title") and the label of the kept copy
+        """
+        label = sample.get("label", 0)
+        if sample.get("id") in self.ids:
+            return "id", self.ids[sample.get("id")]
+        url = normalize_url(sample.get("link"))
+        if url is not None and url in self.urls:
+            return "url", self.urls[url]
+
+        title = normalize_title(sample.get("title"))
+        long_enough = title.count(" ") + 1 >= self.min_words
+        signature = self.signature(title) if title and long_enough else None
+        if signature is not None:
+            index = self.similar_title(signature)
+            if index is not None:
+                return "title", self.labels[index]
+
+        # New story: index it
+        self.ids[sample.get("id")] = label
+        if url is not None:
+            self.urls[url] = label
+        if signature is not None:
+            self.add_title(signature, label)
+        return None
+
+    def filter(self, samples: Iterator[dict[str, Any]]) -> Iterator[dict[str, Any]]:
+        """
+        Yield only the first copy of each story.
+
+        Args:
+            samples: Samples as yielded by `sample_iterator`
+
+        Yields:
+            Samples that don't duplicate an earlier one
+        """
+        for sample in samples:
+            self.counts["samples"] += 1
+            duplicate = self.duplicate_of(sample)
+            if duplicate is None:
+                self.counts["kept"] += 1
+                yield sample
+                continue
+
+            reason, kept_label = duplicate
+            self.counts[f"removed_{reason}"] += 1
+            if kept_label != sample.get("label", 0):
+                self.counts["label_conflicts"] += 1
+
+    def report(self) -> dict[str, int]:
+        """
+        Print and record how much data was removed.
+
+        Returns:
+            Counts of samples seen, kept, removed by each rule, and removed
+            copies whose label disagreed with the kept copy
+        """
+        counts = {
+            key: self.counts[key]
+            for key in [
+                "samples",
+                "kept",
+                "removed_id",
+                "removed_url",
+                "removed_title",
+                "label_conflicts",
+            ]
+        }
+        for key, value in counts.items():
+            metrics.gauge(f"dedup.{key}", value)
+
+        removed = counts["samples"] - counts["kept"]
+        share = removed / counts["samples"] if counts["samples"] else 0
+        print(
+            f"Removed {removed} duplicates ({share:.1%} of {counts['samples']} samples): "
+            f"{counts['removed_id']} repeated items, {counts['removed_url']} reposted URLs, "
+            f"{counts['removed_title']} near-identical titles; "
+            f"{counts['label_conflicts']} had a different label than the copy kept"
+        )
+        return counts
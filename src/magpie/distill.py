@@ -0,0 +1,283 @@
+"""
+Distill the trained classifier into a small, fast student model.
+
+The teacher scores every story in the harvested story index (and the prepared
+dataset), and a hashed word + character n-gram linear model is trained on those
+soft labels. Teacher labels are cached per teacher version, so re-distilling
+only scores stories the teacher hasn't seen.
+"""
+
+import os
+import pickle
+from typing import Any
+
+import numpy as np
+
+from magpie.infer import benchmark, model_file, model_version, onnx_dir, story_texts
+from magpie.infer import model_dir as teacher_dir
+from magpie.prepare_dataset import cache_dir
+from magpie.train.embeddings import text_key
+
+student_path = "./trained-student/student.pkl"
+
+
+class Student:
+    """Linear model over hashed word and character n-grams, trained on soft labels."""
+
+    def __init__(
+        self, n_features: int = 2**20, alpha: float = 1e-6, epochs: int = 10, seed: int = 42
+    ):
+        from sklearn.feature_extraction.text import HashingVectorizer
+        from sklearn.linear_model import SGDClassifier
+
+        # Hashing needs no vocabulary, so the student has no fitted state besides its weights
+        self.vectorizers = [
+            HashingVectorizer(
+                analyzer="word", ngram_range=(1, 2), n_features=n_features, alternate_sign=False
+            ),
+            HashingVectorizer(
+                analyzer="char_wb", ngram_range=(3, 5), n_features=n_features, alternate_sign=False
+            ),
+        ]
+        self.model = SGDClassifier(
+            loss="log_loss", alpha=alpha, max_iter=epochs, tol=None, random_state=seed
+        )
+
+    def features(self, texts: list[str]) -> Any:
+        from scipy.sparse import hstack
+
+        return hstack([vectorizer.transform(texts) for vectorizer in self.vectorizers]).tocsr()
+
+    def fit(self, texts: list[str], probabilities: np.ndarray) -> "Student":
+        """
+        Fit the student to the teacher's probabilities.
+
+        Each text is used twice, as a positive weighted by p and a negative
+        weighted by 1 - p, which makes log loss match the soft labels.
+
+        Args:
+            texts: Training texts
+            probabilities: Teacher upvote probabilities for the texts
+
+        Returns:
+            The fitted student
+        """
+        from scipy.sparse import vstack
+
+        x = self.features(texts)
+        probabilities = np.asarray(probabilities, dtype=np.float64)
+        self.model.fit(
+            vstack([x, x]),
+            np.concatenate([np.ones(len(texts)), np.zeros(len(texts))]),
+            sample_weight=np.concatenate([probabilities, 1 - probabilities]),
+        )
+        return self
+
+    def score(self, texts: list[str]) -> np.ndarray:
+        """Get the upvote probability for each text."""
+        if not texts:
+            return np.empty(0, dtype=np.float32)
+        return self.model.predict_proba(self.features(texts))[:, 1].astype(np.float32)
+
+    def save(self, path: str = student_path) -> None:
+        """Save the student to a file."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "wb") as f:
+            pickle.dump(self, f)
+
+    @classmethod
+    def load(cls, path: str = student_path) -> "Student":
+        """Load a student saved with `save`."""
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+
+class LabelCache:
+    """
+    Teacher probabilities for one teacher version, keyed by text hash.
+
+    Labels are appended to a text file, one `key<TAB>probability` line each, so
+    labelling more texts never rewrites the ones already there.
+    """
+
+    def __init__(self, version: str, root: str | None = None):
+        self.path = os.path.join(root or os.path.join(cache_dir, "distill"), f"{version}.labels")
+        self.labels: dict[str, float] = {}
+
+        if os.path.exists(self.path):
+            with open(self.path, "rb+") as f:
+                data = f.read()
+                # Drop a line cut short by a killed run; its text is labelled again
+                complete = data[: data.rfind(b"\n") + 1]
+                if len(complete) < len(data):
+                    f.truncate(len(complete))
+            for line in complete.decode("utf-8").splitlines():
+                key, _, probability = line.partition("\t")
+                self.labels[key] = float(probability)
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def missing(self, texts: list[str]) -> list[str]:
+        """Find the unique texts that still need a label, in first-seen order."""
+        missing = {}
+        for text in texts:
+            key = text_key(text)
+            if key not in self.labels:
+                missing.setdefault(key, text)
+        return list(missing.values())
+
+    def get(self, texts: list[str]) -> np.ndarray:
+        """Look up the labels for texts; all of them must be cached."""
+        return np.array([self.labels[text_key(text)] for text in texts], dtype=np.float32)
+
+    def add(self, texts: list[str], probabilities: np.ndarray) -> None:
+        """Append labels for texts that aren't cached yet."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            for text, probability in zip(texts, probabilities.tolist(), strict=True):
+                key = text_key(text)
+                self.labels[key] = probability
+                f.write(f"{key}\t{probability!r}\n")
+
+
+def teacher_labels(
+    texts: list[str], teacher: Any, version: str, root: str | None = None
+) -> np.ndarray:
+    """
+    Get the teacher's probabilities for texts, scoring only ones it hasn't seen.
+
+    Args:
+        texts: Texts to label
+        teacher: Anything with a batched `score(texts)` method
+        version: Teacher model version; labels are cached per version
+        root: Label cache directory (defaults to `distill` in the cache dir)
+
+    Returns:
+        Probability for each text
+    """
+    cache = LabelCache(version, root)
+    missing = cache.missing(texts)
+    if missing:
+        print(f"Labelling {len(missing)} texts with the teacher ({len(cache)} cached)...")
+        for start in range(0, len(missing), 4096):
+            chunk = missing[start : start + 4096]
+            cache.add(chunk, np.asarray(teacher.score(chunk), dtype=np.float32))
+    return cache.get(texts)
+
+
+def load_corpus() -> list[str]:
+    """
+    Collect texts to distill on: the harvested story index plus the prepared dataset.
+
+    Returns:
+        Unique texts, formatted like the training samples
+    """
+    from magpie.datastore import latest_version, load_version
+    from magpie.harvest import StoryIndex
+
+    texts = story_texts([story.as_item() for story in StoryIndex.load().stories.values()])
+    if latest_version() is not None:
+        dataset = load_version()
+        texts += dataset["train"]["text"] + dataset["test"]["text"]
+    return list(dict.fromkeys(texts))
+
+
+def distill(
+    texts: list[str],
+    teacher: Any,
+    version: str,
+    *,
+    holdout: float = 0.1,
+    latency_sample: int = 512,
+    output: str = student_path,
+    seed: int = 42,
+    threshold: float = 0.5,
+) -> dict[str, float]:
+    """
+    Train a student on the teacher's labels and compare the two on held-out texts.
+
+    Args:
+        texts: Corpus to distill on
+        teacher: Anything with a batched `score(texts)` method
+        version: Teacher model version, for caching its labels
+        holdout: Fraction of texts held out for the comparison
+        latency_sample: Number of held-out texts to time both models on
+        output: Path to save the student to
+        seed: Random seed for the holdout split
+        threshold: Probability threshold for counting prediction agreement
+
+    Returns:
+        Agreement, mean absolute probability difference and stories/sec for both models
+    """
+    probabilities = teacher_labels(texts, teacher, version)
+
+    order = np.random.default_rng(seed).permutation(len(texts))
+    held_out = order[: max(1, int(len(texts) * holdout))]
+    training = order[len(held_out) :]
+
+    student = Student().fit([texts[i] for i in training], probabilities[training])
+    student.save(output)
+
+    held_out_texts = [texts[i] for i in held_out]
+    expected = probabilities[held_out]
+    predicted = student.score(held_out_texts)
+    timed = held_out_texts[:latency_sample]
+
+    return {
+        "agreement": float(np.mean((predicted >= threshold) == (expected >= threshold))),
+        "mean_abs_diff": float(np.mean(np.abs(predicted - expected))),
+        "teacher_stories_per_sec": benchmark(teacher, timed, repeats=1),
+        "student_stories_per_sec": benchmark(student, timed, repeats=1),
+    }
+
+
+def main(argv: list[str] | None = None) -> None:
+    """
+    Command line entry point for distillation.
+
+    Args:
+        argv: Command line arguments (defaults to `sys.argv[1:]`)
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Distill the classifier into a fast student")
+    parser.add_argument(
+        "--teacher",
+        choices=["onnx", "torch"],
+        default="onnx",
+        help="Score with the exported ONNX model (fp32) or the PyTorch checkpoint",
+    )
+    parser.add_argument("--model-dir", default=teacher_dir, help="Trained model directory")
+    parser.add_argument("--onnx-dir", default=onnx_dir, help="Exported model directory")
+    parser.add_argument("--output", default=student_path, help="Where to save the student")
+    parser.add_argument("--holdout", type=float, default=0.1, help="Held-out fraction")
+    args = parser.parse_args(argv)
+
+    if args.teacher == "onnx":
+        from magpie.infer import Scorer
+
+        teacher = Scorer(args.onnx_dir, quantized=False)
+        version = model_version(args.onnx_dir, model_file)
+    else:
+        from magpie.infer import TorchScorer
+
+        teacher = TorchScorer(args.model_dir)
+        version = model_version(args.model_dir, "model.safetensors")
+
+    texts = load_corpus()
+    print(f"Distilling on {len(texts)} texts...")
+    report = distill(texts, teacher, version, holdout=args.holdout, output=args.output)
+
+    print(f"Student saved to {args.output}")
+    print(f"{'':<22}{'teacher':>12}{'student':>12}")
+    print(
+        f"{'stories/sec':<22}{report['teacher_stories_per_sec']:>12.1f}"
+        f"{report['student_stories_per_sec']:>12.1f}"
+    )
+    print(f"{'agreement':<22}{report['agreement']:>24.3f}")
+    print(f"{'mean |p_s - p_t|':<22}{report['mean_abs_diff']:>24.4f}")
+
+
+if __name__ == "__main__":
+    main()
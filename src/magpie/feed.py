@@ -0,0 +1,287 @@
+"""
+Keep a ranked feed of front-page stories scored by the trained model.
+
+Each poll fetches the `topstories` and `newstories` lists, fetches and scores
+only the stories it hasn't scored with the current model yet, and writes the
+ranked feed to a JSON file (optionally also served over HTTP). Scores are
+kept per model version, so a new model rescores everything exactly once.
+"""
+
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Protocol
+
+from magpie.fetch import FetchError, fetcher
+from magpie.fscache import add_backend_argument, fscache, state_files
+from magpie.infer import model_version, onnx_dir, story_texts
+from magpie.prepare_dataset import cache_dir, get_cached_items_by_ids, hn_api_url
+
+feed_path = "./feed.json"
+story_lists = ["topstories", "newstories"]
+
+# Fields kept for each scored story
+entry_keys = ["id", "title", "url", "time", "score", "by"]
+
+
+class TextScorer(Protocol):
+    def score(self, texts: list[str]) -> Any: ...
+
+
+class ScoreCache:
+    """Scores for one model version, keyed by item ID (None for items that aren't stories)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: dict[int, dict[str, Any] | None] = {}
+
+    @classmethod
+    def load(cls, version: str, path: str | None = None) -> "ScoreCache":
+        """
+        Load the score cache for a model version, or create an empty one.
+
+        Args:
+            version: The model version
+            path: Path to the cache file (defaults to `scores/<version>.json` in the cache dir)
+
+        Returns:
+            The score cache
+        """
+        cache = cls(path or os.path.join(cache_dir, "scores", f"{version}.json"))
+        try:
+            data = state_files.load_json(cache.path)
+        except FileNotFoundError:
+            return cache
+
+        cache.entries = {int(item_id): entry for item_id, entry in data.items()}
+        return cache
+
+    def save(self) -> None:
+        """Persist the cache to disk."""
+        state_files.save(self.path, json.dumps(self.entries))
+
+    def __contains__(self, item_id: int) -> bool:
+        return item_id in self.entries
+
+    def prune(self, keep_ids: set[int], max_age: float, now: float | None = None) -> None:
+        """
+        Forget entries that left the front page lists and are older than `max_age` seconds.
+
+        Args:
+            keep_ids: IDs currently on the lists, always kept
+            max_age: Maximum story age to keep off-list entries for
+            now: Reference time (defaults to the current time)
+        """
+        cutoff = (time.time() if now is None else now) - max_age
+        self.entries = {
+            item_id: entry
+            for item_id, entry in self.entries.items()
+            if item_id in keep_ids or (entry is not None and entry.get("time", 0) > cutoff)
+        }
+
+
+def get_front_page_ids(lists: list[str] = story_lists, limit: int = 200) -> list[int]:
+    """
+    Get the IDs on the given story lists, deduplicated in list order.
+
+    Args:
+        lists: API story list names, e.g. "topstories"
+        limit: Maximum IDs to take from each list
+
+    Returns:
+        Item IDs
+    """
+    id_lists = fetcher.fetch_json([f"{hn_api_url}/{name}.json" for name in lists], strict=True)
+    return list(dict.fromkeys(item_id for ids in id_lists for item_id in (ids or [])[:limit]))
+
+
+def poll(
+    scorer: TextScorer,
+    scores: ScoreCache,
+    lists: list[str] = story_lists,
+    limit: int = 200,
+    max_age: float = 7 * 86400,
+) -> list[dict[str, Any]]:
+    """
+    Run one poll cycle: fetch and score new stories, then rank everything on the lists.
+
+    Args:
+        scorer: Anything with a batched `score(texts)` method
+        scores: Score cache for the scorer's model version
+        lists: API story list names to poll
+        limit: Maximum IDs to take from each list
+        max_age: How long to remember scores for stories that left the lists, in seconds
+
+    Returns:
+        Scored stories on the lists, most likely upvote first
+    """
+    ids = get_front_page_ids(lists, limit)
+    new_ids = [item_id for item_id in ids if item_id not in scores]
+
+    if new_ids:
+        failed: set[int] = set()
+        items = get_cached_items_by_ids(new_ids, failed=failed)
+        stories = [
+            item
+            for item in items
+            if item and item.get("type") == "story" and item.get("title") and not item.get("dead")
+        ]
+        probabilities = scorer.score(story_texts(stories)) if stories else []
+
+        # Items that aren't stories are remembered as None; ones that failed to fetch are
+        # left out, so the next poll tries them again
+        scores.entries.update(dict.fromkeys(i for i in new_ids if i not in failed))
+        for story, probability in zip(stories, probabilities, strict=True):
+            entry = {k: story[k] for k in entry_keys if k in story}
+            scores.entries[story["id"]] = {**entry, "probability": float(probability)}
+        print(f"Scored {len(stories)} new stories ({len(new_ids)} new items)")
+
+    scores.prune(set(ids), max_age)
+    ranked = [scores.entries[item_id] for item_id in ids if scores.entries.get(item_id)]
+    return sorted(ranked, key=lambda entry: entry["probability"], reverse=True)
+
+
+def write_feed(ranked: list[dict[str, Any]], path: str = feed_path, version: str = "") -> None:
+    """Write the ranked feed as JSON, atomically replacing the previous one."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"updated": time.time(), "model_version": version, "stories": ranked}, f)
+    os.replace(tmp_path, path)
+
+
+def serve_feed(path: str = feed_path, port: int = 8340) -> ThreadingHTTPServer:
+    """
+    Serve the feed file over HTTP from a background thread.
+
+    Args:
+        path: Feed file to serve
+        port: Port to listen on (localhost only)
+
+    Returns:
+        The running server; call `shutdown()` to stop it
+    """
+
+    class FeedHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            try:
+                with open(path, "rb") as f:
+                    body = f.read()
+            except FileNotFoundError:
+                self.send_error(503, "Feed not ready yet")
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), FeedHandler)
+    threading.Thread(target=server.serve_forever, name="magpie-feed", daemon=True).start()
+    return server
+
+
+def run(
+    interval: float = 300,
+    *,
+    path: str = feed_path,
+    limit: int = 200,
+    port: int | None = None,
+    once: bool = False,
+    directory: str = onnx_dir,
+    batch_size: int = 32,
+    threads: int | None = None,
+    max_age_days: float = 7,
+    student: str | None = None,
+) -> None:
+    """
+    Poll the front page and keep the ranked feed up to date.
+
+    Args:
+        interval: Seconds between polls
+        path: Feed file to write
+        limit: Maximum IDs to take from each story list
+        port: Also serve the feed over HTTP on this port
+        once: Run a single poll and exit
+        directory: Directory of the exported model
+        batch_size: Texts per inference batch
+        threads: onnxruntime intra-op threads
+        max_age_days: How long to remember scores for stories that left the lists
+        student: Score with this distilled student model file instead of the ONNX model
+    """
+    scorer: TextScorer
+    if student is not None:
+        from magpie.distill import Student
+
+        scorer = Student.load(student)
+        version = model_version(os.path.dirname(student), os.path.basename(student))
+    else:
+        from magpie.infer import Scorer
+
+        scorer = Scorer(directory, batch_size=batch_size, threads=threads)
+        version = model_version(directory)
+    scores = ScoreCache.load(version)
+    if port is not None:
+        serve_feed(path, port)
+        print(f"Serving feed on http://127.0.0.1:{port}/")
+
+    while True:
+        try:
+            ranked = poll(scorer, scores, limit=limit, max_age=max_age_days * 86400)
+        except FetchError as e:
+            # Keep the previous feed and try again on the next poll
+            print(f"Poll failed: {e}")
+        else:
+            scores.save()
+            write_feed(ranked, path, version)
+
+        if once:
+            return
+        time.sleep(interval)
+
+
+def main(argv: list[str] | None = None) -> None:
+    """
+    Command line entry point for the scoring daemon.
+
+    Args:
+        argv: Command line arguments (defaults to `sys.argv[1:]`)
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Keep a ranked feed of front-page stories")
+    parser.add_argument("--interval", type=float, default=300, help="Seconds between polls")
+    parser.add_argument("--feed", default=feed_path, help="Feed JSON file to write")
+    parser.add_argument("--limit", type=int, default=200, help="IDs to take from each list")
+    parser.add_argument("--port", type=int, default=None, help="Also serve the feed over HTTP")
+    parser.add_argument("--once", action="store_true", help="Poll once and exit")
+    parser.add_argument("--onnx-dir", default=onnx_dir, help="Exported model directory")
+    parser.add_argument("--batch-size", type=int, default=32, help="Texts per inference batch")
+    parser.add_argument("--threads", type=int, default=None, help="onnxruntime intra-op threads")
+    parser.add_argument(
+        "--student", default=None, help="Score with a distilled student model file instead"
+    )
+    add_backend_argument(parser)
+    args = parser.parse_args(argv)
+    fscache.configure(args.cache_backend, cache_dir)
+
+    run(
+        interval=args.interval,
+        path=args.feed,
+        limit=args.limit,
+        port=args.port,
+        once=args.once,
+        directory=args.onnx_dir,
+        batch_size=args.batch_size,
+        threads=args.threads,
+        student=args.student,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+Asyncio HTTP fetch engine shared by the dataset pipeline.
+
+All requests go through one keep-alive connection pool that lives on a
+background event loop, so synchronous callers from any thread share the same
+connections, the same in-flight limit and the same token bucket.
+"""
+
+import asyncio
+import atexit
+import random
+import threading
+import time
+from collections.abc import Iterable
+from typing import Any
+
+import aiohttp
+
+from magpie.metrics import metrics
+from magpie.records import loads
+
+# Statuses worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class FetchError(Exception):
+    """Raised when a URL could not be fetched after all retries."""
+
+    def __init__(self, url: str, reason: str):
+        super().__init__(f"{reason} for {url}")
+        self.url = url
+
+
+class TokenBucket:
+    """Token bucket rate limiter measured in requests per second."""
+
+    def __init__(self, rate: float = 10.0, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Take one token from the bucket.
+
+        Tokens may go negative, which queues callers fairly: each one is told
+        how long to wait before its reserved token becomes available.
+
+        Returns:
+            Seconds the caller must wait before sending its request
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    async def acquire(self) -> None:
+        """Wait until a token is available."""
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class Fetcher:
+    """Rate-limited JSON fetcher backed by a shared aiohttp connection pool."""
+
+    def __init__(
+        self,
+        requests_per_second: float = 10.0,
+        max_in_flight: int = 20,
+        max_retries: int = 5,
+        backoff: float = 0.5,
+        timeout: float = 30.0,
+    ):
+        self.bucket = TokenBucket(requests_per_second)
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._session: aiohttp.ClientSession | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+        self._lock = threading.Lock()
+
+    def configure(
+        self, requests_per_second: float | None = None, max_in_flight: int | None = None
+    ) -> None:
+        """
+        Change the rate limit or in-flight limit.
+
+        Args:
+            requests_per_second: New token bucket rate
+            max_in_flight: New maximum number of concurrent requests
+        """
+        if requests_per_second is not None:
+            self.bucket = TokenBucket(requests_per_second)
+        if max_in_flight is not None and max_in_flight != self.max_in_flight:
+            self.max_in_flight = max_in_flight
+            # Recreate the pool with the new connection limit on next use
+            self.close()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="magpie-fetch", daemon=True)
+                thread.start()
+                self._loop = loop
+            return self._loop
+
+    async def _ensure_session(self) -> tuple[aiohttp.ClientSession, asyncio.Semaphore]:
+        if self._session is None or self._semaphore is None:
+            connector = aiohttp.TCPConnector(limit=self.max_in_flight, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        return self._session, self._semaphore
+
+    def _retry_delay(self, attempt: int, retry_after: str | None) -> float:
+        if retry_after is not None:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        # Exponential backoff with jitter so retries don't arrive in lockstep
+        return self.backoff * (2**attempt) * (0.5 + random.random())
+
+    async def get_json(self, url: str) -> Any:
+        """
+        Fetch a URL and decode its JSON body, retrying on 429/5xx and connection errors.
+
+        Args:
+            url: The URL to fetch
+
+        Returns:
+            The decoded JSON body
+
+        Raises:
+            FetchError: If the URL returns another error status or an invalid body,
+                or still fails after all retries
+        """
+        session, semaphore = await self._ensure_session()
+        last_error: Exception | None = None
+
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            with metrics.timer("http.rate_limit_wait"):
+                await self.bucket.acquire()
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    async with session.get(url) as resp:
+                        metrics.count(f"http.status.{resp.status}")
+                        if resp.status not in RETRY_STATUSES:
+                            if not resp.ok:
+                                raise FetchError(url, f"HTTP {resp.status}")
+                            body = await resp.json(content_type=None, loads=loads)
+                            metrics.observe("http.request_seconds", time.perf_counter() - start)
+                            return body
+                        retry_after = resp.headers.get("Retry-After")
+                        last_error = FetchError(url, f"HTTP {resp.status}")
+                except (
+                    aiohttp.ClientConnectionError,
+                    aiohttp.ClientPayloadError,
+                    asyncio.TimeoutError,
+                ) as e:
+                    metrics.count("http.connection_errors")
+                    last_error = e
+                except ValueError as e:
+                    raise FetchError(url, "Invalid JSON") from e
+                except aiohttp.ClientError as e:
+                    raise FetchError(url, type(e).__name__) from e
+                metrics.observe("http.request_seconds", time.perf_counter() - start)
+
+            if attempt < self.max_retries:
+                metrics.count("http.retries")
+                await asyncio.sleep(self._retry_delay(attempt, retry_after))
+
+        raise FetchError(url, f"Gave up after {self.max_retries + 1} attempts") from last_error
+
+    async def _gather(self, urls: list[str]) -> list[Any]:
+        return await asyncio.gather(*(self.get_json(url) for url in urls), return_exceptions=True)
+
+    def fetch_json(
+        self, urls: Iterable[str], *, strict: bool = False, failed: set[str] | None = None
+    ) -> list[Any]:
+        """
+        Fetch many URLs concurrently and return their decoded JSON bodies.
+
+        Safe to call from any thread; all callers share the connection pool,
+        the in-flight limit and the rate limit. A URL that can't be fetched
+        doesn't abort the rest of the batch: it comes back as None and is
+        counted in `http.failures`.
+
+        Args:
+            urls: URLs to fetch
+            strict: Raise the first failure once the whole batch is done, instead
+                of returning None for it
+            failed: If given, the URLs that couldn't be fetched are added to it, to
+                tell them apart from URLs whose body is `null`
+
+        Returns:
+            Decoded JSON bodies in the same order as `urls`
+
+        Raises:
+            FetchError: With `strict`, if any URL couldn't be fetched
+        """
+        urls = list(urls)
+        if not urls:
+            return []
+
+        loop = self._ensure_loop()
+        results = asyncio.run_coroutine_threadsafe(self._gather(urls), loop).result()
+
+        errors: list[FetchError] = []
+        for result in results:
+            if isinstance(result, FetchError):
+                errors.append(result)
+            elif isinstance(result, BaseException):
+                # Anything else is a bug, not a bad response
+                raise result
+        if errors:
+            metrics.count("http.failures", len(errors))
+            if strict:
+                raise errors[0]
+            if failed is not None:
+                failed.update(error.url for error in errors)
+        return [None if isinstance(result, FetchError) else result for result in results]
+
+    def close(self) -> None:
+        """Close the connection pool. It is reopened on the next fetch."""
+        with self._lock:
+            loop, session = self._loop, self._session
+            self._session = None
+            self._semaphore = None
+        if loop is not None and session is not None and not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(session.close(), loop).result()
+
+
+# Create a singleton instance
+fetcher = Fetcher()
+atexit.register(fetcher.close)
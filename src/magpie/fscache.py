@@ -1,11 +1,428 @@
+import contextlib
+import math
 import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
 import time
+from collections.abc import Callable, Iterator
+from typing import Any
 from urllib.parse import urlparse
 
+from magpie.metrics import metrics, write_atomic
+from magpie.records import loads
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - compression is optional
+    zstandard = None
+
+# Every zstd frame starts with these bytes; plain JSON entries never do
+zstd_magic = b"\x28\xb5\x2f\xfd"
+
+
+class DirectoryBackend:
+    """Stores each cache entry as its own file, using the cache path as the file path."""
+
+    def stat(self, key: str) -> float | None:
+        """Return the entry's timestamp, or None if it doesn't exist."""
+        try:
+            return os.path.getmtime(key)
+        except FileNotFoundError:
+            return None
+
+    def read(self, key: str) -> tuple[bytes, float] | None:
+        """Return the entry's content and timestamp, or None if it doesn't exist."""
+        try:
+            # One stat per entry, instead of exists + getmtime
+            timestamp = os.stat(key).st_mtime
+            with open(key, "rb") as f:
+                return f.read(), timestamp
+        except FileNotFoundError:
+            return None
+
+    def read_many(self, keys: list[str]) -> dict[str, tuple[bytes, float]]:
+        """Return content and timestamp for each of `keys` that exists."""
+        entries = {}
+        for key in keys:
+            entry = self.read(key)
+            if entry is not None:
+                entries[key] = entry
+        return entries
+
+    def write(self, key: str, content: bytes, timestamp: float | None = None) -> None:
+        """Write an entry, optionally with an explicit timestamp."""
+        # Create directory structure if it doesn't exist
+        directory = os.path.dirname(key) or "."
+        os.makedirs(directory, exist_ok=True)
+
+        # Write to a unique temporary file and rename it into place, so a killed run or a
+        # concurrent writer can never leave a truncated entry behind
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            if timestamp is not None:
+                os.utime(tmp_path, (timestamp, timestamp))
+            os.replace(tmp_path, key)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp_path)
+            raise
+
+    def write_many(
+        self, entries: dict[str, bytes], timestamps: dict[str, float] | None = None
+    ) -> None:
+        """Write many entries, optionally with explicit per-entry timestamps."""
+        timestamps = timestamps or {}
+        for key, content in entries.items():
+            self.write(key, content, timestamps.get(key))
+
+    def delete(self, key: str) -> None:
+        """Delete an entry if it exists."""
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(key)
+
+    def keys(self, prefix: str) -> Iterator[str]:
+        """Iterate over the keys of all entries under the `prefix` directory."""
+        for root, _, files in os.walk(prefix):
+            for name in files:
+                # Skip temporary files of writes in progress (or of killed runs)
+                if not (name.startswith(".") and name.endswith(".tmp")):
+                    yield os.path.join(root, name)
+
+    def clear(self, prefix: str) -> None:
+        """Delete every entry under the `prefix` directory."""
+        if os.path.exists(prefix):
+            shutil.rmtree(prefix)
+
+
+class SQLiteBackend:
+    """Stores all cache entries in one SQLite file, with timestamps stored inline."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries "
+            "(key TEXT PRIMARY KEY, content BLOB NOT NULL, updated REAL NOT NULL)"
+        )
+
+    @staticmethod
+    def _key(key: str) -> str:
+        # "./cache/x" and "cache/x" are the same file, so make them the same key
+        return os.path.normpath(key)
+
+    def _prefix_bounds(self, prefix: str) -> tuple[str, str]:
+        # Keys under a directory sort between "<dir>/" and "<dir>/\uffff"
+        start = os.path.join(self._key(prefix), "")
+        return start, start + "\uffff"
+
+    def stat(self, key: str) -> float | None:
+        """Return the entry's timestamp, or None if it doesn't exist."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT updated FROM entries WHERE key = ?", (self._key(key),)
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def read(self, key: str) -> tuple[bytes, float] | None:
+        """Return the entry's content and timestamp, or None if it doesn't exist."""
+        return self.read_many([key]).get(key)
+
+    def read_many(self, keys: list[str]) -> dict[str, tuple[bytes, float]]:
+        """Return content and timestamp for each of `keys` that exists."""
+        by_key = {self._key(key): key for key in keys}
+        normalized = list(by_key)
+        entries = {}
+
+        with self._lock:
+            # Stay well below SQLite's limit on bound parameters
+            for offset in range(0, len(normalized), 500):
+                batch = normalized[offset : offset + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, content, updated FROM entries WHERE key IN ({placeholders})",
+                    batch,
+                )
+                for key, content, updated in rows:
+                    entries[by_key[key]] = (bytes(content), updated)
+
+        return entries
+
+    def write(self, key: str, content: bytes, timestamp: float | None = None) -> None:
+        """Write an entry, optionally with an explicit timestamp."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, content, updated) VALUES (?, ?, ?)",
+                (self._key(key), content, time.time() if timestamp is None else timestamp),
+            )
+
+    def write_many(
+        self, entries: dict[str, bytes], timestamps: dict[str, float] | None = None
+    ) -> None:
+        """Write many entries in a single transaction, optionally with explicit timestamps."""
+        now = time.time()
+        timestamps = timestamps or {}
+        rows = [
+            (self._key(key), content, timestamps.get(key, now)) for key, content in entries.items()
+        ]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO entries (key, content, updated) VALUES (?, ?, ?)", rows
+                )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def delete(self, key: str) -> None:
+        """Delete an entry if it exists."""
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (self._key(key),))
+
+    def keys(self, prefix: str) -> Iterator[str]:
+        """Iterate over the keys of all entries under `prefix`."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key FROM entries WHERE key >= ? AND key < ?", self._prefix_bounds(prefix)
+            ).fetchall()
+        for (key,) in rows:
+            yield key
+
+    def clear(self, prefix: str) -> None:
+        """Delete every entry under `prefix`."""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM entries WHERE key >= ? AND key < ?", self._prefix_bounds(prefix)
+            )
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+
+CacheBackend = DirectoryBackend | SQLiteBackend
+
+
+def make_backend(name: str, cache_dir: str) -> CacheBackend:
+    """
+    Create a cache backend by name.
+
+    Args:
+        name: Either "directory" or "sqlite"
+        cache_dir: The cache directory; the SQLite file is created next to it
+
+    Returns:
+        The cache backend
+    """
+    if name == "directory":
+        return DirectoryBackend()
+    if name == "sqlite":
+        return SQLiteBackend(os.path.normpath(cache_dir) + ".sqlite3")
+    raise ValueError(name)
+
+
+# Computes an entry's lifetime in seconds from its content and the time it was saved
+TTLPolicy = Callable[[str, float], float]
+
+
+class ItemAgeTTL:
+    """
+    TTL policy for HackerNews API items based on how old the item was when cached.
+
+    Items that were already older than `immutable_after_days` when saved have a
+    final score and never expire. Younger items expire after a fraction of their
+    age at save time, clamped between `fresh_lifetime` and `max_lifetime`.
+
+    While the change feed is followed (see `magpie.refresh`), changed items are
+    refreshed as they change, so entries saved at or after `synced_since` never
+    expire either.
+    """
+
+    def __init__(
+        self,
+        immutable_after_days: float = 14,
+        fresh_lifetime: float = 900,
+        max_lifetime: float = 86400,
+        age_fraction: float = 0.1,
+        synced_since: float = math.inf,
+    ):
+        self.synced_since = synced_since
+        self.immutable_after = immutable_after_days * 86400
+        self.fresh_lifetime = fresh_lifetime
+        self.max_lifetime = max_lifetime
+        self.age_fraction = age_fraction
+
+    def __call__(self, content: str, saved_at: float) -> float:
+        if saved_at >= self.synced_since:
+            return math.inf
+        try:
+            item = loads(content)
+        except ValueError:
+            return 0
+        if not isinstance(item, dict) or "time" not in item:
+            return self.max_lifetime
+
+        age = saved_at - item["time"]
+        if age >= self.immutable_after:
+            return math.inf
+        return min(max(age * self.age_fraction, self.fresh_lifetime), self.max_lifetime)
+
+
+class ZstdCodec:
+    """
+    Compresses cache entries with zstd and a dictionary trained on cached items.
+
+    Cached items are tiny and alike (same keys, similar URLs), so compressing
+    each one on its own gains little; a shared dictionary holds what they have
+    in common. Dictionaries from earlier trainings can be passed as `previous`,
+    so entries compressed before a retrain stay readable.
+    """
+
+    def __init__(self, dictionary: bytes, level: int = 3, *, previous: list[bytes] | None = None):
+        self.level = level
+        self.dictionary = zstandard.ZstdCompressionDict(dictionary)
+        self.dictionaries = {
+            d.dict_id(): d for d in map(zstandard.ZstdCompressionDict, previous or [])
+        }
+        self.dictionaries[self.dict_id] = self.dictionary
+        # zstandard (de)compressors aren't thread-safe, so each thread gets its own
+        self._local = threading.local()
+
+    @property
+    def dict_id(self) -> int:
+        return self.dictionary.dict_id()
+
+    @classmethod
+    def train(cls, samples: list[bytes], dict_size: int = 16384, level: int = 3) -> "ZstdCodec":
+        """
+        Train a dictionary on sample entries.
+
+        Args:
+            samples: Uncompressed entries, ideally a few thousand
+            dict_size: Maximum dictionary size in bytes
+            level: Compression level
+
+        Returns:
+            A codec that compresses with the new dictionary
+        """
+        return cls(zstandard.train_dictionary(dict_size, samples).as_bytes(), level)
+
+    def compress(self, data: bytes) -> bytes:
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            compressor = zstandard.ZstdCompressor(level=self.level, dict_data=self.dictionary)
+            self._local.compressor = compressor
+        return compressor.compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        """
+        Decompress an entry with the dictionary it was compressed with.
+
+        Raises:
+            ValueError: If the entry is corrupt or its dictionary is unknown
+        """
+        try:
+            dict_id = zstandard.get_frame_parameters(data).dict_id
+            decompressors = self._local.__dict__.setdefault("decompressors", {})
+            if dict_id not in decompressors:
+                dictionary = self.dictionaries.get(dict_id)
+                if dict_id and dictionary is None:
+                    raise ValueError(dict_id)
+                decompressors[dict_id] = zstandard.ZstdDecompressor(dict_data=dictionary)
+            return decompressors[dict_id].decompress(data)
+        except zstandard.ZstdError as e:
+            raise ValueError(e) from e
+
+
+def dictionary_dir(cache_dir: str) -> str:
+    """Return where the compression dictionaries of a cache directory are kept."""
+    return os.path.normpath(cache_dir) + ".zstd"
+
+
+def load_codec(cache_dir: str, level: int = 3) -> ZstdCodec | None:
+    """
+    Load the compression dictionaries trained for a cache directory.
+
+    Args:
+        cache_dir: The cache directory
+        level: Compression level
+
+    Returns:
+        A codec compressing with the latest dictionary, or None if none was trained
+    """
+    directory = dictionary_dir(cache_dir)
+    try:
+        with open(os.path.join(directory, "LATEST"), encoding="utf-8") as f:
+            latest = f.read().strip()
+    except FileNotFoundError:
+        return None
+    if zstandard is None:
+        print("The cache is compressed, but zstandard isn't installed")
+        return None
+
+    dictionaries = {}
+    for name in os.listdir(directory):
+        if name.endswith(".dict"):
+            with open(os.path.join(directory, name), "rb") as f:
+                dictionaries[name.removesuffix(".dict")] = f.read()
+    current = dictionaries.pop(latest)
+    return ZstdCodec(current, level, previous=list(dictionaries.values()))
+
+
+def save_codec(codec: ZstdCodec, cache_dir: str) -> None:
+    """Save a codec's dictionary for a cache directory and make it the one to compress with."""
+    directory = dictionary_dir(cache_dir)
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, f"{codec.dict_id}.dict"), "wb") as f:
+        f.write(codec.dictionary.as_bytes())
+    write_atomic(os.path.join(directory, "LATEST"), str(codec.dict_id))
+
 
 class FSCache:
-    def __init__(self):
-        pass
+    def __init__(self, backend: CacheBackend | None = None, codec: ZstdCodec | None = None):
+        self.backend: CacheBackend = backend or DirectoryBackend()
+        self.codec = codec
+
+    def configure(self, backend: str, cache_dir: str) -> None:
+        """
+        Switch to a backend by name and pick up the cache's zstd dictionary, if it has one.
+
+        Args:
+            backend: Either "directory" or "sqlite"
+            cache_dir: The cache directory
+        """
+        self.backend = make_backend(backend, cache_dir)
+        self.codec = load_codec(cache_dir)
+
+    def encode(self, content: str) -> bytes:
+        """Encode content for storage, compressing it if the cache has a codec."""
+        data = content.encode("utf-8")
+        return data if self.codec is None else self.codec.compress(data)
+
+    def decode(self, raw: bytes) -> str:
+        """
+        Decode a stored entry, decompressing it if it was compressed.
+
+        Raises:
+            ValueError: If the entry can't be decoded
+        """
+        if raw.startswith(zstd_magic):
+            if self.codec is None:
+                raise ValueError(raw[:4])
+            raw = self.codec.decompress(raw)
+        return raw.decode("utf-8")
 
     def path(self, url: str, cache_dir: str = ".fscache") -> str:
         """
@@ -41,25 +458,44 @@ class FSCache:
         # Ensure the path is clean and has proper extension
         return os.path.join(*components)
 
-    def valid(self, cache_path: str, lifetime: int = 3600) -> bool:
+    def valid(
+        self, cache_path: str, lifetime: float = 3600, policy: TTLPolicy | None = None
+    ) -> bool:
         """
         Check if a cached file exists and is still valid based on lifetime.
 
         Args:
             cache_path: Path to the cached file
             lifetime: Cache lifetime in seconds
+            policy: Optional TTL policy that computes the lifetime from the cached content
 
         Returns:
             True if cache is valid, False otherwise
         """
-        if not os.path.exists(cache_path):
-            return False
+        if policy is not None:
+            entry = self.backend.read(cache_path)
+            if entry is None:
+                metrics.count("cache.misses")
+                return False
+            raw, modified_time = entry
+            try:
+                content = self.decode(raw)
+            except ValueError:
+                metrics.count("cache.corrupt")
+                return False
+            lifetime = policy(content, modified_time)
+        else:
+            modified_time = self.backend.stat(cache_path)
+            if modified_time is None:
+                metrics.count("cache.misses")
+                return False
 
         # Check if cache is expired
-        modified_time = os.path.getmtime(cache_path)
         current_time = time.time()
 
-        return (current_time - modified_time) < lifetime
+        is_valid = (current_time - modified_time) < lifetime
+        metrics.count("cache.hits" if is_valid else "cache.misses")
+        return is_valid
 
     def load(self, cache_path: str) -> str:
         """
@@ -71,8 +507,34 @@ class FSCache:
         Returns:
             The cached content as a string
         """
-        with open(cache_path, encoding="utf-8") as f:
-            return f.read()
+        entry = self.backend.read(cache_path)
+        if entry is None:
+            raise FileNotFoundError(cache_path)
+        return self.decode(entry[0])
+
+    def load_json(self, cache_path: str) -> Any:
+        """
+        Load and decode a cached JSON file.
+
+        Entries that don't decode (e.g. truncated by a crash before writes were
+        atomic) are deleted and reported as missing, so callers fetch them again.
+
+        Args:
+            cache_path: Path to the cached file
+
+        Returns:
+            The decoded content
+
+        Raises:
+            FileNotFoundError: If the entry is missing or was corrupt
+        """
+        try:
+            return loads(self.load(cache_path))
+        except ValueError:
+            print(f"Discarding corrupt cache entry {cache_path}")
+            metrics.count("cache.corrupt")
+            self.backend.delete(cache_path)
+            raise FileNotFoundError(cache_path) from None
 
     def save(self, cache_path: str, content: str) -> None:
         """
@@ -82,12 +544,257 @@ class FSCache:
             cache_path: Path to the cached file
             content: Content to save
         """
-        # Create directory structure if it doesn't exist
-        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        self.backend.write(cache_path, self.encode(content))
+
+    def get_many(
+        self, paths: list[str], lifetime: float = 3600, policy: TTLPolicy | None = None
+    ) -> dict[str, str]:
+        """
+        Load all cached files that are still valid, in one batch.
+
+        Like `save_many`, this is keyed by cache path (see `path`), not by URL.
+
+        Args:
+            paths: Paths to the cached files
+            lifetime: Cache lifetime in seconds
+            policy: Optional TTL policy that computes each lifetime from the cached content
+
+        Returns:
+            Mapping of cache path to content, for valid entries only
+        """
+        current_time = time.time()
+        valid = {}
+
+        for cache_path, (raw, modified_time) in self.backend.read_many(paths).items():
+            try:
+                content = self.decode(raw)
+            except ValueError:
+                # Treated as a miss, so it's fetched and overwritten
+                metrics.count("cache.corrupt")
+                continue
+            entry_lifetime = lifetime if policy is None else policy(content, modified_time)
+            if (current_time - modified_time) < entry_lifetime:
+                valid[cache_path] = content
+
+        metrics.count("cache.hits", len(valid))
+        metrics.count("cache.misses", len(paths) - len(valid))
+        return valid
+
+    def save_many(self, entries: dict[str, str]) -> None:
+        """
+        Save many cache files in one batch.
+
+        Args:
+            entries: Mapping of cache path (see `path`) to content
+        """
+        self.backend.write_many(
+            {cache_path: self.encode(content) for cache_path, content in entries.items()}
+        )
+
+    def clear(self, cache_dir: str) -> None:
+        """
+        Delete every cached file under a cache directory.
+
+        This includes the plain files kept there whatever the backend (the state
+        files of `state_files`, embedding and label caches, compression
+        dictionaries), so a cleared cache starts from scratch with any backend.
 
-        with open(cache_path, "w", encoding="utf-8") as f:
-            f.write(content)
+        Args:
+            cache_dir: The cache directory to clear
+        """
+        self.backend.clear(cache_dir)
+        if not isinstance(self.backend, DirectoryBackend):
+            DirectoryBackend().clear(cache_dir)
+        # The compression dictionaries were deleted along with everything else
+        self.codec = None
+
+
+def item_keys(backend: CacheBackend, cache_dir: str) -> list[str]:
+    """
+    List the cached API items under a cache directory.
+
+    Other files kept under the cache directory (embedding caches, tokenized
+    datasets, journals, label caches) aren't cache entries, so they are never
+    migrated or compressed.
+
+    Args:
+        backend: Backend to list
+        cache_dir: The cache directory
+
+    Returns:
+        Keys of the item entries
+    """
+    return [key for key in backend.keys(cache_dir) if f"{os.sep}item{os.sep}" in key]
+
+
+def migrate(
+    source: CacheBackend,
+    target: CacheBackend,
+    cache_dir: str,
+    batch_size: int = 1000,
+    *,
+    transform: Callable[[bytes], bytes] | None = None,
+) -> int:
+    """
+    Copy every cached item under `cache_dir` from one backend to another (see
+    `item_keys`). Entry timestamps are preserved.
+
+    Args:
+        source: Backend to read from
+        target: Backend to write to (may be the source, to rewrite entries in place)
+        cache_dir: The cache directory to migrate
+        batch_size: Number of entries copied per batch
+        transform: Applied to each entry's stored bytes on the way, e.g. to compress it
+
+    Returns:
+        Number of entries copied
+    """
+    copied = 0
+    batch: list[str] = []
+
+    def flush() -> None:
+        entries = source.read_many(batch)
+        target.write_many(
+            {
+                key: content if transform is None else transform(content)
+                for key, (content, _) in entries.items()
+            },
+            {key: timestamp for key, (_, timestamp) in entries.items()},
+        )
+        batch.clear()
+
+    # Keys are listed up front, so rewriting entries in place doesn't disturb the listing
+    for key in item_keys(source, cache_dir):
+        batch.append(key)
+        copied += 1
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+
+    return copied
+
+
+def sample_entries(cache: "FSCache", cache_dir: str, sample_size: int = 5000) -> list[bytes]:
+    """
+    Pick a random sample of cached API items, uncompressed, to train a dictionary on.
+
+    Args:
+        cache: Cache to sample from
+        cache_dir: The cache directory
+        sample_size: Maximum number of entries
+
+    Returns:
+        Entry contents
+    """
+    keys = item_keys(cache.backend, cache_dir)
+    keys = random.Random(0).sample(keys, min(sample_size, len(keys)))
+
+    samples = []
+    for raw, _ in cache.backend.read_many(keys).values():
+        with contextlib.suppress(ValueError):
+            samples.append(cache.decode(raw).encode("utf-8"))
+    return samples
+
+
+def compress(
+    cache: "FSCache", cache_dir: str, *, sample_size: int = 5000, dict_size: int = 16384
+) -> int:
+    """
+    Train a dictionary on the cache's items and compress every item with it.
+
+    The dictionary is saved before any entry is rewritten, and earlier
+    dictionaries are kept, so an interrupted run leaves every entry readable.
+
+    Args:
+        cache: Cache to compress, with its current codec (if any)
+        cache_dir: The cache directory
+        sample_size: Number of items to train on
+        dict_size: Maximum dictionary size in bytes
+
+    Returns:
+        Number of entries rewritten
+    """
+    codec = ZstdCodec.train(sample_entries(cache, cache_dir, sample_size), dict_size)
+    save_codec(codec, cache_dir)
+
+    old = FSCache(cache.backend, cache.codec)
+    cache.codec = load_codec(cache_dir)
+
+    def recompress(raw: bytes) -> bytes:
+        try:
+            return cache.encode(old.decode(raw))
+        except ValueError:
+            # Leave undecodable entries as they are; reads treat them as corrupt
+            return raw
+
+    return migrate(cache.backend, cache.backend, cache_dir, transform=recompress)
 
 
 # Create a singleton instance
 fscache = FSCache()
+
+# Pipeline state (the story index, score caches, change feed state) always lives in plain files,
+# whichever backend holds the HTTP cache, so every command finds the same state
+state_files = FSCache(DirectoryBackend())
+
+
+def add_backend_argument(parser: Any) -> None:
+    """Add the cache backend option shared by every command that uses the item cache."""
+    parser.add_argument(
+        "--cache-backend",
+        choices=["directory", "sqlite"],
+        default="directory",
+        help="Store cache entries as one file each, or in a single SQLite file "
+        "(use the same one for every command)",
+    )
+
+
+def main(argv: list[str] | None = None) -> None:
+    """
+    Command line entry point for cache migration and compression.
+
+    Args:
+        argv: Command line arguments (defaults to `sys.argv[1:]`)
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Migrate cache entries between backends")
+    parser.add_argument("--cache-dir", default="./cache", help="The cache directory to migrate")
+    parser.add_argument(
+        "--from", dest="source", choices=["directory", "sqlite"], default="directory"
+    )
+    parser.add_argument("--to", dest="target", choices=["directory", "sqlite"], default="sqlite")
+    parser.add_argument(
+        "--compress",
+        action="store_true",
+        help="Instead of migrating, train a zstd dictionary on the cached items and compress "
+        "every item in the --from backend with it; later runs compress new entries too",
+    )
+    parser.add_argument(
+        "--sample-size", type=int, default=5000, help="Cached items to train the dictionary on"
+    )
+    parser.add_argument(
+        "--dict-size", type=int, default=16384, help="Maximum dictionary size in bytes"
+    )
+    args = parser.parse_args(argv)
+
+    if args.compress:
+        if zstandard is None:
+            parser.error("--compress needs the zstandard package")
+        cache = FSCache(make_backend(args.source, args.cache_dir), load_codec(args.cache_dir))
+        count = compress(
+            cache, args.cache_dir, sample_size=args.sample_size, dict_size=args.dict_size
+        )
+        print(f"Compressed {count} items with dictionary {cache.codec.dict_id}")
+        return
+
+    count = migrate(
+        make_backend(args.source, args.cache_dir),
+        make_backend(args.target, args.cache_dir),
+        args.cache_dir,
+    )
+    print(f"Migrated {count} items from {args.source} to {args.target}")
+
+
+if __name__ == "__main__":
+    main()
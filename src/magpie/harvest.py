@@ -0,0 +1,366 @@
+"""
+Bulk story harvesting over contiguous HackerNews item ID ranges.
+
+Instead of probing a small window around every upvote, the harvester walks
+whole ID ranges in large concurrent chunks, keeps only stories that pass the
+score filter and persists them in a local story index. Neighbors are then
+drawn from the index without touching the network.
+"""
+
+import bisect
+import os
+import time
+from itertools import pairwise
+from typing import Any
+
+from tqdm.auto import tqdm
+
+from magpie.fetch import fetcher
+from magpie.fscache import state_files
+from magpie.prepare_dataset import cache_dir, hn_api_url, is_candidate_story, merge_id_ranges
+from magpie.records import Story, dumps
+
+
+def uncovered_ranges(covered: list[range], wanted: range) -> list[range]:
+    """
+    Find the parts of a range that sorted, disjoint ranges don't cover.
+
+    Args:
+        covered: Sorted, non-overlapping ranges (see `merge_id_ranges`)
+        wanted: Range to check
+
+    Returns:
+        Sorted list of the uncovered ranges within `wanted`
+    """
+    missing = []
+    start = wanted.start
+    for r in covered:
+        if r.stop <= start:
+            continue
+        if r.start >= wanted.stop:
+            break
+        if r.start > start:
+            missing.append(range(start, r.start))
+        start = max(start, r.stop)
+    if start < wanted.stop:
+        missing.append(range(start, wanted.stop))
+    return missing
+
+
+class StoryIndex:
+    """Local index of harvested stories and the item ID ranges already scanned."""
+
+    def __init__(self, path: str):
+        self.path = path
+        # Compact records rather than dicts: the index can hold millions of stories
+        self.stories: dict[int, Story] = {}
+        self.ranges: list[range] = []
+        # Creation time ranges (unix seconds) the search API fully enumerated
+        self.searched: list[range] = []
+        # The newest item ID seen on the API; IDs above it didn't exist yet
+        self.max_item_id: int | None = None
+        self._sorted_cache: dict[str, tuple[list[float], list[int]]] = {}
+
+    @classmethod
+    def load(cls, path: str | None = None) -> "StoryIndex":
+        """
+        Load a story index from disk, or create an empty one.
+
+        Args:
+            path: Path to the index file (defaults to `story_index.json` in the cache dir)
+
+        Returns:
+            The story index
+        """
+        index = cls(path or os.path.join(cache_dir, "story_index.json"))
+        try:
+            data = state_files.load_json(index.path)
+        except FileNotFoundError:
+            return index
+
+        index.stories = {story["id"]: Story.from_item(story) for story in data["stories"]}
+        index.ranges = [range(start, stop) for start, stop in data["ranges"]]
+        index.searched = [range(start, stop) for start, stop in data.get("searched", [])]
+        index.max_item_id = data.get("max_item_id")
+        return index
+
+    def save(self) -> None:
+        """Persist the index to disk."""
+        data = {
+            "ranges": [[r.start, r.stop] for r in self.ranges],
+            "searched": [[r.start, r.stop] for r in self.searched],
+            "max_item_id": self.max_item_id,
+            "stories": [self.stories[item_id].as_item() for item_id in sorted(self.stories)],
+        }
+        state_files.save(self.path, dumps(data))
+
+    def add(self, stories: list[dict[str, Any]]) -> None:
+        """
+        Add stories to the index.
+
+        Args:
+            stories: Story items from the HackerNews API
+        """
+        for story in stories:
+            self.stories[story["id"]] = Story.from_item(story)
+        self._sorted_cache.clear()
+
+    def mark_scanned(self, ids: range) -> None:
+        """
+        Record that every item in an ID range has been scanned.
+
+        Args:
+            ids: Range of item IDs that were scanned
+        """
+        self.ranges = merge_id_ranges([*self.ranges, ids])
+
+    def missing_ranges(self, ids: range) -> list[range]:
+        """
+        Find the parts of an ID range that have not been scanned yet.
+
+        Args:
+            ids: Range of item IDs to check
+
+        Returns:
+            Sorted list of unscanned ranges within `ids`
+        """
+        return uncovered_ranges(self.ranges, ids)
+
+    def mark_searched(self, times: range) -> None:
+        """
+        Record that the search API returned every story created in a time range.
+
+        Args:
+            times: Range of unix times, in seconds
+        """
+        self.searched = merge_id_ranges([*self.searched, times])
+
+    def unsearched_ranges(self, times: range) -> list[range]:
+        """
+        Find the parts of a time range the search API hasn't fully enumerated yet.
+
+        Args:
+            times: Range of unix times to check, in seconds
+
+        Returns:
+            Sorted list of unsearched time ranges within `times`
+        """
+        return uncovered_ranges(self.searched, times)
+
+    def _sorted(self, by: str) -> tuple[list[float], list[int]]:
+        if by not in ("id", "time"):
+            raise ValueError(by)
+        if by not in self._sorted_cache:
+            pairs = sorted(
+                (getattr(story, by) or 0, item_id) for item_id, story in self.stories.items()
+            )
+            self._sorted_cache[by] = ([key for key, _ in pairs], [item_id for _, item_id in pairs])
+        return self._sorted_cache[by]
+
+    def nearest(
+        self,
+        item: dict[str, Any],
+        count: int,
+        by: str = "id",
+        min_score: int = 3,
+        exclude_ids: set[int] | None = None,
+    ) -> list[dict[str, Any]]:
+        """
+        Find the indexed stories closest to an item by ID or by time.
+
+        Args:
+            item: The item to find neighbors for (needs `id`, or `time` when `by="time"`)
+            count: Number of stories to return
+            by: Either "id" or "time"
+            min_score: Minimum score threshold for stories
+            exclude_ids: Item IDs that must not be returned
+
+        Returns:
+            Up to `count` stories, closest first
+        """
+        keys, ids = self._sorted(by)
+        target = item[by]
+
+        exclude_ids = exclude_ids or set()
+        found: list[dict[str, Any]] = []
+
+        # Walk outwards from the insertion point, always taking the closer side
+        hi = bisect.bisect_left(keys, target)
+        lo = hi - 1
+        while len(found) < count and (lo >= 0 or hi < len(keys)):
+            if hi >= len(keys) or (lo >= 0 and target - keys[lo] <= keys[hi] - target):
+                i, lo = lo, lo - 1
+            else:
+                i, hi = hi, hi + 1
+
+            story = self.stories[ids[i]]
+            if story.id not in exclude_ids and story.score >= min_score:
+                found.append(story.as_item())
+
+        return found
+
+
+def get_max_item_id() -> int:
+    """
+    Get the current largest item ID from the HackerNews API.
+
+    Returns:
+        The largest item ID
+    """
+    return int(fetcher.fetch_json([f"{hn_api_url}/maxitem.json"], strict=True)[0])
+
+
+def harvest(
+    index: StoryIndex,
+    start_id: int,
+    stop_id: int,
+    min_score: int = 3,
+    chunk_size: int = 5000,
+    *,
+    save_interval: float = 60,
+) -> int:
+    """
+    Scan every unscanned item ID in `[start_id, stop_id)` and index the stories.
+
+    Saving rewrites the whole index, so it is saved every `save_interval`
+    seconds rather than after each chunk, and once more when the harvest
+    ends or is interrupted. An interrupted harvest resumes where it stopped.
+
+    Args:
+        index: Story index to fill
+        start_id: First item ID to scan
+        stop_id: Item ID to stop before
+        min_score: Minimum score threshold for stories
+        chunk_size: Number of item IDs fetched per chunk
+        save_interval: Seconds between saves of the index
+
+    Returns:
+        Number of stories added to the index
+    """
+    before = len(index.stories)
+    last_save = time.monotonic()
+
+    try:
+        for missing in index.missing_ranges(range(max(start_id, 1), stop_id)):
+            for chunk_start in tqdm(
+                range(missing.start, missing.stop, chunk_size),
+                desc=f"Harvesting {missing.start}-{missing.stop}",
+            ):
+                chunk = range(chunk_start, min(chunk_start + chunk_size, missing.stop))
+                urls = [f"{hn_api_url}/item/{item_id}.json" for item_id in chunk]
+                failed: set[str] = set()
+                items = fetcher.fetch_json(urls, failed=failed)
+                index.add([item for item in items if is_candidate_story(item, min_score)])
+
+                # Items that couldn't be fetched stay unscanned, so the next harvest retries them
+                failed_ids = [
+                    item_id for item_id, url in zip(chunk, urls, strict=True) if url in failed
+                ]
+                bounds = [chunk.start - 1, *failed_ids, chunk.stop]
+                for start, stop in pairwise(bounds):
+                    index.mark_scanned(range(start + 1, stop))
+
+                if time.monotonic() - last_save >= save_interval:
+                    index.save()
+                    last_save = time.monotonic()
+    finally:
+        index.save()
+
+    return len(index.stories) - before
+
+
+def harvest_around(
+    index: StoryIndex, upvotes: list[dict[str, Any]], margin: int = 1000, min_score: int = 3
+) -> int:
+    """
+    Harvest the ID range spanned by a set of upvotes, plus a margin on each side.
+
+    Nothing is fetched if the index already covers the range. IDs above the
+    newest item the index has seen are only asked about when the upvotes
+    themselves reach past it, so a covered re-run makes no requests.
+
+    Args:
+        index: Story index to fill
+        upvotes: Upvoted items
+        margin: Number of extra item IDs to scan below and above the upvotes
+        min_score: Minimum score threshold for stories
+
+    Returns:
+        Number of stories added to the index
+    """
+    ids = [upvote["id"] for upvote in upvotes]
+    start_id, stop_id = max(min(ids) - margin, 1), max(ids) + margin + 1
+
+    known_stop = stop_id
+    if index.max_item_id is not None and index.max_item_id >= max(ids):
+        known_stop = min(stop_id, index.max_item_id + 1)
+    if not index.missing_ranges(range(start_id, known_stop)):
+        return 0
+
+    # Don't mark IDs that don't exist yet as scanned
+    index.max_item_id = get_max_item_id()
+    return harvest(index, start_id, min(stop_id, index.max_item_id + 1), min_score)
+
+
+def neighbors_from_index(
+    index: StoryIndex,
+    upvotes: list[dict[str, Any]],
+    count: int = 1,
+    *,
+    by: str = "id",
+    min_score: int = 3,
+    exclude_ids: set[int] | None = None,
+) -> list[list[dict[str, Any]]]:
+    """
+    Draw neighbor stories for each upvote from the story index.
+
+    Args:
+        index: Story index to draw from
+        upvotes: Upvoted items to find neighbors for
+        count: Number of stories per upvote
+        by: Match neighbors by "id" or "time" proximity
+        min_score: Minimum score threshold for stories
+        exclude_ids: Item IDs that must not be used as neighbors
+
+    Returns:
+        List of neighboring stories for each upvote, in the same order as `upvotes`
+    """
+    return [index.nearest(upvote, count, by, min_score, exclude_ids) for upvote in upvotes]
+
+
+def main(argv: list[str] | None = None) -> None:
+    """
+    Command line entry point for harvesting stories into the index.
+
+    Args:
+        argv: Command line arguments (defaults to `sys.argv[1:]`)
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Harvest HackerNews stories into a local index")
+    parser.add_argument("--start-id", type=int, required=True, help="First item ID to scan")
+    parser.add_argument(
+        "--stop-id", type=int, default=None, help="Item ID to stop before (default: maxitem)"
+    )
+    parser.add_argument("--min-score", type=int, default=3, help="Minimum story score")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Item IDs per chunk")
+    parser.add_argument(
+        "--save-interval", type=float, default=60, help="Seconds between saves of the index"
+    )
+    args = parser.parse_args(argv)
+
+    story_index = StoryIndex.load()
+    stop_id = args.stop_id if args.stop_id is not None else get_max_item_id() + 1
+    added = harvest(
+        story_index,
+        args.start_id,
+        stop_id,
+        args.min_score,
+        args.chunk_size,
+        save_interval=args.save_interval,
+    )
+    print(f"Added {added} stories, index now holds {len(story_index.stories)}")
+
+
+if __name__ == "__main__":
+    main()
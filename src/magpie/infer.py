@@ -0,0 +1,326 @@
+"""
+CPU inference for the trained classifier.
+
+The fine-tuned model is exported to ONNX and quantized to INT8 with dynamic
+quantization, then scored with onnxruntime. Texts are sorted by length and
+batched, so each batch is padded only to its own longest title.
+"""
+
+import hashlib
+import inspect
+import os
+import time
+from functools import lru_cache
+from typing import Any
+
+import numpy as np
+
+from magpie.prepare_dataset import samples_to_record_batch
+from magpie.train.model import output_dir as model_dir
+
+onnx_dir = "./trained-model-onnx"
+model_file = "model.onnx"
+quantized_file = "model.int8.onnx"
+
+
+def model_version(directory: str = onnx_dir, filename: str = quantized_file) -> str:
+    """
+    Identify a model by the hash of its weights file.
+
+    Args:
+        directory: Directory of the exported model
+        filename: Model file to hash
+
+    Returns:
+        Short hex digest
+    """
+    digest = hashlib.sha256()
+    with open(os.path.join(directory, filename), "rb") as f:
+        while chunk := f.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def story_texts(stories: list[dict[str, Any]]) -> list[str]:
+    """Format stories into model input exactly as the dataset does ("title\\nSource: host")."""
+    samples = [
+        {
+            "label": 0,
+            "id": s["id"],
+            "link": s.get("url"),
+            "title": s.get("title"),
+            "time": s.get("time"),
+        }
+        for s in stories
+    ]
+    return samples_to_record_batch(samples).column("text").to_pylist()
+
+
+def export_onnx(source: str = model_dir, target: str = onnx_dir, opset: int = 17) -> str:
+    """
+    Export a trained sequence classifier to ONNX, with dynamic batch and sequence axes.
+
+    Args:
+        source: Directory of the trained model and tokenizer
+        target: Directory to write the ONNX model and tokenizer to
+        opset: ONNX opset version
+
+    Returns:
+        Path of the exported model
+    """
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(source)
+    model = AutoModelForSequenceClassification.from_pretrained(source).eval()
+    # Export plain tensors rather than a ModelOutput
+    model.config.return_dict = False
+
+    os.makedirs(target, exist_ok=True)
+    path = os.path.join(target, model_file)
+    sample = tokenizer(["Show HN: an example title"], return_tensors="pt")
+
+    # Newer torch defaults to the dynamo exporter; the TorchScript one handles these models fine
+    options = (
+        {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    )
+    torch.onnx.export(
+        model,
+        (sample["input_ids"], sample["attention_mask"]),
+        path,
+        input_names=["input_ids", "attention_mask"],
+        output_names=["logits"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "sequence"},
+            "attention_mask": {0: "batch", 1: "sequence"},
+            "logits": {0: "batch"},
+        },
+        opset_version=opset,
+        **options,
+    )
+    tokenizer.save_pretrained(target)
+    return path
+
+
+def quantize(directory: str = onnx_dir) -> str:
+    """
+    Quantize an exported model's weights to INT8 for CPU inference.
+
+    Args:
+        directory: Directory containing the exported ONNX model
+
+    Returns:
+        Path of the quantized model
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    path = os.path.join(directory, quantized_file)
+    quantize_dynamic(os.path.join(directory, model_file), path, weight_type=QuantType.QInt8)
+    return path
+
+
+class Scorer:
+    """Batched upvote scoring with an ONNX model on CPU."""
+
+    def __init__(
+        self,
+        directory: str = onnx_dir,
+        quantized: bool = True,
+        batch_size: int = 32,
+        threads: int | None = None,
+        max_length: int = 256,
+    ):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        path = os.path.join(directory, quantized_file if quantized else model_file)
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.tokenizer = AutoTokenizer.from_pretrained(directory)
+        self.batch_size = batch_size
+        self.max_length = max_length
+
+    def score(self, texts: list[str]) -> np.ndarray:
+        """
+        Score texts.
+
+        Args:
+            texts: Texts to score
+
+        Returns:
+            Upvote probability for each text, in input order
+        """
+        probabilities = np.empty(len(texts), dtype=np.float32)
+        # Batch texts of similar length together to keep padding to a minimum
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start : start + self.batch_size]
+            encoded = self.tokenizer(
+                [texts[i] for i in batch],
+                max_length=self.max_length,
+                padding=True,
+                truncation=True,
+                return_tensors="np",
+            )
+            (logits,) = self.session.run(
+                ["logits"],
+                {
+                    "input_ids": encoded["input_ids"].astype(np.int64),
+                    "attention_mask": encoded["attention_mask"].astype(np.int64),
+                },
+            )
+            probabilities[batch] = softmax(logits)[:, 1]
+        return probabilities
+
+
+def softmax(logits: np.ndarray) -> np.ndarray:
+    exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+@lru_cache(maxsize=4)
+def get_scorer(
+    directory: str = onnx_dir,
+    quantized: bool = True,
+    batch_size: int = 32,
+    threads: int | None = None,
+) -> Scorer:
+    """Get a shared scorer, loading the model on first use."""
+    return Scorer(directory, quantized, batch_size, threads)
+
+
+def score(
+    texts: list[str], batch_size: int = 32, threads: int | None = None, directory: str = onnx_dir
+) -> np.ndarray:
+    """
+    Score texts with the quantized model.
+
+    Args:
+        texts: Texts to score, e.g. "title\\nSource: host" as in the dataset
+        batch_size: Texts per inference batch
+        threads: Intra-op threads for onnxruntime (defaults to all cores)
+        directory: Directory of the exported model
+
+    Returns:
+        Upvote probability for each text
+    """
+    return get_scorer(directory, True, batch_size, threads).score(texts)
+
+
+class TorchScorer:
+    """Batched upvote scoring with the PyTorch model, the reference for parity checks."""
+
+    def __init__(self, source: str = model_dir, batch_size: int = 32, max_length: int = 256):
+        import torch
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+        self.torch = torch
+        self.tokenizer = AutoTokenizer.from_pretrained(source)
+        self.model = AutoModelForSequenceClassification.from_pretrained(source).eval()
+        self.batch_size = batch_size
+        self.max_length = max_length
+
+    def score(self, texts: list[str]) -> np.ndarray:
+        """Get the upvote probability for each text."""
+        logits = []
+        with self.torch.inference_mode():
+            for start in range(0, len(texts), self.batch_size):
+                encoded = self.tokenizer(
+                    texts[start : start + self.batch_size],
+                    max_length=self.max_length,
+                    padding=True,
+                    truncation=True,
+                    return_tensors="pt",
+                )
+                logits.append(self.model(**encoded).logits.float().numpy())
+        if not logits:
+            return np.empty(0, dtype=np.float32)
+        return softmax(np.concatenate(logits))[:, 1]
+
+
+def check_parity(
+    texts: list[str], source: str = model_dir, directory: str = onnx_dir, threshold: float = 0.5
+) -> dict[str, float]:
+    """
+    Compare the ONNX models' probabilities against the PyTorch model.
+
+    Args:
+        texts: Texts to compare on
+        source: Directory of the trained PyTorch model
+        directory: Directory of the exported models
+        threshold: Probability threshold for counting prediction agreement
+
+    Returns:
+        Max absolute probability difference and prediction agreement for
+        the FP32 and INT8 models
+    """
+    reference = TorchScorer(source).score(texts)
+    report = {}
+    for name, quantized in (("fp32", False), ("int8", True)):
+        probabilities = Scorer(directory, quantized=quantized).score(texts)
+        report[f"{name}_max_abs_diff"] = float(np.max(np.abs(probabilities - reference)))
+        agreement = (probabilities >= threshold) == (reference >= threshold)
+        report[f"{name}_agreement"] = float(np.mean(agreement))
+    return report
+
+
+def benchmark(scorer: Any, texts: list[str], repeats: int = 3, warmup: int = 32) -> float:
+    """
+    Measure scoring throughput.
+
+    Args:
+        scorer: The scorer to benchmark (anything with a batched `score(texts)`)
+        texts: Texts to score on each repeat
+        repeats: Number of timed passes
+        warmup: Number of texts to score once before timing
+
+    Returns:
+        Stories scored per second
+    """
+    scorer.score(texts[:warmup])
+    start = time.perf_counter()
+    for _ in range(repeats):
+        scorer.score(texts)
+    return repeats * len(texts) / (time.perf_counter() - start)
+
+
+def main(argv: list[str] | None = None) -> None:
+    """
+    Command line entry point for exporting and checking the inference model.
+
+    Args:
+        argv: Command line arguments (defaults to `sys.argv[1:]`)
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export and benchmark the CPU inference model")
+    parser.add_argument("--model-dir", default=model_dir, help="Trained model directory")
+    parser.add_argument("--onnx-dir", default=onnx_dir, help="Exported model directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("export", help="Export to ONNX and quantize to INT8")
+    check = commands.add_parser("check", help="Check parity with PyTorch and measure throughput")
+    check.add_argument("--batch-size", type=int, default=32, help="Texts per inference batch")
+    check.add_argument("--threads", type=int, default=None, help="onnxruntime intra-op threads")
+    check.add_argument("--samples", type=int, default=512, help="Number of test texts to use")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        print(f"Exported {export_onnx(args.model_dir, args.onnx_dir)}")
+        print(f"Quantized {quantize(args.onnx_dir)}")
+        return
+
+    from magpie.datastore import load_version
+
+    texts = load_version()["test"]["text"][: args.samples]
+    print(f"Parity on {len(texts)} texts: {check_parity(texts, args.model_dir, args.onnx_dir)}")
+    for quantized in (False, True):
+        scorer = Scorer(args.onnx_dir, quantized, args.batch_size, args.threads)
+        rate = benchmark(scorer, texts)
+        print(f"{'int8' if quantized else 'fp32'}: {rate:.1f} stories/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Progress journal that lets an interrupted dataset preparation resume.
+
+The journal is an append-only JSON lines file. Each line records either a
+finished stage (with its result) or one finished unit of work inside a stage,
+such as the neighbors collected for one upvote. Lines are flushed as they are
+written, and a torn last line from a killed run is ignored on load. The
+journal is only reused by a run with the same settings, within `max_age`
+seconds, and is removed once the run completes.
+"""
+
+import contextlib
+import json
+import os
+import time
+from typing import Any
+
+
+class Journal:
+    """Append-only record of finished stages and per-item progress for one run."""
+
+    def __init__(self, path: str, key: str, max_age: float = 86400):
+        """
+        Open the journal, resuming from it if it belongs to the same run.
+
+        Args:
+            path: Journal file
+            key: Identifies the run's settings; a journal with another key is discarded
+            max_age: Discard journals started longer ago than this, in seconds
+        """
+        self.path = path
+        self.key = key
+        self.stages: dict[str, Any] = {}
+        self.records: dict[str, dict[Any, Any]] = {}
+
+        lines = self._read()
+        header = lines[0] if lines else {}
+        if header.get("key") == key and time.time() - header.get("started", 0) < max_age:
+            for line in lines[1:]:
+                if "record" in line:
+                    self.records.setdefault(line["record"], {})[line["id"]] = line["value"]
+                else:
+                    self.stages[line["stage"]] = line.get("result")
+            self._file = open(path, "a", encoding="utf-8")  # noqa: SIM115
+        else:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._file = open(path, "w", encoding="utf-8")  # noqa: SIM115
+            self._append({"key": key, "started": time.time()})
+
+    def _read(self) -> list[dict[str, Any]]:
+        lines = []
+        with contextlib.suppress(FileNotFoundError), open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    lines.append(json.loads(line))
+                except ValueError:
+                    # Torn write from a killed run; everything before it is intact
+                    break
+        return lines
+
+    def _append(self, entry: dict[str, Any]) -> None:
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+
+    @property
+    def resumed(self) -> bool:
+        """Whether any progress was loaded from a previous run."""
+        return bool(self.stages or self.records)
+
+    def done(self, stage: str) -> bool:
+        """Check whether a stage has finished."""
+        return stage in self.stages
+
+    def result(self, stage: str) -> Any:
+        """Get the result recorded for a finished stage."""
+        return self.stages[stage]
+
+    def finish(self, stage: str, result: Any = None) -> None:
+        """Mark a stage as finished, with its result."""
+        self.stages[stage] = result
+        self._append({"stage": stage, "result": result})
+
+    def record(self, name: str, item_id: Any, value: Any) -> None:
+        """Record one finished unit of work, e.g. the neighbors of one upvote."""
+        self.records.setdefault(name, {})[item_id] = value
+        self._append({"record": name, "id": item_id, "value": value})
+
+    def get(self, name: str) -> dict[Any, Any]:
+        """Get all units of work recorded under a name."""
+        return self.records.get(name, {})
+
+    def close(self) -> None:
+        self._file.close()
+
+    def complete(self) -> None:
+        """The run finished: remove the journal so the next run starts fresh."""
+        self.close()
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.path)
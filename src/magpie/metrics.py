@@ -0,0 +1,241 @@
+"""
+Lightweight run instrumentation: stage timers, counters, gauges and histograms.
+
+Everything records into the `metrics` singleton, which is thread-safe so the
+fetch loop, worker threads and the main thread can all report into it. At the
+end of a run the collected values are written as a JSON report and,
+optionally, as a Prometheus textfile for the node exporter's textfile collector.
+"""
+
+import bisect
+import contextlib
+import json
+import os
+import re
+import threading
+import time
+from collections.abc import Iterator
+from typing import Any
+
+reports_dir = "./reports"
+
+# Upper bounds in seconds, suited to HTTP requests against a remote API
+latency_buckets = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Cumulative-bucket histogram, as Prometheus exposes it."""
+
+    def __init__(self, buckets: tuple[float, ...] = latency_buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        """Get (upper bound, observations at or below it) pairs, ending with "+Inf"."""
+        bounds = [*(f"{bound:g}" for bound in self.buckets), "+Inf"]
+        totals, total = [], 0
+        for count in self.counts:
+            total += count
+            totals.append(total)
+        return list(zip(bounds, totals, strict=True))
+
+
+class Metrics:
+    """Collects timers, counters, gauges and histograms for one run."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget everything recorded so far and restart the run clock."""
+        with self._lock:
+            self.started = time.time()
+            self.timers: dict[str, dict[str, float]] = {}
+            self.counters: dict[str, float] = {}
+            self.gauges: dict[str, float] = {}
+            self.histograms: dict[str, Histogram] = {}
+
+    def count(self, name: str, value: float = 1) -> None:
+        """Add to a counter."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge(self, name: str, value: float) -> None:
+        """Set a gauge to its latest value."""
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(
+        self, name: str, value: float, buckets: tuple[float, ...] = latency_buckets
+    ) -> None:
+        """Record a value in a histogram."""
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram(buckets)
+            self.histograms[name].observe(value)
+
+    def add_time(self, name: str, seconds: float) -> None:
+        """Add a duration to a timer."""
+        with self._lock:
+            timer = self.timers.setdefault(name, {"seconds": 0.0, "calls": 0})
+            timer["seconds"] += seconds
+            timer["calls"] += 1
+
+    @contextlib.contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """Time a block of code and add it to the named timer."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def report(self, name: str = "run") -> dict[str, Any]:
+        """
+        Get everything recorded so far.
+
+        Args:
+            name: Name of the run (e.g. "prepare" or "train")
+
+        Returns:
+            JSON-serializable run report
+        """
+        with self._lock:
+            return {
+                "run": name,
+                "started": self.started,
+                "wall_seconds": time.time() - self.started,
+                "timers": {k: dict(v) for k, v in sorted(self.timers.items())},
+                "counters": dict(sorted(self.counters.items())),
+                "gauges": dict(sorted(self.gauges.items())),
+                "histograms": {
+                    k: {"sum": h.sum, "count": h.count, "buckets": dict(h.cumulative())}
+                    for k, h in sorted(self.histograms.items())
+                },
+            }
+
+    def prometheus(self, name: str = "run") -> str:
+        """
+        Format everything recorded so far in the Prometheus text exposition format.
+
+        Args:
+            name: Name of the run, added as a `run` label to every sample
+
+        Returns:
+            Text for the node exporter's textfile collector
+        """
+        report = self.report(name)
+        label = f'run="{name}"'
+        lines = [
+            "# TYPE magpie_run_wall_seconds gauge",
+            f"magpie_run_wall_seconds{{{label}}} {report['wall_seconds']}",
+            "# TYPE magpie_run_started_timestamp_seconds gauge",
+            f"magpie_run_started_timestamp_seconds{{{label}}} {report['started']}",
+        ]
+        for key, timer in report["timers"].items():
+            metric = f"magpie_{metric_name(key)}_seconds"
+            lines += [
+                f"# TYPE {metric} summary",
+                f"{metric}_sum{{{label}}} {timer['seconds']}",
+                f"{metric}_count{{{label}}} {timer['calls']}",
+            ]
+        for key, value in report["counters"].items():
+            metric = f"magpie_{metric_name(key)}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric}{{{label}}} {value}"]
+        for key, value in report["gauges"].items():
+            metric = f"magpie_{metric_name(key)}"
+            lines += [f"# TYPE {metric} gauge", f"{metric}{{{label}}} {value}"]
+        for key, histogram in report["histograms"].items():
+            metric = f"magpie_{metric_name(key)}"
+            lines.append(f"# TYPE {metric} histogram")
+            lines += [
+                f'{metric}_bucket{{{label},le="{bound}"}} {count}'
+                for bound, count in histogram["buckets"].items()
+            ]
+            lines += [
+                f"{metric}_sum{{{label}}} {histogram['sum']}",
+                f"{metric}_count{{{label}}} {histogram['count']}",
+            ]
+        return "\n".join(lines) + "\n"
+
+    def write(self, name: str, path: str | None = None, prometheus: str | None = None) -> str:
+        """
+        Write the JSON run report, and optionally a Prometheus textfile.
+
+        Both files are written atomically, so readers never see partial content.
+
+        Args:
+            name: Name of the run
+            path: Report path (defaults to `<name>-<timestamp>.json` in `reports_dir`)
+            prometheus: Prometheus textfile path (should end in `.prom`), if any
+
+        Returns:
+            The report path
+        """
+        if path is None:
+            stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime(self.started))
+            path = os.path.join(reports_dir, f"{name}-{stamp}.json")
+
+        write_atomic(path, json.dumps(self.report(name), indent=2))
+        if prometheus:
+            write_atomic(prometheus, self.prometheus(name))
+        return path
+
+
+def metric_name(key: str) -> str:
+    """Turn a metric key such as "stage.download_upvotes" into a Prometheus name."""
+    return re.sub(r"[^a-zA-Z0-9_]", "_", key)
+
+
+def write_atomic(path: str, content: str) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def add_report_arguments(parser: Any) -> None:
+    """Add the run report options to a command line parser."""
+    parser.add_argument(
+        "--metrics-report",
+        default=None,
+        metavar="PATH",
+        help=f"Where to write the JSON run report (default: {reports_dir}/<run>-<time>.json)",
+    )
+    parser.add_argument(
+        "--prometheus-textfile",
+        default=None,
+        metavar="PATH",
+        help="Also write metrics to this Prometheus textfile (e.g. for node exporter)",
+    )
+
+
+@contextlib.contextmanager
+def recording(name: str, args: Any) -> Iterator[None]:
+    """
+    Record a whole run and write its reports when it finishes, even if it fails.
+
+    Args:
+        name: Name of the run
+        args: Parsed arguments from a parser set up with `add_report_arguments`
+    """
+    metrics.reset()
+    try:
+        with metrics.timer(f"stage.{name}"):
+            yield
+    finally:
+        path = metrics.write(name, args.metrics_report, args.prometheus_textfile)
+        print(f"Run report written to {path}")
+
+
+# Create a singleton instance
+metrics = Metrics()
@@ -0,0 +1,166 @@
+"""
+Parsers for HackerNews `upvoted?id=...` pages and their item timestamps.
+
+Page parsing is pluggable: the lxml backend uses precompiled XPath
+expressions and is used when lxml is installed, with BeautifulSoup as the
+fallback. Timestamps come from the absolute time HN puts in each item's
+`age` span, or from a cached fast path for the "N units ago" wording.
+"""
+
+import re
+import time
+from collections.abc import Callable
+from datetime import datetime, timezone
+from functools import lru_cache
+
+from bs4 import BeautifulSoup
+
+try:
+    from lxml import etree
+    from lxml import html as lxml_html
+except ImportError:  # pragma: no cover - lxml is optional
+    etree = lxml_html = None
+
+# ((item href, time words, absolute time or None), (link, title))
+RawUpvote = tuple[tuple[str, str, str | None], tuple[str | None, str]]
+
+
+def _class_xpath(name: str) -> str:
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+if etree is not None:
+    # Same selections as ".subtext .age" and "td.title > .titleline > a"
+    _age_xpath = etree.XPath(f"//*[{_class_xpath('subtext')}]//*[{_class_xpath('age')}]")
+    _link_xpath = etree.XPath(f"//td[{_class_xpath('title')}]/*[{_class_xpath('titleline')}]/a")
+
+
+def parse_with_bs4(page: str) -> list[RawUpvote]:
+    """Parse an upvoted page with BeautifulSoup."""
+    tree = BeautifulSoup(page, features="html.parser")
+
+    meta = []
+    for age in tree.select(".subtext .age"):
+        a = age.select_one("a")
+        if a is not None:
+            absolute = age.get("title")
+            meta.append((str(a["href"]), a.contents[0].text, str(absolute) if absolute else None))
+
+    links = [(x.get("href"), x.contents[0].text) for x in tree.select("td.title > .titleline > a")]
+    assert len(meta) == len(links)
+
+    return list(zip(meta, links, strict=False))
+
+
+def parse_with_lxml(page: str) -> list[RawUpvote]:
+    """Parse an upvoted page with lxml and precompiled XPath selectors."""
+    if not page.strip():
+        return []
+    tree = lxml_html.fromstring(page)
+
+    meta = []
+    for age in _age_xpath(tree):
+        a = age.find("a")
+        if a is not None:
+            meta.append((a.get("href"), a.text or "", age.get("title")))
+
+    links = [(a.get("href"), a.text or "") for a in _link_xpath(tree)]
+    assert len(meta) == len(links)
+
+    return list(zip(meta, links, strict=False))
+
+
+page_parsers: dict[str, Callable[[str], list[RawUpvote]]] = {"bs4": parse_with_bs4}
+if etree is not None:
+    page_parsers["lxml"] = parse_with_lxml
+
+default_page_parser = "lxml" if "lxml" in page_parsers else "bs4"
+
+
+def parse_upvoted_page(page: str, backend: str | None = None) -> list[RawUpvote]:
+    """
+    Extract the raw (meta, link) pairs from one page of a user's upvotes.
+
+    Args:
+        page: HTML of an `upvoted?id=...` page
+        backend: Parser backend name ("lxml" or "bs4"); defaults to the fastest available
+
+    Returns:
+        List of ((item href, time words, absolute time), (link, title)) tuples, newest first
+    """
+    return page_parsers[backend or default_page_parser](page)
+
+
+def parse_absolute_time(title: str | None) -> float | None:
+    """
+    Parse the absolute time from an `age` span's title attribute.
+
+    HN renders it as "2024-06-01T12:34:56" (UTC), optionally followed by the
+    unix timestamp.
+
+    Args:
+        title: The title attribute, if any
+
+    Returns:
+        Unix timestamp, or None if it can't be parsed
+    """
+    if not title:
+        return None
+
+    parts = title.split()
+    if len(parts) > 1 and parts[1].isdigit():
+        return float(parts[1])
+    try:
+        return datetime.fromisoformat(parts[0]).replace(tzinfo=timezone.utc).timestamp()
+    except ValueError:
+        return None
+
+
+_relative_time = re.compile(
+    r"^(?P<n>\d+|an?|one)\s+(?P<unit>second|minute|hour|day|week|month|year)s?\s+ago$"
+)
+_unit_seconds = {
+    "second": 1,
+    "minute": 60,
+    "hour": 3600,
+    "day": 86400,
+    "week": 7 * 86400,
+    "month": 30 * 86400,
+    "year": 365 * 86400,
+}
+
+
+@lru_cache(maxsize=4096)
+def relative_time_offset(words: str) -> float | None:
+    """
+    Convert HN's "N units ago" wording to a number of seconds.
+
+    Args:
+        words: Relative time such as "3 hours ago" or "a day ago"
+
+    Returns:
+        Seconds in the past, or None if the wording isn't recognized
+    """
+    match = _relative_time.match(words.strip().lower())
+    if match is None:
+        return None
+    n = match["n"]
+    count = int(n) if n.isdigit() else 1
+    return count * _unit_seconds[match["unit"]]
+
+
+def parse_relative_time(words: str, now: float | None = None) -> float | None:
+    """
+    Resolve HN's "N units ago" wording to a unix timestamp.
+
+    Args:
+        words: Relative time such as "3 hours ago"
+        now: Reference time (defaults to the current time)
+
+    Returns:
+        Unix timestamp, or None if the wording isn't recognized
+    """
+    offset = relative_time_offset(words)
+    if offset is None:
+        return None
+    return (time.time() if now is None else now) - offset
@@ -1,23 +1,48 @@
-import json
+import contextlib
+import itertools
 import os
+import re
 import time
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Any
 from urllib.parse import urlparse
 
-import dateparser
-import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 import requests
-from bs4 import BeautifulSoup
-from datasets import Dataset
-from hn_sdk.client.v0.client import get_item_by_id
-from joblib import Parallel, delayed
 from tqdm.auto import tqdm
 
-from magpie.fscache import fscache
+from magpie.datastore import (
+    content_hash,
+    has_version,
+    latest_version,
+    load_version,
+    push_version,
+    save_version,
+    set_latest_version,
+    split_by_id,
+    user_dir,
+)
+from magpie.dedup import Deduplicator
+from magpie.fetch import fetcher
+from magpie.fscache import ItemAgeTTL, add_backend_argument, fscache
+from magpie.journal import Journal
+from magpie.metrics import add_report_arguments, metrics, recording
+from magpie.parsing import parse_absolute_time, parse_relative_time, parse_upvoted_page
+from magpie.records import dumps, loads, trim_item
 
-# Create cache directory
 cache_dir = "./cache"
-os.makedirs(cache_dir, exist_ok=True)
+
+# Overridable so the pipeline can run against a local stand-in (see benchmarks/fake_hn.py)
+hn_api_url = os.environ.get("HN_API_URL", "https://hacker-news.firebaseio.com/v0")
+hn_web_url = os.environ.get("HN_WEB_URL", "https://news.ycombinator.com")
+
+# Seconds to wait between upvote pages, to be polite to HN
+upvote_page_delay = 1.0
+
+# Old items have final scores and never expire; fresh ones are re-fetched quickly
+item_ttl = ItemAgeTTL()
 
 
 def pluck(d: dict[str, Any], ks: list[str]) -> dict[str, Any]:
@@ -30,72 +55,190 @@ def get_host(u: str) -> str:
 
 hn_user_cookie: str | None = os.environ.get("HN_USER_COOKIE")
 
+# The user whose dataset is saved in `dataset_dir`; other users get their own directory
+default_username = "diwank"
+
+
+def user_cookie(username: str) -> str | None:
+    """
+    Get the HN session cookie to scrape a user's upvotes with.
+
+    Upvotes are only visible to their owner, so each user can have their own
+    cookie in `HN_USER_COOKIE_<USERNAME>`, with `HN_USER_COOKIE` as the fallback.
+
+    Args:
+        username: HackerNews username
+
+    Returns:
+        The cookie, or None if none is set
+    """
+    name = re.sub(r"[^A-Z0-9]", "_", username.upper())
+    return os.environ.get(
+        f"HN_USER_COOKIE_{name}", os.environ.get("HN_USER_COOKIE", hn_user_cookie)
+    )
+
+
+def parse_upvote_id(d: tuple) -> int:
+    return int(d[0][0].split("=")[1])
+
 
 def parse_upvote(d: tuple) -> dict[str, Any]:
-    parsed_time = dateparser.parse((d[0][1]), languages=["en"])
-    # Use ternary operator for cleaner code
-    parsed_time_value = time.time() if parsed_time is None else parsed_time.timestamp()
+    # Prefer the absolute time HN puts on the page, then the fast "N units ago" path
+    _, time_words, *absolute = d[0]
+    parsed_time_value = parse_absolute_time(absolute[0] if absolute else None)
+    if parsed_time_value is None:
+        parsed_time_value = parse_relative_time(time_words)
+
+    if parsed_time_value is None:
+        # Fall back to dateparser for any other wording; it is slow to import, so only load it here
+        import dateparser
+
+        metrics.count("parse.dateparser_fallbacks")
+        with metrics.timer("parse.dateparser"):
+            parsed_time = dateparser.parse(time_words, languages=["en"])
+        # Use ternary operator for cleaner code
+        parsed_time_value = time.time() if parsed_time is None else parsed_time.timestamp()
 
     return {
-        "id": int(d[0][0].split("=")[1]),
+        "id": parse_upvote_id(d),
         "link": d[1][0],
         "title": d[1][1],
-        "time_words": d[0][1],
+        "time_words": time_words,
         "time": parsed_time_value,
     }
 
 
-def download_upvotes(username: str) -> list[dict[str, Any]]:
+def download_upvotes(username: str, incremental: bool = True) -> list[dict[str, Any]]:
     """
     Download upvoted stories for a given HackerNews username.
     Results are cached using fscache.
 
+    In incremental mode, scraping starts from the newest page and stops at the
+    first page that contains an already-stored upvote; new upvotes are merged
+    into the stored list.
+
     Args:
         username: HackerNews username to fetch upvotes for
+        incremental: Whether to stop at already-known upvotes instead of scraping every page
 
     Returns:
         List of dictionaries containing upvoted story data
     """
-    url = f"https://news.ycombinator.com/upvoted?id={username}"
+    url = f"{hn_web_url}/upvoted?id={username}"
     cache_file = fscache.path(url, cache_dir=cache_dir)
 
     if fscache.valid(cache_file, lifetime=86400):  # 24-hour cache
-        print(f"Loading upvotes for user '{username}' from cache")
-        return json.loads(fscache.load(cache_file))
+        with contextlib.suppress(FileNotFoundError):
+            upvotes = fscache.load_json(cache_file)
+            print(f"Loading upvotes for user '{username}' from cache")
+            return upvotes
+
+    stored: list[dict[str, Any]] = []
+    if incremental:
+        with contextlib.suppress(FileNotFoundError):
+            stored = fscache.load_json(cache_file)
+    known_ids = {upvote["id"] for upvote in stored}
 
     print(f"Fetching upvotes for user '{username}' (not from cache)")
     upvotes: list[tuple] = []
+    cookie = user_cookie(username)
 
     with requests.Session() as session:
         page = 1
         while True:
             print(f"Scraping page {page} for user '{username}'")
+            start = time.perf_counter()
             resp = session.get(
-                f"https://news.ycombinator.com/upvoted?id={username}&p={page}",
-                cookies={"user": f"{username}&{hn_user_cookie}"},
+                f"{hn_web_url}/upvoted?id={username}&p={page}",
+                cookies={"user": f"{username}&{cookie}"},
             )
-            tree = BeautifulSoup(resp.text, features="html.parser")
+            metrics.observe("http.request_seconds", time.perf_counter() - start)
+            metrics.count(f"http.status.{resp.status_code}")
+            with metrics.timer("parse.upvoted_page"):
+                page_upvotes = parse_upvoted_page(resp.text)
 
-            meta = [(x["href"], x.contents[0].text) for x in tree.select(".subtext .age a")]
-            links = [
-                (x.get("href"), x.contents[0].text)
-                for x in tree.select("td.title > .titleline > a")
-            ]
-            assert len(meta) == len(links)
+            if len(page_upvotes) == 0:
+                break
+
+            new_upvotes = [d for d in page_upvotes if parse_upvote_id(d) not in known_ids]
+            upvotes.extend(new_upvotes)
 
-            if len(links) == 0:
+            # Pages are newest first, so everything after a known upvote was stored earlier
+            if len(new_upvotes) < len(page_upvotes):
+                print(f"Reached already-known upvotes on page {page}, stopping")
                 break
 
-            upvotes.extend(zip(meta, links, strict=False))
             page = page + 1
-            time.sleep(1)
+            with metrics.timer("http.polite_sleep"):
+                time.sleep(upvote_page_delay)
 
-    result = list(map(parse_upvote, upvotes))
-    fscache.save(cache_file, json.dumps(result))
+    with metrics.timer("parse.upvotes"):
+        result = list(map(parse_upvote, upvotes)) + stored
+    fscache.save(cache_file, dumps(result))
     return result
 
 
-def get_cached_item_by_id(item_id: int) -> dict[str, Any]:
+def get_cached_items_by_ids(
+    item_ids: list[int], *, failed: set[int] | None = None
+) -> list[dict[str, Any] | None]:
+    """
+    Get many items from HackerNews API with caching.
+    Cache misses are fetched concurrently through the shared fetcher. Items
+    are trimmed to the fields the pipeline uses before they are cached.
+
+    Items that couldn't be fetched come back as None, like deleted items, but
+    aren't cached, so the next call fetches them again. Pass `failed` to tell
+    the two apart.
+
+    Args:
+        item_ids: The HackerNews item IDs to fetch
+        failed: If given, the IDs of items that couldn't be fetched are added to it
+
+    Returns:
+        Trimmed item data from the HackerNews API, in the same order as `item_ids`
+    """
+    cache_files = {
+        item_id: fscache.path(f"{hn_api_url}/item/{item_id}.json", cache_dir=cache_dir)
+        for item_id in item_ids
+    }
+    cached = fscache.get_many(list(cache_files.values()), policy=item_ttl)
+
+    results: dict[int, dict[str, Any] | None] = {}
+    missing: list[int] = []
+    for item_id, cache_file in cache_files.items():
+        try:
+            # Entries cached before trimming still carry every field
+            results[item_id] = trim_item(loads(cached[cache_file]))
+        except KeyError:
+            missing.append(item_id)
+        except ValueError:
+            # Corrupt entry (e.g. truncated by a killed run): fetch it again
+            metrics.count("cache.corrupt")
+            missing.append(item_id)
+
+    if not missing:
+        return [results[item_id] for item_id in item_ids]
+
+    urls = {item_id: f"{hn_api_url}/item/{item_id}.json" for item_id in missing}
+    failed_urls: set[str] = set()
+    fetched = fetcher.fetch_json(list(urls.values()), failed=failed_urls)
+    results.update(zip(missing, map(trim_item, fetched), strict=True))
+    failed_ids = {item_id for item_id in missing if urls[item_id] in failed_urls}
+    if failed is not None:
+        failed.update(failed_ids)
+
+    fscache.save_many(
+        {
+            cache_files[item_id]: dumps(results[item_id])
+            for item_id in missing
+            if item_id not in failed_ids
+        }
+    )
+
+    return [results[item_id] for item_id in item_ids]
+
+
+def get_cached_item_by_id(item_id: int) -> dict[str, Any] | None:
     """
     Get an item from HackerNews API with caching.
 
@@ -105,57 +248,59 @@ def get_cached_item_by_id(item_id: int) -> dict[str, Any]:
     Returns:
         Item data from the HackerNews API
     """
-    url = f"https://hacker-news.firebaseio.com/v0/item/{item_id}.json"
-    cache_file = fscache.path(url, cache_dir=cache_dir)
+    return get_cached_items_by_ids([item_id])[0]
 
-    if fscache.valid(cache_file, lifetime=86400):  # 24-hour cache
-        return json.loads(fscache.load(cache_file))
-
-    result = get_item_by_id(item_id)
-    fscache.save(cache_file, json.dumps(result))
-    return result
 
-
-def process_item(target_id: int, min_score: int = 3) -> dict[str, Any] | None:
+def is_candidate_story(item: Any, min_score: int = 3) -> bool:
     """
-    Process a single HackerNews item by ID.
+    Check whether an item is a live story with at least `min_score` points.
 
     Args:
-        target_id: The HackerNews item ID to process
+        item: Item data from the HackerNews API (may be None)
         min_score: Minimum score threshold for stories
 
     Returns:
-        Item dict if it meets criteria, None otherwise
+        True if the item can be used as a sample
     """
-    item = get_cached_item_by_id(target_id)
-    if (
+    return bool(
         item
         and isinstance(item, dict)
         and item.get("type") == "story"
         and not item.get("dead", False)
         and item.get("score", 0) >= min_score
-    ):
-        return item
-    return None
+    )
 
 
-class RateLimitedParallel(Parallel):
-    """Joblib Parallel implementation with rate limiting."""
+def process_items(
+    target_ids: list[int], min_score: int = 3, *, failed: set[int] | None = None
+) -> list[dict[str, Any] | None]:
+    """
+    Process many HackerNews items by ID.
 
-    def __init__(self, *args, requests_per_second: int = 10, **kwargs):
-        self.delay = 1.0 / requests_per_second
-        self.last_time = 0
-        super().__init__(*args, **kwargs)
+    Args:
+        target_ids: The HackerNews item IDs to process
+        min_score: Minimum score threshold for stories
+        failed: If given, the IDs of items that couldn't be fetched are added to it
 
-    def __call__(self, *args, **kwargs):
-        # Add delay between batches to maintain rate limit
-        current_time = time.time()
-        elapsed = current_time - self.last_time
-        if elapsed < self.delay:
-            time.sleep(self.delay - elapsed)
-        self.last_time = time.time()
+    Returns:
+        For each ID, the item dict if it meets criteria, None otherwise
+    """
+    items = get_cached_items_by_ids(target_ids, failed=failed)
+    return [item if is_candidate_story(item, min_score) else None for item in items]
 
-        return super().__call__(*args, **kwargs)
+
+def process_item(target_id: int, min_score: int = 3) -> dict[str, Any] | None:
+    """
+    Process a single HackerNews item by ID.
+
+    Args:
+        target_id: The HackerNews item ID to process
+        min_score: Minimum score threshold for stories
+
+    Returns:
+        Item dict if it meets criteria, None otherwise
+    """
+    return process_items([target_id], min_score)[0]
 
 
 def get_neighbor_stories(
@@ -180,12 +325,8 @@ def get_neighbor_stories(
     # Define the range of IDs to check
     target_ids = list(range(start_id - 2 * count, start_id + 2 * count))
 
-    # Use parallel processing with built-in rate limiting
-    # Set n_jobs to 10 to allow up to 10 concurrent requests
-    # The RateLimitedParallel will ensure we don't exceed 10 requests per second
-    results = RateLimitedParallel(n_jobs=10, requests_per_second=10)(
-        delayed(process_item)(target_id, min_score) for target_id in target_ids
-    )
+    # Fetched concurrently; the shared fetcher enforces the global rate limit
+    results = process_items(target_ids, min_score)
 
     # Filter out None results and add to collection
     for item in results:
@@ -196,10 +337,139 @@ def get_neighbor_stories(
         return collected
 
     # If we don't have enough items, expand the search range
-    return get_neighbor_stories(start_id - 4 * count, count, collected)
+    return get_neighbor_stories(start_id - 4 * count, count, collected, min_score)
+
+
+def neighbor_window(start_id: int, count: int, step: int) -> range:
+    """
+    The ID window `get_neighbor_stories` scans for an upvote at a given expansion step.
+
+    Step 0 is centered on the upvote; each later step is the next block of
+    `4 * count` IDs below the previous one.
+
+    Args:
+        start_id: The upvoted item ID
+        count: Number of stories to collect
+        step: How many times the search range has been expanded
+
+    Returns:
+        Range of item IDs to scan
+    """
+    center = start_id - 4 * count * step
+    return range(max(center - 2 * count, 1), max(center + 2 * count, 1))
+
+
+def merge_id_ranges(ranges: list[range]) -> list[range]:
+    """
+    Merge ID ranges into sorted, non-overlapping ranges.
+
+    Args:
+        ranges: Ranges of item IDs, possibly overlapping
+
+    Returns:
+        Sorted list of disjoint ranges covering the same IDs
+    """
+    merged: list[range] = []
+    for r in sorted((r for r in ranges if r), key=lambda r: r.start):
+        if merged and r.start <= merged[-1].stop:
+            last = merged[-1]
+            merged[-1] = range(last.start, max(last.stop, r.stop))
+        else:
+            merged.append(r)
+    return merged
+
+
+def collect_neighbors(
+    upvotes: list[dict[str, Any]],
+    count: int = 1,
+    min_score: int = 3,
+    exclude_ids: set[int] | None = None,
+    chunk_size: int = 1000,
+    *,
+    done: dict[int, list[dict[str, Any]]] | None = None,
+    on_collected: Callable[[int, list[dict[str, Any]]], None] | None = None,
+) -> list[list[dict[str, Any]]]:
+    """
+    Get neighbor stories for all upvotes at once.
+
+    Each round merges the current ID windows of every upvote that still needs
+    neighbors into one deduplicated set of ranges, fetches every ID in it once,
+    and hands out stories to each upvote from the shared results. Upvotes that
+    are still short expand their window downwards in the next round.
+
+    IDs are fetched in ascending order, so an upvote's window is handed out as
+    soon as the chunk covering its last ID is in. That lets `on_collected`
+    checkpoint upvotes continuously rather than only at the end of a round.
+
+    Args:
+        upvotes: Upvoted items to find neighbors for
+        count: Number of stories to collect per upvote
+        min_score: Minimum score threshold for stories
+        exclude_ids: Item IDs that must not be used as neighbors (e.g. upvotes)
+        chunk_size: Number of IDs to fetch per batch
+        done: Neighbors already collected by an earlier run, by upvote ID; these
+            upvotes are skipped
+        on_collected: Called with the upvote ID and its neighbors as each upvote finishes
+
+    Returns:
+        List of neighboring stories for each upvote, in the same order as `upvotes`
+    """
+    exclude_ids = exclude_ids or set()
+    done = done or {}
+    stories: dict[int, dict[str, Any] | None] = {}
+    collected: list[list[dict[str, Any]]] = [done.get(upvote["id"], []) for upvote in upvotes]
+    pending = [i for i, upvote in enumerate(upvotes) if upvote["id"] not in done]
+    step = 0
+
+    def hand_out(i: int, window: range) -> None:
+        for item_id in window:
+            if len(collected[i]) >= count:
+                break
+            item = stories.get(item_id)
+            if item is not None and item_id not in exclude_ids:
+                collected[i].append(item)
+
+        # Stop expanding once a window has run into the first item ID
+        if on_collected is not None and (len(collected[i]) >= count or window.start <= 1):
+            on_collected(upvotes[i]["id"], collected[i])
+
+    while pending:
+        windows = {i: neighbor_window(upvotes[i]["id"], count, step) for i in pending}
+        planned = merge_id_ranges(list(windows.values()))
+        target_ids = [item_id for r in planned for item_id in r if item_id not in stories]
+
+        # Upvotes in the order their windows are complete
+        by_end = sorted(pending, key=lambda i: windows[i].stop)
+        ready = 0
+
+        for offset in tqdm(
+            range(0, len(target_ids), chunk_size), desc=f"Neighbor IDs (step {step})"
+        ):
+            chunk = target_ids[offset : offset + chunk_size]
+            failed: set[int] = set()
+            results = process_items(chunk, min_score, failed=failed)
+            # Items that couldn't be fetched are skipped for now, and retried if a later
+            # round's windows cover them again
+            stories.update(
+                (item_id, item)
+                for item_id, item in zip(chunk, results, strict=True)
+                if item_id not in failed
+            )
+
+            while ready < len(by_end) and windows[by_end[ready]].stop <= chunk[-1] + 1:
+                hand_out(by_end[ready], windows[by_end[ready]])
+                ready += 1
+
+        for i in by_end[ready:]:
+            hand_out(i, windows[i])
 
+        pending = [i for i in pending if len(collected[i]) < count and windows[i].start > 1]
+        step += 1
 
-def sample_iterator(upvotes, neighbors) -> Any:  # Actually returns Iterator[Dict[str, Any]]
+    return collected
+
+
+def sample_iterator(upvotes, neighbors) -> Iterator[dict[str, Any]]:
     """
     Iterator yielding samples for dataset creation.
 
@@ -211,45 +481,157 @@ def sample_iterator(upvotes, neighbors) -> Any:  # Actually returns Iterator[Dic
         yield {**{"label": 1}, **pluck(item, keys)}
     for item in neighbors:
         if isinstance(item, dict):
-            yield {**{"label": 0}, **pluck(item, keys)}
+            # API items carry the story link as "url"
+            yield {**{"label": 0}, **pluck({"link": item.get("url"), **item}, keys)}
+
+
+def iter_neighbors(neighbors) -> Iterator[dict[str, Any]]:
+    """
+    Iterate over neighbor items, whether given as a flat list or a list of lists.
+
+    Yields:
+        Neighbor item dictionaries
+    """
+    for item in neighbors:
+        if isinstance(item, list):
+            yield from (n for n in item if isinstance(n, dict))
+        elif isinstance(item, dict):
+            yield item
+
+
+sample_schema = pa.schema(
+    [
+        ("label", pa.int64()),
+        ("id", pa.int64()),
+        ("link", pa.string()),
+        ("title", pa.string()),
+        ("time", pa.float64()),
+        ("host", pa.string()),
+        ("text", pa.string()),
+    ]
+)
+
+# Vectorized equivalent of get_host: the netloc of URLs that have a scheme
+host_pattern = r"^[A-Za-z][A-Za-z0-9+.-]*://(?P<host>[^/?#]*)"
+
 
+def samples_to_record_batch(samples: list[dict[str, Any]]) -> pa.RecordBatch:
+    """
+    Convert a batch of samples into an Arrow record batch, deriving `host` and `text`.
+
+    Args:
+        samples: Samples as yielded by `sample_iterator`
+
+    Returns:
+        Record batch with the columns of `sample_schema`
+    """
+    columns = {
+        name: pa.array([sample.get(name) for sample in samples], sample_schema.field(name).type)
+        for name in ["label", "id", "link", "title", "time"]
+    }
+
+    host = pc.fill_null(pc.struct_field(pc.extract_regex(columns["link"], host_pattern), [0]), "")
+    with_source = pc.binary_join_element_wise(columns["title"], host, "\nSource: ")
+    text = pc.if_else(pc.equal(host, ""), columns["title"], with_source)
+
+    return pa.RecordBatch.from_pydict({**columns, "host": host, "text": text}, schema=sample_schema)
+
+
+def write_samples(samples: Iterator[dict[str, Any]], path: str, batch_size: int = 10_000) -> int:
+    """
+    Stream samples into an Arrow file, one record batch at a time.
+
+    Args:
+        samples: Samples as yielded by `sample_iterator`
+        path: Arrow file to write
+        batch_size: Number of samples per record batch
 
-def create_and_process_dataset(upvotes, neighbors):
-    """Create and process the dataset."""
-    # Ensure neighbors is a list of dictionaries
-    if isinstance(neighbors, list) and all(isinstance(n, dict) for n in neighbors):
-        neighbors_list = neighbors
+    Returns:
+        Number of samples written
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    written = 0
+
+    with pa.OSFile(path, "wb") as sink, pa.ipc.new_stream(sink, sample_schema) as writer:
+        while batch := list(itertools.islice(samples, batch_size)):
+            writer.write_batch(samples_to_record_batch(batch))
+            written += len(batch)
+
+    return written
+
+
+def create_and_process_dataset(
+    upvotes,
+    neighbors,
+    push_to_hub: str | None = None,
+    *,
+    username: str | None = None,
+    dedup: bool = True,
+):
+    """
+    Create and process the dataset.
+
+    Samples are streamed straight into an Arrow file that the dataset then
+    memory-maps, so memory use stays flat however many neighbors there are.
+    Reposts and near-duplicate stories are collapsed on the way (see
+    `magpie.dedup`), before the train/test split. Items keep the split they had
+    in the previous version and new ones are assigned by a hash of their ID
+    (see `datastore.split_by_id`), so the split is stable as the dataset grows.
+    The result is saved locally
+    as a version keyed by the hash of the samples; if that version already
+    exists it is reused as is.
+
+    Args:
+        upvotes: Upvoted items (label 1)
+        neighbors: Neighbor items (label 0), as a flat list or a list of lists
+        push_to_hub: Hub dataset repository to push to, if any; datasets of users
+            other than `default_username` are pushed to `<repo>-<username>`
+        username: Whose dataset this is; users other than `default_username` get
+            their own dataset directory (see `datastore.user_dir`)
+        dedup: Whether to collapse reposts and near-duplicates
+    """
+    root = None
+    samples_path = os.path.join(cache_dir, "samples.arrow")
+    if username is not None and username != default_username:
+        root = user_dir(username)
+        samples_path = os.path.join(cache_dir, f"samples-{username}.arrow")
+        push_to_hub = push_to_hub and f"{push_to_hub}-{username}"
+
+    samples = sample_iterator(upvotes, iter_neighbors(neighbors))
+    deduplicator = Deduplicator() if dedup else None
+    if deduplicator is not None:
+        # Upvotes come first, so the copy that is kept is the upvote
+        samples = deduplicator.filter(samples)
+
+    with metrics.timer("dataset.write_samples"):
+        rows = write_samples(samples, samples_path)
+    metrics.gauge("dataset.rows", rows)
+    if deduplicator is not None:
+        deduplicator.report()
+    version = content_hash(samples_path)
+
+    if has_version(version, root):
+        print(f"Dataset unchanged, reusing version {version}")
+        set_latest_version(version, root)
     else:
-        # If neighbors is not already a flat list of dictionaries, flatten it
-        neighbors_list = []
-        if isinstance(neighbors, list):
-            for item in neighbors:
-                if isinstance(item, list):
-                    # If it's a list of lists, extend the list
-                    neighbors_list.extend([n for n in item if isinstance(n, dict)])
-                elif isinstance(item, dict):
-                    # If it's already a dict, append it
-                    neighbors_list.append(item)
-    
-    samples = list(sample_iterator(upvotes, neighbors_list))
-    samples_df = pd.DataFrame(samples)
-
-    dataset = Dataset.from_pandas(samples_df)
-    dataset = dataset.map(lambda d: {"host": get_host(d["link"])})
-
-    text_dataset = dataset.map(
-        lambda d: {
-            "text": f"{d['title']}\nSource: {d['host'].decode()}" if d.get("host") else d["title"],
-            **d,
-        }
-    )
+        from datasets import Dataset
+
+        previous_version = latest_version(root)
+        previous = (
+            load_version(previous_version, root)
+            if previous_version is not None and has_version(previous_version, root)
+            else None
+        )
 
-    text_dataset = text_dataset.shuffle(seed=96).train_test_split(0.2, seed=42)
+        with metrics.timer("dataset.split_and_save"):
+            text_dataset = split_by_id(Dataset.from_file(samples_path), previous)
+            path = save_version(text_dataset, version, root)
+        print(f"Saved dataset version {version} to {path}")
 
-    # Only push to hub when running as main script, not during testing
-    text_dataset.push_to_hub("diwank/hn-upvote-data")
+    if push_to_hub and push_version(push_to_hub, version, root):
+        print(f"Pushed dataset version {version} to {push_to_hub}")
 
-    return text_dataset
+    return load_version(version, root)
 
 
 def get_neighbors_for_upvote(item: dict[str, Any]) -> list[dict[str, Any]]:
@@ -265,38 +647,108 @@ def get_neighbors_for_upvote(item: dict[str, Any]) -> list[dict[str, Any]]:
     return get_neighbor_stories(item["id"], 1)
 
 
-def run(clear_cache: bool = False):
+def find_neighbors(
+    upvotes: list[dict[str, Any]],
+    neighbor_source: str = "window",
+    neighbors_by: str = "id",
+    *,
+    exclude_ids: set[int],
+    journal: Journal,
+) -> list[list[dict[str, Any]]]:
     """
-    Run the dataset preparation pipeline.
+    Find one neighbor story per upvote, with either neighbor source.
 
     Args:
-        clear_cache: Whether to clear the cache before starting
+        upvotes: Upvoted items to find neighbors for
+        neighbor_source: "window" to probe IDs around each upvote, "index" to
+            harvest the upvotes' ID range into the local story index and draw from it,
+            or "search" to backfill the index from the search API first
+        neighbors_by: With the "index" and "search" sources, match neighbors by "id" or "time"
+        exclude_ids: Item IDs that must not be used as neighbors
+        journal: Progress journal; with the "window" source, upvotes it has
+            neighbors for are skipped and newly finished ones are recorded
+
+    Returns:
+        Neighboring stories for each upvote
     """
-    if clear_cache:
-        print("Clearing cache...")
-        import shutil
+    if neighbor_source in ("index", "search"):
+        from magpie.harvest import StoryIndex, harvest_around, neighbors_from_index
 
-        if os.path.exists(cache_dir):
-            shutil.rmtree(cache_dir)
-            os.makedirs(cache_dir, exist_ok=True)
+        # The story index remembers which ranges it has scanned, so it resumes by itself
+        story_index = StoryIndex.load()
+        if neighbor_source == "search":
+            from magpie.search import backfill_around
 
-    # Ensure cache directory exists
-    os.makedirs(cache_dir, exist_ok=True)
+            print("Backfilling the story index from the search API...")
+            backfill_around(story_index, upvotes)
 
-    diwank_upvotes = download_upvotes("diwank")
+        # Fills whatever the search results didn't cover, one item at a time
+        print("Harvesting stories into the local index (skipped if already covered)...")
+        harvest_around(story_index, upvotes)
+        return neighbors_from_index(
+            story_index, upvotes, 1, by=neighbors_by, exclude_ids=exclude_ids
+        )
 
     print("Fetching neighbor stories (using cache when available)...")
-    # Parallelize the collection of neighbors, with rate limiting
-    neighbors = Parallel(n_jobs=5)(
-        delayed(get_neighbors_for_upvote)(item) for item in tqdm(diwank_upvotes)
+    done = journal.get("neighbors")
+    if done:
+        print(f"Skipping {len(done)} upvotes that already have neighbors")
+
+    # Plan all upvotes' ID windows together so each item is fetched only once
+    return collect_neighbors(
+        upvotes,
+        1,
+        exclude_ids=exclude_ids,
+        done=done,
+        on_collected=lambda upvote_id, items: journal.record("neighbors", upvote_id, items),
     )
 
-    # Remove neighbors already upvoted
-    upvoted_ids = {upvote["id"] for upvote in diwank_upvotes}
+
+def download_all_upvotes(
+    usernames: list[str], incremental: bool = True, *, journal: Journal
+) -> dict[str, list[dict[str, Any]]]:
+    """
+    Download several users' upvotes, scraping each user's pages concurrently.
+
+    Each user's pages are still scraped one at a time with the polite delay in
+    between. Users whose upvotes the journal already has are skipped.
+
+    Args:
+        usernames: HackerNews usernames
+        incremental: Whether to stop at already-known upvotes instead of scraping every page
+        journal: Progress journal; each user's upvotes are recorded as they finish
+
+    Returns:
+        Upvotes by username, in the order of `usernames`
+    """
+    pending = [username for username in usernames if not journal.done(f"upvotes.{username}")]
+    if pending:
+        with ThreadPoolExecutor(max_workers=len(pending)) as pool:
+            futures = {
+                pool.submit(download_upvotes, username, incremental): username
+                for username in pending
+            }
+            for future in as_completed(futures):
+                journal.finish(f"upvotes.{futures[future]}", future.result())
+
+    return {username: journal.result(f"upvotes.{username}") for username in usernames}
+
+
+def filter_neighbors(neighbors, upvoted_ids: set[int]) -> list[dict[str, Any]]:
+    """
+    Flatten neighbors and remove any that were upvoted.
+
+    Args:
+        neighbors: Neighbor items, as a flat list or a list of lists
+        upvoted_ids: IDs of the upvoted items
+
+    Returns:
+        Neighbor items
+    """
     filtered_neighbors = []
-    
+
     # Handle items whether neighbors is a list of lists or a flat list
-    for items in tqdm(neighbors):
+    for items in neighbors:
         if isinstance(items, list):
             # It's a list of items
             for item in items:
@@ -307,21 +759,206 @@ def run(clear_cache: bool = False):
             if items.get("id") not in upvoted_ids:
                 filtered_neighbors.append(items)
 
-    # Create dataset
-    return create_and_process_dataset(diwank_upvotes, filtered_neighbors)
+    return filtered_neighbors
 
 
-# Only assert in the main execution path, not when being imported for tests
-if __name__ == "__main__":
+def run(
+    clear_cache: bool = False,
+    neighbor_source: str = "window",
+    neighbors_by: str = "id",
+    incremental: bool = True,
+    push_to_hub: str | None = None,
+    *,
+    resume: bool = True,
+    usernames: list[str] | None = None,
+    dedup: bool = True,
+):
+    """
+    Run the dataset preparation pipeline.
+
+    Several users' datasets are built from one shared pool of neighbors: their
+    upvote pages are scraped concurrently, neighbors are found once for the
+    union of their upvotes, and each user's dataset pairs their own upvotes
+    with the neighbors of those upvotes. An extra user only adds their upvote
+    pages and the neighbors of upvotes nobody else has.
+
+    Progress is journaled to `journal.jsonl` in the cache dir, so a run that is
+    interrupted resumes at the stage (and, while collecting neighbors, the
+    upvote) where it stopped.
+
+    Args:
+        clear_cache: Whether to clear the cache before starting
+        neighbor_source: "window" to probe IDs around each upvote, "index" to
+            harvest the upvotes' ID range into the local story index and draw from it,
+            or "search" to backfill the index from the search API first
+        neighbors_by: With the "index" and "search" sources, match neighbors by "id" or "time"
+        incremental: Whether to only scrape upvote pages until already-known upvotes
+        push_to_hub: Hub dataset repository to push the prepared dataset to, if any
+        resume: Whether to resume from the journal of an interrupted run
+        usernames: Users to build datasets for (defaults to `default_username`)
+        dedup: Whether to collapse reposts and near-duplicates before the split
+
+    Returns:
+        The prepared dataset of each user, by username
+    """
+    usernames = usernames or [default_username]
+    journal_path = os.path.join(cache_dir, "journal.jsonl")
+    if clear_cache or not resume:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(journal_path)
+    if clear_cache:
+        print("Clearing cache...")
+        fscache.clear(cache_dir)
+
+    # Ensure cache directory exists
+    os.makedirs(cache_dir, exist_ok=True)
+
+    journal = Journal(
+        journal_path,
+        key=f"{hn_api_url} {neighbor_source} {neighbors_by} {','.join(sorted(usernames))}",
+    )
+    if journal.resumed:
+        print(f"Resuming interrupted run from {journal_path}")
+
+    with metrics.timer("stage.download_upvotes"):
+        upvotes_by_user = download_all_upvotes(usernames, incremental, journal=journal)
+
+    # Upvotes shared by several users only need their neighbors found once
+    all_upvotes: dict[int, dict[str, Any]] = {}
+    for user_upvotes in upvotes_by_user.values():
+        for upvote in user_upvotes:
+            all_upvotes.setdefault(upvote["id"], upvote)
+    metrics.gauge("upvotes", len(all_upvotes))
+
+    with metrics.timer("stage.neighbors"):
+        neighbors = find_neighbors(
+            list(all_upvotes.values()),
+            neighbor_source,
+            neighbors_by,
+            exclude_ids=set(all_upvotes),
+            journal=journal,
+        )
+    neighbors_by_upvote = dict(zip(all_upvotes, neighbors, strict=True))
+    metrics.gauge("neighbors", len(filter_neighbors(neighbors, set(all_upvotes))))
+
+    # Create each user's dataset from the shared neighbors
+    datasets = {}
+    with metrics.timer("stage.create_dataset"):
+        for username, user_upvotes in tqdm(upvotes_by_user.items(), desc="Datasets"):
+            user_neighbors = filter_neighbors(
+                [neighbors_by_upvote[upvote["id"]] for upvote in user_upvotes],
+                {upvote["id"] for upvote in user_upvotes},
+            )
+            datasets[username] = create_and_process_dataset(
+                user_upvotes, user_neighbors, push_to_hub, username=username, dedup=dedup
+            )
+    journal.complete()
+    return datasets
+
+
+def main(argv: list[str] | None = None) -> None:
+    """
+    Command line entry point for dataset preparation.
+
+    Args:
+        argv: Command line arguments (defaults to `sys.argv[1:]`)
+    """
     import argparse
 
     parser = argparse.ArgumentParser(description="Prepare HackerNews upvote dataset with caching")
     parser.add_argument(
         "--clear-cache", action="store_true", help="Clear the cache before fetching data"
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        "--requests-per-second",
+        type=float,
+        default=10.0,
+        help="Global rate limit for HackerNews API requests",
+    )
+    parser.add_argument(
+        "--max-in-flight", type=int, default=20, help="Maximum concurrent API requests"
+    )
+    parser.add_argument(
+        "--full-refresh",
+        action="store_true",
+        help="Re-scrape every upvote page instead of stopping at already-known upvotes",
+    )
+    parser.add_argument(
+        "--push-to-hub",
+        nargs="?",
+        const="diwank/hn-upvote-data",
+        default=None,
+        metavar="REPO",
+        help="Also push the prepared dataset to the hub (default repo: diwank/hn-upvote-data)",
+    )
+    parser.add_argument(
+        "--immutable-after-days",
+        type=float,
+        default=14,
+        help="Cached items older than this when fetched are never re-fetched",
+    )
+    parser.add_argument(
+        "--neighbor-source",
+        choices=["window", "index", "search"],
+        default="window",
+        help="Probe IDs around each upvote, or sample from the story index, filled by "
+        "harvesting item IDs or by bulk search (with harvesting as the fallback for gaps)",
+    )
+    parser.add_argument(
+        "--neighbors-by",
+        choices=["id", "time"],
+        default="id",
+        help="How to match neighbors when sampling from the story index",
+    )
+    parser.add_argument(
+        "--users",
+        nargs="+",
+        default=[default_username],
+        metavar="USERNAME",
+        help="Build a dataset for each of these users, sharing one pool of neighbors",
+    )
+    parser.add_argument(
+        "--keep-duplicates",
+        action="store_true",
+        help="Keep reposts and near-duplicate stories instead of collapsing them",
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Start from scratch instead of resuming an interrupted run",
+    )
+    add_backend_argument(parser)
+    add_report_arguments(parser)
+    args = parser.parse_args(argv)
+    fetcher.configure(
+        requests_per_second=args.requests_per_second, max_in_flight=args.max_in_flight
+    )
+    fscache.configure(args.cache_backend, cache_dir)
+    item_ttl.immutable_after = args.immutable_after_days * 86400
+
+    # Entries kept fresh by a running change feed follower never expire
+    from magpie.refresh import FeedState
+
+    item_ttl.synced_since = FeedState.load().synced_since()
 
-    assert hn_user_cookie, "Need to find and set the hackernews cookie as HN_USER_COOKIE env var"
+    for username in args.users:
+        assert user_cookie(username), (
+            f"Need to find and set the hackernews cookie for '{username}' as the "
+            "HN_USER_COOKIE (or HN_USER_COOKIE_<USERNAME>) env var"
+        )
 
-    hn_user_cookie = str(hn_user_cookie) if hn_user_cookie else "test_cookie"  # Default for tests
-    run(clear_cache=args.clear_cache)
+    with recording("prepare", args):
+        run(
+            clear_cache=args.clear_cache,
+            neighbor_source=args.neighbor_source,
+            neighbors_by=args.neighbors_by,
+            incremental=not args.full_refresh,
+            push_to_hub=args.push_to_hub,
+            resume=not args.restart,
+            usernames=args.users,
+            dedup=not args.keep_duplicates,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Compact item records and the JSON codec used for cached items.
+
+Firebase items carry much more than the pipeline uses (popular stories have
+`kids` arrays with hundreds of comment IDs), so items are trimmed to
+`item_fields` as soon as they are fetched, before they are cached or passed
+on. Stories held in bulk, like the story index, are kept as `Story` records
+with `__slots__` instead of dicts. JSON goes through orjson.
+"""
+
+from typing import Any
+
+import orjson
+
+# The only item fields the pipeline reads
+item_fields = ("id", "type", "by", "time", "title", "url", "score", "dead")
+
+
+def trim_item(item: Any) -> Any:
+    """
+    Drop the fields of an API item that the pipeline never reads.
+
+    Args:
+        item: Item from the HackerNews API (None for missing items)
+
+    Returns:
+        The item with only `item_fields`, or the input unchanged if it isn't a dict
+    """
+    if not isinstance(item, dict):
+        return item
+    return {k: item[k] for k in item_fields if k in item}
+
+
+def dumps(obj: Any) -> str:
+    """Serialize to compact JSON."""
+    return orjson.dumps(obj).decode("utf-8")
+
+
+def loads(content: str | bytes) -> Any:
+    """Deserialize JSON."""
+    return orjson.loads(content)
+
+
+class Story:
+    """A story trimmed to the fields the pipeline uses, without a per-instance dict."""
+
+    __slots__ = item_fields
+
+    def __init__(
+        self,
+        id: int,
+        type: str = "story",
+        *,
+        by: str | None = None,
+        time: float | None = None,
+        title: str | None = None,
+        url: str | None = None,
+        score: int = 0,
+        dead: bool = False,
+    ):
+        self.id = id
+        self.type = type
+        self.by = by
+        self.time = time
+        self.title = title
+        self.url = url
+        self.score = score
+        self.dead = dead
+
+    @classmethod
+    def from_item(cls, item: dict[str, Any]) -> "Story":
+        """Create a record from an API item, ignoring fields it doesn't keep."""
+        return cls(**trim_item(item))
+
+    def as_item(self) -> dict[str, Any]:
+        """Convert back to an API-style item dict, omitting unset fields."""
+        item = {"id": self.id, "type": self.type}
+        for field in item_fields[2:]:
+            value = getattr(self, field)
+            if value is not None and value is not False:
+                item[field] = value
+        return item
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Story):
+            return NotImplemented
+        return all(getattr(self, k) == getattr(other, k) for k in item_fields)
+
+    def __hash__(self) -> int:
+        return hash(self.id)
+
+    def __repr__(self) -> str:
+        return f"Story(id={self.id!r}, title={self.title!r})"
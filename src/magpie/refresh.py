@@ -0,0 +1,221 @@
+"""
+Keep the item cache fresh by following the HackerNews change feed.
+
+The Firebase API publishes `/v0/updates.json`, the IDs of recently changed
+items. Each poll refreshes (or just invalidates) the cached entries among
+them and leaves everything else alone, so keeping the cache fresh costs one
+request per poll plus one per changed item that is actually cached.
+
+The follower records when its current unbroken run of polls started. As long
+as it keeps polling, entries saved since then are known to be fresh and never
+expire (see `ItemAgeTTL.synced_since`). If it stops for longer than
+`max_gap`, changes may have been missed, so a new run starts and older
+entries fall back to age-based expiry.
+"""
+
+import math
+import os
+import time
+from typing import Any
+
+from magpie.fetch import FetchError, fetcher
+from magpie.fscache import add_backend_argument, fscache, state_files
+from magpie.metrics import metrics
+from magpie.prepare_dataset import cache_dir, hn_api_url
+from magpie.records import dumps, trim_item
+
+state_path = os.path.join(cache_dir, "changefeed.json")
+
+
+class FeedState:
+    """When the current unbroken run of change feed polls started, and the latest poll."""
+
+    def __init__(self, path: str = state_path, max_gap: float = 300):
+        self.path = path
+        self.max_gap = max_gap
+        self.since: float | None = None
+        self.polled: float | None = None
+
+    @classmethod
+    def load(cls, path: str = state_path) -> "FeedState":
+        """
+        Load the follower's state, or create an empty one.
+
+        Args:
+            path: Path to the state file
+
+        Returns:
+            The feed state
+        """
+        state = cls(path)
+        try:
+            data = state_files.load_json(path)
+        except FileNotFoundError:
+            return state
+
+        state.max_gap = data["max_gap"]
+        state.since = data["since"]
+        state.polled = data["polled"]
+        return state
+
+    def save(self) -> None:
+        """Persist the state, so other processes can tell how far the cache is synced."""
+        state_files.save(
+            self.path, dumps({"max_gap": self.max_gap, "since": self.since, "polled": self.polled})
+        )
+
+    def mark_polled(self, started: float) -> None:
+        """
+        Record a successful poll, starting a new run if the previous one lapsed.
+
+        Args:
+            started: Time the poll started, before the change feed was fetched
+        """
+        if self.polled is None or started - self.polled > self.max_gap:
+            self.since = started
+        self.polled = started
+
+    def synced_since(self, now: float | None = None) -> float:
+        """
+        Get the time since which cached items are kept fresh by the follower.
+
+        Args:
+            now: Reference time (defaults to the current time)
+
+        Returns:
+            Start of the current run, or infinity if the follower isn't running
+        """
+        now = time.time() if now is None else now
+        if self.since is None or self.polled is None or now - self.polled > self.max_gap:
+            return math.inf
+        return self.since
+
+
+def get_changed_ids() -> list[int]:
+    """Get the IDs of recently changed items from the change feed."""
+    updates: dict[str, Any] = (
+        fetcher.fetch_json([f"{hn_api_url}/updates.json"], strict=True)[0] or {}
+    )
+    return updates.get("items", [])
+
+
+def poll(state: FeedState, *, invalidate_only: bool = False) -> int:
+    """
+    Run one poll: refresh or invalidate the cached items that changed.
+
+    Args:
+        state: Feed state, updated and saved when the poll succeeds
+        invalidate_only: Delete changed entries instead of fetching them again
+
+    Returns:
+        Number of cache entries refreshed or invalidated
+    """
+    started = time.time()
+    changed = get_changed_ids()
+
+    cache_files = {
+        item_id: fscache.path(f"{hn_api_url}/item/{item_id}.json", cache_dir=cache_dir)
+        for item_id in changed
+    }
+    # Only items that are already cached matter; the rest are fetched when first needed
+    cached = fscache.backend.read_many(list(cache_files.values()))
+    stale = [item_id for item_id, cache_file in cache_files.items() if cache_file in cached]
+    metrics.count("refresh.polls")
+    metrics.count("refresh.changed", len(changed))
+
+    if invalidate_only:
+        for item_id in stale:
+            fscache.backend.delete(cache_files[item_id])
+        metrics.count("refresh.invalidated", len(stale))
+    else:
+        urls = {item_id: f"{hn_api_url}/item/{item_id}.json" for item_id in stale}
+        failed: set[str] = set()
+        fetched = fetcher.fetch_json(list(urls.values()), failed=failed)
+        fscache.save_many(
+            {
+                cache_files[item_id]: dumps(trim_item(item))
+                for item_id, item in zip(stale, fetched, strict=True)
+                if urls[item_id] not in failed
+            }
+        )
+        # Changed items that couldn't be fetched mustn't look fresh: drop them instead
+        for item_id, url in urls.items():
+            if url in failed:
+                fscache.backend.delete(cache_files[item_id])
+        metrics.count("refresh.refreshed", len(stale))
+
+    state.mark_polled(started)
+    state.save()
+    return len(stale)
+
+
+def run(
+    interval: float = 60,
+    *,
+    max_gap: float = 300,
+    invalidate_only: bool = False,
+    once: bool = False,
+) -> None:
+    """
+    Follow the change feed and keep the item cache fresh.
+
+    Args:
+        interval: Seconds between polls
+        max_gap: Longest time between polls before changes may have been missed
+        invalidate_only: Delete changed entries instead of fetching them again
+        once: Run a single poll and exit
+    """
+    state = FeedState.load()
+    state.max_gap = max_gap
+
+    while True:
+        try:
+            count = poll(state, invalidate_only=invalidate_only)
+        except FetchError as e:
+            # Try again on the next poll; a long enough outage starts a new run
+            print(f"Poll failed: {e}")
+        else:
+            print(f"{'Invalidated' if invalidate_only else 'Refreshed'} {count} cached items")
+
+        if once:
+            return
+        time.sleep(interval)
+
+
+def main(argv: list[str] | None = None) -> None:
+    """
+    Command line entry point for the change feed follower.
+
+    Args:
+        argv: Command line arguments (defaults to `sys.argv[1:]`)
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Keep the item cache fresh from the change feed")
+    parser.add_argument("--interval", type=float, default=60, help="Seconds between polls")
+    parser.add_argument(
+        "--max-gap",
+        type=float,
+        default=300,
+        help="Seconds without a poll after which changes may have been missed",
+    )
+    parser.add_argument(
+        "--invalidate-only",
+        action="store_true",
+        help="Delete changed cache entries instead of fetching them again",
+    )
+    parser.add_argument("--once", action="store_true", help="Poll once and exit")
+    add_backend_argument(parser)
+    args = parser.parse_args(argv)
+    fscache.configure(args.cache_backend, cache_dir)
+
+    run(
+        interval=args.interval,
+        max_gap=args.max_gap,
+        invalidate_only=args.invalidate_only,
+        once=args.once,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""
+Bulk story backfill through the Algolia HackerNews search API.
+
+Harvesting an ID range from the Firebase API takes one request per item,
+comments included. The search API returns up to a thousand stories per
+request, already filtered by creation time and points, so backfilling months
+of stories takes thousands of requests instead of millions.
+
+Stories are written to the item cache in the same trimmed format as items
+fetched from Firebase, and added to the story index. The index records which
+time ranges the search fully enumerated, so re-runs only search what is left,
+and marks the ID ranges they span as scanned, so `harvest_around` only fetches
+item by item where the search results left a gap.
+"""
+
+import bisect
+import os
+import time
+from collections.abc import Iterator
+from typing import Any
+from urllib.parse import urlencode
+
+from tqdm.auto import tqdm
+
+from magpie.fetch import fetcher
+from magpie.fscache import add_backend_argument, fscache
+from magpie.harvest import StoryIndex
+from magpie.metrics import metrics
+from magpie.prepare_dataset import cache_dir, hn_api_url
+from magpie.records import dumps, trim_item
+
+# Overridable so tests and benchmarks can use a local stand-in (see benchmarks/fake_hn.py)
+search_api_url = os.environ.get("HN_SEARCH_URL", "https://hn.algolia.com/api/v1")
+
+# The search API never returns more than this many hits per request
+max_page_size = 1000
+
+
+def hit_to_item(hit: dict[str, Any]) -> dict[str, Any]:
+    """
+    Convert a search hit to a trimmed Firebase-style story item.
+
+    Args:
+        hit: Hit from the `search_by_date` endpoint
+
+    Returns:
+        The story in the item cache format
+    """
+    return trim_item(
+        {
+            "id": int(hit["objectID"]),
+            "type": "story",
+            "by": hit.get("author"),
+            "time": hit["created_at_i"],
+            "title": hit.get("title"),
+            "url": hit.get("url") or None,
+            "score": hit.get("points") or 0,
+        }
+    )
+
+
+def search_url(start_time: int, end_time: int, min_score: int, page_size: int) -> str:
+    """Build a `search_by_date` query for stories created in `[start_time, end_time]`."""
+    filters = f"created_at_i>={start_time},created_at_i<={end_time},points>={min_score}"
+    query = {"tags": "story", "numericFilters": filters, "hitsPerPage": page_size}
+    return f"{search_api_url}/search_by_date?{urlencode(query)}"
+
+
+def search_stories(
+    start_time: int,
+    end_time: int,
+    min_score: int = 3,
+    *,
+    slice_seconds: int = 86400,
+    page_size: int = max_page_size,
+    enumerated: list[tuple[int, int]] | None = None,
+) -> Iterator[list[dict[str, Any]]]:
+    """
+    Page through every story created in `[start_time, end_time)` with enough points.
+
+    The range is cut into slices that are queried concurrently. Results come
+    newest first, so a full page means there is more: the slice is queried
+    again up to the oldest time on that page, skipping stories already seen.
+
+    Args:
+        start_time: Unix time of the oldest stories to return
+        end_time: Unix time to stop before
+        min_score: Minimum story points
+        slice_seconds: Width of the time slices queried in parallel
+        page_size: Hits per request
+        enumerated: If given, the `(start, inclusive end)` times of every slice
+            whose stories were all returned are appended to it. Slices with a
+            failed request, or with more same-second stories than fit on a page,
+            are left out.
+
+    Yields:
+        Batches of trimmed story items
+    """
+    # Each slice is (start, inclusive end)
+    slices = [
+        (start, min(start + slice_seconds, end_time) - 1)
+        for start in range(start_time, end_time, slice_seconds)
+    ]
+    slice_ends = dict(slices)
+    seen: set[int] = set()
+
+    with tqdm(total=len(slices), desc="Searching stories") as progress:
+        while slices:
+            pages = fetcher.fetch_json(
+                [search_url(start, end, min_score, page_size) for start, end in slices]
+            )
+            metrics.count("search.requests", len(pages))
+
+            remaining = []
+            for (start, _), page in zip(slices, pages, strict=True):
+                hits = page.get("hits", []) if page else []
+                items = [hit_to_item(hit) for hit in hits]
+                new_items = [item for item in items if item["id"] not in seen]
+                seen.update(item["id"] for item in new_items)
+                if new_items:
+                    yield new_items
+
+                # A full page that still found new stories may have more below its oldest time
+                full = len(hits) >= page_size
+                if full and new_items:
+                    remaining.append((start, min(item["time"] for item in items)))
+                    continue
+
+                # A failed request or a full page of stories already seen leaves some out
+                if enumerated is not None and page is not None and not full:
+                    enumerated.append((start, slice_ends[start]))
+                progress.update()
+            slices = remaining
+
+
+def cache_stories(stories: list[dict[str, Any]]) -> None:
+    """Save stories to the item cache, as if each had been fetched from Firebase."""
+    fscache.save_many(
+        {
+            fscache.path(f"{hn_api_url}/item/{story['id']}.json", cache_dir=cache_dir): dumps(story)
+            for story in stories
+        }
+    )
+
+
+def scanned_ranges(
+    stories: list[tuple[int, int]], enumerated: list[tuple[int, int]]
+) -> list[range]:
+    """
+    Get the item ID ranges a search covered completely.
+
+    Adjacent time slices that were fully enumerated are merged into runs, and
+    each run covers the IDs from its oldest to its newest story. Item IDs grow
+    with creation time, so every story in between was returned. IDs between
+    runs are left out.
+
+    Args:
+        stories: `(time, id)` of every story the search returned
+        enumerated: `(start, inclusive end)` times of the fully enumerated slices
+
+    Returns:
+        Item ID ranges to mark as scanned
+    """
+    runs: list[list[int]] = []
+    for start, end in sorted(enumerated):
+        if runs and runs[-1][1] + 1 == start:
+            runs[-1][1] = end
+        else:
+            runs.append([start, end])
+
+    stories = sorted(stories)
+    ranges = []
+    for start, end in runs:
+        lo = bisect.bisect_left(stories, (start,))
+        hi = bisect.bisect_left(stories, (end + 1,))
+        ids = [item_id for _, item_id in stories[lo:hi]]
+        if ids:
+            ranges.append(range(min(ids), max(ids) + 1))
+    return ranges
+
+
+def backfill(
+    index: StoryIndex,
+    start_time: int,
+    end_time: int,
+    min_score: int = 3,
+    *,
+    slice_seconds: int = 86400,
+) -> int:
+    """
+    Add every story in a time range to the story index and the item cache.
+
+    Only the parts of the range no earlier backfill fully enumerated are
+    searched, so re-runs over a covered range make no requests. The ID ranges
+    spanned by fully enumerated time slices are marked as scanned (see
+    `scanned_ranges`), so per-item harvesting only covers what is left around
+    and between them.
+
+    Args:
+        index: Story index to fill
+        start_time: Unix time of the oldest stories to add
+        end_time: Unix time to stop before
+        min_score: Minimum story points
+        slice_seconds: Width of the time slices queried in parallel
+
+    Returns:
+        Number of stories added to the index
+    """
+    unsearched = index.unsearched_ranges(range(start_time, end_time))
+    if not unsearched:
+        return 0
+
+    before = len(index.stories)
+    found: list[tuple[int, int]] = []
+    enumerated: list[tuple[int, int]] = []
+
+    for times in unsearched:
+        for stories in search_stories(
+            times.start, times.stop, min_score, slice_seconds=slice_seconds, enumerated=enumerated
+        ):
+            cache_stories(stories)
+            index.add(stories)
+            found.extend((story["time"], story["id"]) for story in stories)
+    metrics.count("search.stories", len(found))
+
+    for start, end in enumerated:
+        index.mark_searched(range(start, end + 1))
+    for ids in scanned_ranges(found, enumerated):
+        index.mark_scanned(ids)
+    index.save()
+    return len(index.stories) - before
+
+
+def backfill_around(
+    index: StoryIndex,
+    upvotes: list[dict[str, Any]],
+    margin: float = 86400,
+    min_score: int = 3,
+) -> int:
+    """
+    Backfill the time range spanned by a set of upvotes, plus a margin on each side.
+
+    Time ranges an earlier backfill enumerated aren't searched again. Stories
+    newer than the last search are only looked for once an upvote is newer
+    too, so a re-run over the same upvotes makes no requests.
+
+    Args:
+        index: Story index to fill
+        upvotes: Upvoted items (with `time`)
+        margin: Seconds to add before the oldest and after the newest upvote
+        min_score: Minimum story points
+
+    Returns:
+        Number of stories added to the index
+    """
+    times = [upvote["time"] for upvote in upvotes if upvote.get("time")]
+    if not times:
+        return 0
+    start_time = int(min(times) - margin)
+    end_time = int(min(max(times) + margin, time.time()))
+    if index.searched and index.searched[-1].stop > max(times):
+        end_time = min(end_time, index.searched[-1].stop)
+    return backfill(index, start_time, end_time, min_score)
+
+
+def main(argv: list[str] | None = None) -> None:
+    """
+    Command line entry point for backfilling the story index through search.
+
+    Args:
+        argv: Command line arguments (defaults to `sys.argv[1:]`)
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Backfill the story index from HN search")
+    parser.add_argument("--days", type=float, default=730, help="How many days back to go")
+    parser.add_argument("--min-score", type=int, default=3, help="Minimum story points")
+    parser.add_argument(
+        "--slice-hours", type=float, default=24, help="Width of time slices queried in parallel"
+    )
+    add_backend_argument(parser)
+    args = parser.parse_args(argv)
+    fscache.configure(args.cache_backend, cache_dir)
+
+    story_index = StoryIndex.load()
+    end_time = int(time.time())
+    added = backfill(
+        story_index,
+        int(end_time - args.days * 86400),
+        end_time,
+        args.min_score,
+        slice_seconds=int(args.slice_hours * 3600),
+    )
+    print(f"Added {added} stories, index now holds {len(story_index.stories)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 """Train module for Magpie."""
 
-# Import all functions from model.py to make them available through the package
-from magpie.train.model import *  # noqa
+from magpie.train.model import train
+
+__all__ = ["train"]
@@ -1,7 +1,6 @@
 """Main entry point for train module."""
 
-# Import the module to run the training code
-import magpie.train.model
+from magpie.train.model import main
 
 if __name__ == "__main__":
-    print("Model training complete.")
+    main()
@@ -0,0 +1,229 @@
+"""
+On-disk cache of frozen encoder embeddings.
+
+Each unique text is run through the encoder once. Its vector is appended to a
+memory-mapped float32 file kept per (model, revision), with the text hashes in
+a parallel keys file, so retraining only has to embed texts it hasn't seen.
+"""
+
+import hashlib
+import json
+import os
+from collections.abc import Iterator
+
+import numpy as np
+
+from magpie.metrics import metrics
+
+embedding_dir = "./cache/embeddings"
+
+
+def text_key(text: str) -> str:
+    """Hash a text into its cache key."""
+    return hashlib.sha256(text.encode()).hexdigest()[:32]
+
+
+def resolve_revision(model_name: str, revision: str = "main") -> str:
+    """
+    Pin a model revision to the commit it currently points at.
+
+    Only the model config is fetched (or read from the local hub cache), so this
+    is cheap even when the encoder weights are large.
+
+    Args:
+        model_name: Hub model name or local path
+        revision: Branch, tag or commit
+
+    Returns:
+        The commit hash, or `revision` itself if it can't be resolved (e.g. local paths)
+    """
+    from transformers import AutoConfig
+
+    config = AutoConfig.from_pretrained(model_name, revision=revision)
+    return getattr(config, "_commit_hash", None) or revision
+
+
+class EmbeddingCache:
+    """Append-only, memory-mapped embedding store for one encoder revision."""
+
+    def __init__(self, model_name: str, revision: str, root: str | None = None):
+        self.path = os.path.join(
+            root or embedding_dir, f"{model_name.replace('/', '--')}@{revision}"
+        )
+        self.vectors_path = os.path.join(self.path, "vectors.f32")
+        self.keys_path = os.path.join(self.path, "keys.txt")
+        self.meta_path = os.path.join(self.path, "meta.json")
+
+        self.dim: int | None = None
+        self.rows: dict[str, int] = {}
+        self._vectors: np.memmap | None = None
+
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, encoding="utf-8") as f:
+                self.dim = json.load(f)["dim"]
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path, encoding="utf-8") as f:
+                for key in f.read().split():
+                    self.rows.setdefault(key, len(self.rows))
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __contains__(self, text: str) -> bool:
+        return text_key(text) in self.rows
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """All cached vectors, memory-mapped from disk."""
+        if self.dim is None or not self.rows:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        if self._vectors is None or len(self._vectors) != len(self.rows):
+            # Vectors are written before their keys, so any extra rows from a crash are ignored
+            self._vectors = np.memmap(
+                self.vectors_path, dtype=np.float32, mode="r", shape=(len(self.rows), self.dim)
+            )
+        return self._vectors
+
+    def missing(self, texts: list[str]) -> list[str]:
+        """
+        Find the texts that still need embedding.
+
+        Args:
+            texts: Texts to look up
+
+        Returns:
+            Unique uncached texts, in first-seen order
+        """
+        seen = set()
+        missing = []
+        for text in texts:
+            key = text_key(text)
+            if key not in self.rows and key not in seen:
+                seen.add(key)
+                missing.append(text)
+        return missing
+
+    def get(self, texts: list[str]) -> np.ndarray:
+        """
+        Look up the vectors for a list of texts.
+
+        Args:
+            texts: Texts to look up; all of them must be cached
+
+        Returns:
+            Array of shape (len(texts), dim)
+        """
+        rows = [self.rows[text_key(text)] for text in texts]
+        return np.asarray(self.vectors[rows])
+
+    def add(self, texts: list[str], vectors: np.ndarray) -> None:
+        """
+        Append vectors for texts that aren't cached yet.
+
+        Args:
+            texts: Unique, uncached texts
+            vectors: Their embeddings, shape (len(texts), dim)
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        assert vectors.shape[0] == len(texts)
+
+        if self.dim is None:
+            os.makedirs(self.path, exist_ok=True)
+            self.dim = int(vectors.shape[1])
+            with open(self.meta_path, "w", encoding="utf-8") as f:
+                json.dump({"dim": self.dim}, f)
+            # Drop anything left over from an interrupted first write
+            open(self.vectors_path, "wb").close()
+        assert vectors.shape[1] == self.dim
+
+        with open(self.vectors_path, "r+b") as f:
+            f.seek(len(self.rows) * self.dim * 4)
+            f.write(vectors.tobytes())
+            f.truncate()
+        with open(self.keys_path, "a", encoding="utf-8") as f:
+            for text in texts:
+                key = text_key(text)
+                self.rows[key] = len(self.rows)
+                f.write(f"{key}\n")
+
+
+class Encoder:
+    """Frozen transformer encoder producing mean-pooled sentence embeddings."""
+
+    def __init__(
+        self,
+        model_name: str,
+        revision: str = "main",
+        max_length: int = 256,
+        batch_size: int = 32,
+    ):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        self.torch = torch
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name, revision=revision)
+        self.model = AutoModel.from_pretrained(model_name, revision=revision).eval()
+        self.max_length = max_length
+        self.batch_size = batch_size
+
+    def __call__(self, texts: list[str]) -> np.ndarray:
+        """Embed texts, shape (len(texts), hidden size)."""
+        vectors = []
+        with self.torch.inference_mode():
+            for start in range(0, len(texts), self.batch_size):
+                batch = self.tokenizer(
+                    texts[start : start + self.batch_size],
+                    max_length=self.max_length,
+                    padding=True,
+                    truncation=True,
+                    return_tensors="pt",
+                )
+                hidden = self.model(**batch).last_hidden_state
+                mask = batch["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+                pooled = (hidden * mask).sum(1) / mask.sum(1).clamp(min=1)
+                vectors.append(pooled.float().numpy())
+        return np.concatenate(vectors)
+
+
+def chunked(texts: list[str], size: int) -> Iterator[list[str]]:
+    for start in range(0, len(texts), size):
+        yield texts[start : start + size]
+
+
+def embed_texts(
+    texts: list[str],
+    model_name: str,
+    revision: str = "main",
+    root: str | None = None,
+    chunk_size: int = 1024,
+) -> np.ndarray:
+    """
+    Embed texts with a frozen encoder, reusing cached vectors.
+
+    The encoder is only loaded if some texts aren't cached yet, and new vectors
+    are saved every `chunk_size` texts so an interrupted run keeps its progress.
+
+    Args:
+        texts: Texts to embed
+        model_name: Hub model name or local path of the encoder
+        revision: Encoder revision; pinned to a commit so cached vectors never go stale
+        root: Embedding cache directory (defaults to `embedding_dir`)
+        chunk_size: Number of texts to embed between saves
+
+    Returns:
+        Array of shape (len(texts), dim)
+    """
+    revision = resolve_revision(model_name, revision)
+    cache = EmbeddingCache(model_name, revision, root)
+
+    missing = cache.missing(texts)
+    metrics.count("embeddings.cached", len(texts) - len(missing))
+    metrics.count("embeddings.computed", len(missing))
+    if missing:
+        print(f"Embedding {len(missing)} new texts ({len(cache)} cached)...")
+        encoder = Encoder(model_name, revision)
+        for chunk in chunked(missing, chunk_size):
+            with metrics.timer("train.embed"):
+                cache.add(chunk, encoder(chunk))
+
+    return cache.get(texts)
@@ -0,0 +1,187 @@
+"""
+Train a small classifier head on frozen encoder embeddings.
+
+This is the CPU-friendly alternative to fine-tuning the whole encoder: texts
+are embedded once through `magpie.train.embeddings`, and only a logistic or
+one-hidden-layer head is trained on the cached vectors, with focal loss.
+"""
+
+import json
+import os
+from typing import Any
+
+import numpy as np
+import torch
+from liqfit.losses import FocalLoss
+
+from magpie.train.embeddings import embed_texts, resolve_revision
+from magpie.train.model import load_training_data, model_name, months_ago
+
+head_dir = "./trained-head"
+
+
+class EmbeddingHead(torch.nn.Module):
+    """Logistic (hidden=0) or single-hidden-layer MLP head over embeddings."""
+
+    def __init__(self, dim: int, hidden: int = 0, dropout: float = 0.1):
+        super().__init__()
+        if hidden:
+            self.layers = torch.nn.Sequential(
+                torch.nn.Linear(dim, hidden),
+                torch.nn.ReLU(),
+                torch.nn.Dropout(dropout),
+                torch.nn.Linear(hidden, 2),
+            )
+        else:
+            self.layers = torch.nn.Sequential(torch.nn.Linear(dim, 2))
+
+    def forward(self, embeddings: torch.Tensor) -> torch.Tensor:
+        return self.layers(embeddings)
+
+
+def fit_head(
+    embeddings: np.ndarray,
+    labels: np.ndarray,
+    *,
+    hidden: int = 0,
+    epochs: int = 50,
+    batch_size: int = 256,
+    learning_rate: float = 1e-3,
+    seed: int = 42,
+) -> EmbeddingHead:
+    """
+    Fit a head on embeddings with focal loss.
+
+    Args:
+        embeddings: Array of shape (n, dim)
+        labels: Array of n 0/1 labels
+        hidden: Hidden layer size, or 0 for a logistic head
+        epochs: Passes over the data
+        batch_size: Examples per optimizer step
+        learning_rate: AdamW learning rate
+        seed: Random seed for initialization and shuffling
+
+    Returns:
+        The trained head, in eval mode
+    """
+    generator = torch.Generator().manual_seed(seed)
+    torch.manual_seed(seed)
+
+    x = torch.from_numpy(np.asarray(embeddings, dtype=np.float32))
+    y = torch.from_numpy(np.asarray(labels, dtype=np.int64))
+
+    head = EmbeddingHead(x.shape[1], hidden)
+    optimizer = torch.optim.AdamW(head.parameters(), lr=learning_rate, weight_decay=0.01)
+    loss_function = FocalLoss()
+
+    head.train()
+    for _ in range(epochs):
+        for batch in torch.randperm(len(x), generator=generator).split(batch_size):
+            optimizer.zero_grad()
+            loss = loss_function(head(x[batch]), y[batch])
+            loss.backward()
+            optimizer.step()
+
+    return head.eval()
+
+
+def predict_proba(head: EmbeddingHead, embeddings: np.ndarray) -> np.ndarray:
+    """Get the upvote probability for each embedding."""
+    with torch.inference_mode():
+        logits = head(torch.from_numpy(np.asarray(embeddings, dtype=np.float32)))
+        return torch.softmax(logits, dim=-1)[:, 1].numpy()
+
+
+def evaluate(
+    probabilities: np.ndarray, labels: np.ndarray, threshold: float = 0.5
+) -> dict[str, float]:
+    """Compute accuracy, precision, recall and F1 at a probability threshold."""
+    predicted = probabilities >= threshold
+    actual = np.asarray(labels) == 1
+    true_positives = float(np.sum(predicted & actual))
+    precision = true_positives / max(float(np.sum(predicted)), 1.0)
+    recall = true_positives / max(float(np.sum(actual)), 1.0)
+    return {
+        "accuracy": float(np.mean(predicted == actual)),
+        "precision": precision,
+        "recall": recall,
+        "f1": 2 * precision * recall / max(precision + recall, 1e-12),
+    }
+
+
+def save_head(head: EmbeddingHead, config: dict[str, Any], path: str = head_dir) -> None:
+    """Save a head's weights and the config needed to load it back."""
+    os.makedirs(path, exist_ok=True)
+    torch.save(head.state_dict(), os.path.join(path, "head.pt"))
+    with open(os.path.join(path, "head.json"), "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+
+
+def load_head(path: str = head_dir) -> tuple[EmbeddingHead, dict[str, Any]]:
+    """
+    Load a saved head.
+
+    Args:
+        path: Directory the head was saved to
+
+    Returns:
+        The head in eval mode, and its config (encoder, revision, dim, hidden, ...)
+    """
+    with open(os.path.join(path, "head.json"), encoding="utf-8") as f:
+        config = json.load(f)
+    head = EmbeddingHead(config["dim"], config["hidden"])
+    head.load_state_dict(torch.load(os.path.join(path, "head.pt"), weights_only=True))
+    return head.eval(), config
+
+
+def train_head(
+    months: int = 24,
+    *,
+    encoder: str = model_name,
+    revision: str = "main",
+    hidden: int = 0,
+    epochs: int = 50,
+    output_dir: str = head_dir,
+) -> dict[str, float]:
+    """
+    Train a head on frozen encoder embeddings of the prepared dataset.
+
+    Args:
+        months: Only train on stories from this many recent months
+        encoder: Hub model name or local path of the frozen encoder
+        revision: Encoder revision
+        hidden: Hidden layer size, or 0 for a logistic head
+        epochs: Passes over the cached embeddings
+        output_dir: Directory to save the head to
+
+    Returns:
+        Evaluation metrics on the test split
+    """
+    dataset, data_version = load_training_data()
+    cutoff = months_ago(months)
+    dataset = dataset.filter(lambda d: d["time"] > cutoff)
+    train_split, test_split = dataset["train"], dataset["test"]
+
+    revision = resolve_revision(encoder, revision)
+    embeddings = embed_texts(train_split["text"] + test_split["text"], encoder, revision)
+    train_embeddings, test_embeddings = np.split(embeddings, [len(train_split)])
+
+    head = fit_head(
+        train_embeddings, np.asarray(train_split["label"]), hidden=hidden, epochs=epochs
+    )
+    metrics = evaluate(predict_proba(head, test_embeddings), np.asarray(test_split["label"]))
+
+    save_head(
+        head,
+        {
+            "encoder": encoder,
+            "revision": revision,
+            "dim": int(embeddings.shape[1]),
+            "hidden": hidden,
+            "data_version": data_version,
+            "metrics": metrics,
+        },
+        output_dir,
+    )
+    print(f"Head saved to {output_dir}: {metrics}")
+    return metrics
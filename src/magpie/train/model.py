@@ -1,92 +1,308 @@
-import time  # Added for timestamp fallback
-from typing import cast
-
-import dateparser
-from datasets import Dataset as HFDataset
-from datasets import load_dataset
-from liqfit.collators import NLICollator
-from liqfit.losses import FocalLoss
-from liqfit.modeling import LiqFitModel
-from transformers import (
-    AutoModelForSequenceClassification,
-    AutoTokenizer,
-    Trainer,
-    TrainingArguments,
-    pipeline,  # Use transformers pipeline as fallback
-)
-
-# Load dataset
-dataset = load_dataset("diwank/hn-upvote-data")
-
-# Use data from the last 24 months
-parsed_date = dateparser.parse("24 months ago")
-# Use ternary operator for cleaner code
-twenty_four_months_ago = (
-    time.time() - (2 * 365 * 24 * 60 * 60) if parsed_date is None else parsed_date.timestamp()
-)
-dataset = dataset.filter(lambda d: d["time"] > twenty_four_months_ago)
-
-# Load the base model and tokenizer
+"""
+Fine-tune the upvote classifier on the prepared dataset.
+
+Training pulls in torch, transformers and liqfit, so they are only imported
+once `train` is called; importing this module stays cheap.
+"""
+
+import os
+import time
+from typing import TYPE_CHECKING
+
+from magpie.datastore import has_version, latest_version, load_version
+from magpie.metrics import add_report_arguments, metrics, recording
+
+if TYPE_CHECKING:
+    from datasets import Dataset, DatasetDict
+
+output_dir = "./trained-model"
 model_name = "answerdotai/ModernBERT-large"
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-base_model = AutoModelForSequenceClassification.from_pretrained(model_name)
-
-# Set up focal loss
-loss_function = FocalLoss()  # Remove multi_target parameter which isn't supported
-
-# Create LiqFit model
-model = LiqFitModel(base_model.config, base_model, loss_func=loss_function)
-
-# Create data collator
-data_collator = NLICollator(tokenizer, max_length=256, padding=True, truncation=True)
-
-# Define training arguments
-args = TrainingArguments(
-    output_dir="./trained-model",
-    per_device_train_batch_size=16,
-    per_device_eval_batch_size=32,
-    learning_rate=2e-5,
-    num_train_epochs=5,
-    weight_decay=0.01,
-    evaluation_strategy="epoch",
-    save_strategy="epoch",
-    load_best_model_at_end=True,
-    push_to_hub=False,
-    report_to="none",
-    fp16=True,
-)
-
-# Create trainer
-# Get dataset splits safely with type ignores
-# Using # type: ignore to suppress the specific error about __getitem__ on IterableDataset
-train_split = dataset["train"]  # type: ignore
-test_split = dataset["test"]  # type: ignore
-
-# Cast to appropriate type for the trainer
-train_dataset = cast(HFDataset, train_split)
-test_dataset = cast(HFDataset, test_split)
-
-trainer = Trainer(
-    model=model,
-    args=args,
-    train_dataset=train_dataset,
-    eval_dataset=test_dataset,
-    tokenizer=tokenizer,
-    data_collator=data_collator,
-)
-
-# Train the model
-trainer.train()
-
-# Save the model locally
-model.save_pretrained("./trained-model")
-tokenizer.save_pretrained("./trained-model")
-
-# Create pipeline for inference example
-classification_pipeline = pipeline("zero-shot-classification", model=model, tokenizer=tokenizer)
-
-# Push to hub
-model.push_to_hub("diwank/hn-upvote-classifier")
-tokenizer.push_to_hub("diwank/hn-upvote-classifier")
-
-print("Model training complete and model pushed to hub.")
+hub_dataset = "diwank/hn-upvote-data"
+hub_model = "diwank/hn-upvote-classifier"
+
+
+def load_training_data() -> tuple["DatasetDict", str | None]:
+    """
+    Load the dataset to train on.
+
+    Prefers the latest locally prepared version and falls back to the hub copy.
+
+    Returns:
+        The dataset splits, and the local dataset version (None for the hub copy)
+    """
+    data_version = latest_version()
+    if data_version is not None:
+        return load_version(data_version), data_version
+
+    from datasets import load_dataset
+
+    return load_dataset(hub_dataset), None  # type: ignore
+
+
+def trained_data_version(path: str = output_dir) -> str | None:
+    """Get the dataset version a saved model was trained on, if recorded."""
+    try:
+        with open(os.path.join(path, "data_version"), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def months_ago(months: int) -> float:
+    """Get the unix timestamp from this many months ago."""
+    import dateparser
+
+    parsed_date = dateparser.parse(f"{months} months ago")
+    return (
+        time.time() - (months * 30 * 24 * 60 * 60)
+        if parsed_date is None
+        else parsed_date.timestamp()
+    )
+
+
+def select_increment(
+    train_split: "Dataset", previous: "DatasetDict", replay_ratio: float = 1.0, seed: int = 42
+) -> "Dataset":
+    """
+    Select the training rows that are new since a previous dataset version, plus replay.
+
+    Rows are matched by item ID against the previous version's training split.
+    Items keep their split across versions (see `datastore.split_by_id`), so a
+    row of the current training split was either trained on before or is new. A
+    random sample of already-seen rows is mixed in to keep the model from
+    forgetting them.
+
+    Args:
+        train_split: The current training split
+        previous: The dataset version the checkpoint was trained on
+        replay_ratio: Number of old rows to replay per new row
+        seed: Random seed for the replay sample
+
+    Returns:
+        The new rows and the replay sample, in their original order
+    """
+    import numpy as np
+
+    seen = set(previous["train"]["id"])
+    new_rows, old_rows = [], []
+    for row, item_id in enumerate(train_split["id"]):
+        (old_rows if item_id in seen else new_rows).append(row)
+
+    if not new_rows:
+        return train_split.select([])
+
+    replay_count = min(len(old_rows), round(len(new_rows) * replay_ratio))
+    replay = np.random.default_rng(seed).choice(old_rows, replay_count, replace=False)
+    return train_split.select(sorted([*new_rows, *replay.tolist()]))
+
+
+def train(
+    months: int = 24,
+    epochs: int = 5,
+    force: bool = False,
+    push_to_hub: str | None = None,
+    *,
+    incremental: bool = False,
+    replay_ratio: float = 1.0,
+) -> bool:
+    """
+    Train the classifier and save it to `output_dir`.
+
+    Args:
+        months: Only train on stories from this many recent months
+        epochs: Number of training epochs
+        force: Train even if the saved model already saw this dataset version
+        push_to_hub: Hub model repository to push the trained model to, if any
+        incremental: Warm-start from the checkpoint in `output_dir` and only train
+            on rows added since the dataset version it was trained on, plus replay
+        replay_ratio: With `incremental`, old rows to replay per new row
+
+    Returns:
+        True if a model was trained, False if training was skipped
+    """
+    dataset, data_version = load_training_data()
+    previous_version = trained_data_version()
+    if not force and data_version is not None and data_version == previous_version:
+        print(f"Model already trained on dataset version {data_version}, skipping training.")
+        return False
+
+    # Warm-starting needs the checkpoint and the dataset version it was trained on
+    warm_start = (
+        incremental
+        and previous_version is not None
+        and has_version(previous_version)
+        and os.path.exists(os.path.join(output_dir, "config.json"))
+    )
+    if incremental and not warm_start:
+        print("No checkpoint with a known dataset version, training from scratch.")
+    source = output_dir if warm_start else model_name
+
+    from liqfit.losses import FocalLoss
+    from liqfit.modeling import LiqFitModel
+    from transformers import (
+        AutoModelForSequenceClassification,
+        AutoTokenizer,
+        Trainer,
+        TrainingArguments,
+    )
+
+    from magpie.train.pretokenize import TokenizedCollator, pretokenize
+
+    # Load the base model (or the last checkpoint) and tokenizer
+    tokenizer = AutoTokenizer.from_pretrained(source)
+
+    # Tokenize once (cached per tokenizer), then use data from the last few months
+    dataset = pretokenize(dataset, tokenizer, max_length=256)
+    cutoff = months_ago(months)
+    dataset = dataset.filter(lambda d: d["time"] > cutoff)
+
+    if warm_start:
+        assert previous_version is not None
+        dataset["train"] = select_increment(
+            dataset["train"], load_version(previous_version), replay_ratio
+        )
+        if len(dataset["train"]) == 0:
+            print(f"No new training rows since dataset version {previous_version}.")
+            return False
+        print(f"Warm-starting from {output_dir} on {len(dataset['train'])} rows (new + replay)")
+
+    base_model = AutoModelForSequenceClassification.from_pretrained(source)
+
+    # Set up focal loss
+    loss_function = FocalLoss()  # Remove multi_target parameter which isn't supported
+
+    # Create LiqFit model
+    model = LiqFitModel(base_model.config, base_model, loss_func=loss_function)
+
+    # Pad each batch only to its longest example
+    data_collator = TokenizedCollator(tokenizer)
+
+    # Define training arguments
+    args = TrainingArguments(
+        output_dir=output_dir,
+        per_device_train_batch_size=16,
+        per_device_eval_batch_size=32,
+        # Smaller steps when continuing from an already fine-tuned checkpoint
+        learning_rate=1e-5 if warm_start else 2e-5,
+        num_train_epochs=epochs,
+        weight_decay=0.01,
+        evaluation_strategy="epoch",
+        save_strategy="epoch",
+        load_best_model_at_end=True,
+        push_to_hub=False,
+        report_to="none",
+        fp16=True,
+        # Batch titles of similar token length together to avoid padding
+        group_by_length=True,
+        length_column_name="length",
+        remove_unused_columns=False,
+    )
+
+    trainer = Trainer(
+        model=model,
+        args=args,
+        train_dataset=dataset["train"],
+        eval_dataset=dataset["test"],
+        tokenizer=tokenizer,
+        data_collator=data_collator,
+    )
+
+    # Train the model; tokens/sec counts real tokens (from the pretokenized lengths), not padding
+    tokens = sum(dataset["train"]["length"]) * epochs
+    with metrics.timer("train.fit"):
+        output = trainer.train()
+    runtime = output.metrics["train_runtime"]
+    metrics.gauge("train.rows", len(dataset["train"]))
+    metrics.gauge("train.steps", output.global_step)
+    metrics.gauge("train.loss", output.training_loss)
+    metrics.gauge("train.tokens_per_second", tokens / runtime if runtime else 0.0)
+
+    # Save the fine-tuned backbone (a plain sequence classifier, which is what inference loads)
+    # locally, along with the dataset version it was trained on
+    base_model.save_pretrained(output_dir)
+    tokenizer.save_pretrained(output_dir)
+    if data_version is not None:
+        with open(os.path.join(output_dir, "data_version"), "w", encoding="utf-8") as f:
+            f.write(data_version)
+
+    if push_to_hub:
+        base_model.push_to_hub(push_to_hub)
+        tokenizer.push_to_hub(push_to_hub)
+        print(f"Model pushed to {push_to_hub}.")
+
+    print("Model training complete.")
+    return True
+
+
+def main(argv: list[str] | None = None) -> None:
+    """
+    Command line entry point for training.
+
+    Args:
+        argv: Command line arguments (defaults to `sys.argv[1:]`)
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Train the HackerNews upvote classifier")
+    parser.add_argument(
+        "--mode",
+        choices=["finetune", "head"],
+        default="finetune",
+        help="Fine-tune the whole encoder, or train a small head on cached frozen embeddings",
+    )
+    parser.add_argument("--months", type=int, default=24, help="Train on this many recent months")
+    parser.add_argument("--epochs", type=int, default=None, help="Number of training epochs")
+    parser.add_argument(
+        "--encoder", default=model_name, help="Frozen encoder for the head (model name or path)"
+    )
+    parser.add_argument(
+        "--hidden", type=int, default=0, help="Head hidden layer size (0 for a logistic head)"
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Retrain even if the dataset version is unchanged"
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Continue from the last checkpoint on rows added since its dataset version",
+    )
+    parser.add_argument(
+        "--replay-ratio",
+        type=float,
+        default=1.0,
+        help="With --incremental, old rows to mix in per new row",
+    )
+    parser.add_argument(
+        "--push-to-hub",
+        nargs="?",
+        const=hub_model,
+        default=None,
+        metavar="REPO",
+        help=f"Also push the trained model to the hub (default repo: {hub_model})",
+    )
+    add_report_arguments(parser)
+    args = parser.parse_args(argv)
+
+    with recording("train", args):
+        if args.mode == "head":
+            from magpie.train.head import train_head
+
+            train_head(
+                months=args.months,
+                encoder=args.encoder,
+                hidden=args.hidden,
+                epochs=args.epochs or 50,
+            )
+        else:
+            train(
+                months=args.months,
+                epochs=args.epochs or (1 if args.incremental else 5),
+                force=args.force,
+                push_to_hub=args.push_to_hub,
+                incremental=args.incremental,
+                replay_ratio=args.replay_ratio,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Tokenize the dataset once and cache the result per tokenizer.
+
+The tokenized splits keep a `length` column so the trainer can group batches
+of similar length, and the test split is stored sorted by length, so neither
+training nor evaluation pads short titles up to long ones.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from typing import TYPE_CHECKING, Any
+
+from magpie.metrics import metrics
+
+if TYPE_CHECKING:
+    from datasets import DatasetDict
+
+tokenized_dir = "./cache/tokenized"
+
+
+def tokenizer_fingerprint(tokenizer: Any) -> str:
+    """
+    Identify a tokenizer by what it produces rather than by its name.
+
+    Args:
+        tokenizer: A transformers tokenizer
+
+    Returns:
+        Hex digest of its vocabulary, normalization and special tokens
+    """
+    digest = hashlib.sha256(type(tokenizer).__name__.encode())
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    if backend is not None:
+        # Calling the tokenizer records its truncation/padding settings, which aren't part of it
+        state = {
+            k: v
+            for k, v in json.loads(backend.to_str()).items()
+            if k not in {"truncation", "padding"}
+        }
+        digest.update(json.dumps(state, sort_keys=True).encode())
+    else:
+        digest.update(json.dumps(sorted(tokenizer.get_vocab().items())).encode())
+    digest.update(json.dumps(tokenizer.special_tokens_map, sort_keys=True).encode())
+    return digest.hexdigest()[:16]
+
+
+def pretokenize(
+    dataset: "DatasetDict", tokenizer: Any, max_length: int = 256, root: str | None = None
+) -> "DatasetDict":
+    """
+    Tokenize every split once, reusing a cached copy when nothing changed.
+
+    The cache key combines the dataset fingerprints, the tokenizer fingerprint
+    and `max_length`. Columns other than `text` are kept (e.g. `time` for
+    filtering), `label` is renamed to `labels` and a `length` column is added.
+
+    Args:
+        dataset: Dataset splits with `text` and `label` columns
+        tokenizer: A transformers tokenizer
+        max_length: Maximum number of tokens per text
+        root: Cache directory (defaults to `tokenized_dir`)
+
+    Returns:
+        The tokenized splits, memory-mapped from the cache
+    """
+    from datasets import load_from_disk
+
+    key = json.dumps(
+        [
+            {name: split._fingerprint for name, split in sorted(dataset.items())},
+            tokenizer_fingerprint(tokenizer),
+            max_length,
+        ]
+    )
+    path = os.path.join(root or tokenized_dir, hashlib.sha256(key.encode()).hexdigest()[:16])
+
+    if not os.path.exists(os.path.join(path, "dataset_dict.json")):
+
+        def tokenize(batch: dict[str, list]) -> dict[str, list]:
+            encoded = tokenizer(batch["text"], max_length=max_length, truncation=True)
+            encoded["length"] = [len(ids) for ids in encoded["input_ids"]]
+            return encoded
+
+        with metrics.timer("train.tokenize"):
+            tokenized = dataset.map(tokenize, batched=True, remove_columns=["text"])
+        tokenized = tokenized.rename_column("label", "labels")
+        tokenized["test"] = tokenized["test"].sort("length")
+
+        tmp_path = f"{path}.tmp"
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+        tokenized.save_to_disk(tmp_path)
+        os.replace(tmp_path, path)
+
+    return load_from_disk(path)  # type: ignore
+
+
+class TokenizedCollator:
+    """Pad pre-tokenized examples to the longest one in the batch."""
+
+    def __init__(self, tokenizer: Any, pad_to_multiple_of: int | None = 8):
+        self.tokenizer = tokenizer
+        self.pad_to_multiple_of = pad_to_multiple_of
+        self.keys = [*tokenizer.model_input_names, "labels"]
+
+    def __call__(self, features: list[dict[str, Any]]) -> dict[str, Any]:
+        # Drop bookkeeping columns such as `length` and `time` that the model doesn't take
+        features = [{k: f[k] for k in self.keys if k in f} for f in features]
+        return self.tokenizer.pad(
+            features, pad_to_multiple_of=self.pad_to_multiple_of, return_tensors="pt"
+        )
@@ -0,0 +1,97 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import pytest
+from datasets import Dataset, DatasetDict
+
+from magpie.datastore import (
+    content_hash,
+    has_version,
+    hashed_split,
+    latest_version,
+    load_version,
+    push_version,
+    save_version,
+    split_by_id,
+)
+
+
+class TestDatastore(unittest.TestCase):
+    """Test versioned local dataset storage."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp_dir.name, "data")
+        self.dataset = DatasetDict(
+            {
+                "train": Dataset.from_dict({"id": [1, 2, 3]}),
+                "test": Dataset.from_dict({"id": [4]}),
+            }
+        )
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_content_hash(self):
+        """Versions only change when the content does."""
+        paths = [os.path.join(self.tmp_dir.name, name) for name in ("a", "b", "c")]
+        for path, content in zip(paths, (b"same", b"same", b"other"), strict=True):
+            with open(path, "wb") as f:
+                f.write(content)
+
+        a, b, c = (content_hash(path) for path in paths)
+        assert a == b
+        assert a != c
+
+    def test_split_by_id(self):
+        """Items keep their split as the dataset grows, and new ones are split by ID hash."""
+        previous = DatasetDict(
+            {
+                "train": Dataset.from_dict({"id": list(range(100))}),
+                "test": Dataset.from_dict({"id": list(range(100, 120))}),
+            }
+        )
+        grown = Dataset.from_dict({"id": list(range(2000))})
+
+        split = split_by_id(grown, previous)
+        train_ids, test_ids = set(split["train"]["id"]), set(split["test"]["id"])
+        assert train_ids.isdisjoint(test_ids)
+        assert train_ids | test_ids == set(range(2000))
+        assert set(range(100)) <= train_ids
+        assert set(range(100, 120)) <= test_ids
+        for item_id in range(120, 2000):
+            assert (item_id in test_ids) == (hashed_split(item_id) == "test")
+
+        # Without a previous version, the same items land in the same splits every time
+        fresh = split_by_id(grown)
+        assert set(fresh["test"]["id"]) == set(split_by_id(grown.shuffle(seed=1))["test"]["id"])
+        test_share = len(fresh["test"]) / len(grown)
+        assert 0.15 < test_share < 0.25  # noqa: PLR2004
+
+    def test_save_and_load(self):
+        """Saved versions load back and become the latest."""
+        assert latest_version(self.root) is None
+        with pytest.raises(FileNotFoundError):
+            load_version(root=self.root)
+
+        save_version(self.dataset, "v1", self.root)
+        assert has_version("v1", self.root)
+        assert not os.path.exists(os.path.join(self.root, "v1.tmp"))
+        assert latest_version(self.root) == "v1"
+        assert load_version(root=self.root)["train"]["id"] == [1, 2, 3]
+
+    @patch("datasets.DatasetDict.push_to_hub")
+    def test_push_version(self, mock_push):
+        """A version is pushed to each repo at most once."""
+        save_version(self.dataset, "v1", self.root)
+
+        assert push_version("user/a", root=self.root)
+        assert not push_version("user/a", root=self.root)
+        assert push_version("user/b", root=self.root)
+        assert [call.args for call in mock_push.call_args_list] == [("user/a",), ("user/b",)]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import random
+import unittest
+
+from benchmarks.fake_hn import words
+
+from magpie.dedup import Deduplicator, normalize_title, normalize_url
+
+
+def sample(item_id: int, title: str, link: str | None = None, label: int = 0) -> dict:
+    return {"id": item_id, "title": title, "link": link, "label": label}
+
+
+class TestDedup(unittest.TestCase):
+    """Test URL and title normalization and the streaming deduplicator."""
+
+    def test_normalize_url(self):
+        """Reposts of the same page normalize to the same URL, different pages don't."""
+        canonical = normalize_url("http://example.com/a/b?a=1&b=2")
+        assert canonical == "example.com/a/b?a=1&b=2"
+        for url in [
+            "https://www.Example.com/a/b/index.html?utm_source=hn&b=2&a=1#comments",
+            "https://m.example.com:443/a/b/?a=1&b=2&fbclid=xyz",
+        ]:
+            with self.subTest(url=url):
+                assert normalize_url(url) == canonical
+
+        assert normalize_url("https://example.com/a/c?a=1&b=2") != canonical
+        assert normalize_url("https://example.com/a/b?a=2&b=2") != canonical
+        assert normalize_url(None) is None
+        assert normalize_url("item?id=1") is None
+
+    def test_normalize_title(self):
+        """Tags, case and punctuation don't matter."""
+        assert (
+            normalize_title("Show HN: A tiny HN client [pdf] (2019)") == "show hn a tiny hn client"
+        )
+        assert normalize_title(None) == ""
+
+    def test_filter(self):
+        """Only the first copy is kept, and disagreeing labels are counted."""
+        samples = [
+            sample(1, "Show HN: A tiny HN client written in Rust", "https://a.com/", label=1),
+            sample(2, "The unreasonable effectiveness of SQLite", "https://b.com/x", label=1),
+            # Neighbor copies of the upvotes: same ID, same page, and a retitled repost
+            sample(1, "Show HN: A tiny HN client written in Rust", "https://a.com/"),
+            sample(3, "Unrelated", "https://www.b.com/x?utm_source=hn"),
+            sample(4, "Show HN: A tiny HN client, written in Rust (2023)", "https://c.com/"),
+            # Genuinely different stories, including a short title that happens to repeat
+            sample(5, "Why Postgres is great", "https://d.com/"),
+            sample(6, "Why MySQL is great", "https://e.com/"),
+            sample(7, "Unrelated", "https://f.com/"),
+        ]
+        deduplicator = Deduplicator()
+
+        kept = [s["id"] for s in deduplicator.filter(iter(samples))]
+        counts = deduplicator.report()
+
+        assert kept == [1, 2, 5, 6, 7]
+        assert counts == {
+            "samples": len(samples),
+            "kept": len(kept),
+            "removed_id": 1,
+            "removed_url": 1,
+            "removed_title": 1,
+            "label_conflicts": 3,
+        }
+
+    def test_filter_many(self):
+        """Distinct titles are all kept, and their reposts caught."""
+        rng = random.Random(0)
+        titles = [
+            " ".join(f"{rng.choice(words)}{rng.randint(1, 50)}" for _ in range(rng.randint(3, 9)))
+            for _ in range(2000)
+        ]
+        deduplicator = Deduplicator()
+        samples = [sample(i, title, f"https://example.com/{i}") for i, title in enumerate(titles)]
+
+        kept = list(deduplicator.filter(iter(samples)))
+        assert len(kept) == len(titles)
+
+        reposts = [sample(10_000 + i, f"{title} [pdf]") for i, title in enumerate(titles[:50])]
+        assert list(deduplicator.filter(iter(reposts))) == []
+
+
+if __name__ == "__main__":
+    unittest.main()
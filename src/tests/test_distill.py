@@ -0,0 +1,90 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from magpie.distill import LabelCache, Student, distill, teacher_labels
+
+
+class KeywordTeacher:
+    """Likes stories about Rust, and counts the texts it scores."""
+
+    def __init__(self):
+        self.scored = 0
+
+    def score(self, texts: list[str]) -> np.ndarray:
+        self.scored += len(texts)
+        return np.array([0.9 if "rust" in text.lower() else 0.1 for text in texts])
+
+
+def corpus(size: int) -> list[str]:
+    topics = ["Rust", "Python", "Go", "Startups", "Rust compiler", "Databases"]
+    return [f"{topics[i % len(topics)]} story number {i}\nSource: s{i}.com" for i in range(size)]
+
+
+class TestDistill(unittest.TestCase):
+    """Test distilling teacher labels into the hashed n-gram student."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.label_dir = os.path.join(self.tmp_dir.name, "labels")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_teacher_labels_are_cached(self):
+        """The teacher only scores texts it hasn't labelled for this version."""
+        teacher = KeywordTeacher()
+        texts = corpus(10)
+
+        labels = teacher_labels(texts, teacher, "v1", self.label_dir)
+        np.testing.assert_allclose(labels, teacher.score(texts), rtol=1e-6)
+        teacher.scored = 0
+
+        teacher_labels([*texts, "Rust again"], teacher, "v1", self.label_dir)
+        assert teacher.scored == 1
+
+        teacher_labels(texts, teacher, "v2", self.label_dir)
+        assert teacher.scored == 1 + len(texts)
+
+    def test_label_cache_drops_cut_short_lines(self):
+        """A label line cut short by a killed run is labelled again."""
+        teacher = KeywordTeacher()
+        texts = corpus(3)
+        teacher_labels(texts, teacher, "v1", self.label_dir)
+
+        cache = LabelCache("v1", self.label_dir)
+        with open(cache.path, "rb+") as f:
+            f.truncate(os.path.getsize(cache.path) - 2)
+
+        teacher.scored = 0
+        teacher_labels(texts, teacher, "v1", self.label_dir)
+        assert teacher.scored == 1
+
+        teacher.scored = 0
+        labels = teacher_labels(texts, teacher, "v1", self.label_dir)
+        assert teacher.scored == 0
+        np.testing.assert_allclose(labels, teacher.score(texts), rtol=1e-6)
+
+    def test_distill(self):
+        """The student reproduces the teacher's decisions and survives a save/load."""
+        teacher = KeywordTeacher()
+        output = os.path.join(self.tmp_dir.name, "student.pkl")
+
+        with patch("magpie.distill.cache_dir", self.tmp_dir.name):
+            report = distill(corpus(600), teacher, "v1", holdout=0.2, output=output)
+
+        min_agreement = 0.95
+        assert report["agreement"] > min_agreement
+        assert report["student_stories_per_sec"] > 0
+
+        student = Student.load(output)
+        scores = student.score(["Rust is fast\nSource: a.com", "Python tips\nSource: b.com"])
+        assert scores[0] > scores[1]
+        assert student.score([]).shape == (0,)
+
+
+if __name__ == "__main__":
+    unittest.main()
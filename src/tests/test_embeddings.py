@@ -0,0 +1,97 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from magpie.train.embeddings import EmbeddingCache, embed_texts
+from magpie.train.head import evaluate, fit_head, load_head, predict_proba, save_head
+
+dim = 8
+
+
+def fake_vectors(texts: list[str]) -> np.ndarray:
+    """Deterministic stand-in for encoder output."""
+    return np.array([[len(text) + i for i in range(dim)] for text in texts], dtype=np.float32)
+
+
+class TestEmbeddings(unittest.TestCase):
+    """Test the embedding cache and the head trained on it."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = self.tmp_dir.name
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_cache_round_trip(self):
+        """Vectors persist across instances and are looked up by text."""
+        cache = EmbeddingCache("org/model", "abc123", self.root)
+        assert cache.missing(["a", "bb", "a"]) == ["a", "bb"]
+        cache.add(["a", "bb"], fake_vectors(["a", "bb"]))
+
+        reopened = EmbeddingCache("org/model", "abc123", self.root)
+        assert len(reopened) == len(["a", "bb"])
+        assert "bb" in reopened
+        assert reopened.missing(["bb", "ccc"]) == ["ccc"]
+        np.testing.assert_array_equal(reopened.get(["bb", "a"]), fake_vectors(["bb", "a"]))
+
+        # Another revision gets its own cache
+        assert len(EmbeddingCache("org/model", "def456", self.root)) == 0
+
+    def test_cache_ignores_unindexed_rows(self):
+        """Vectors written without their keys (e.g. after a crash) are overwritten."""
+        cache = EmbeddingCache("org/model", "abc123", self.root)
+        cache.add(["a"], fake_vectors(["a"]))
+        with open(cache.vectors_path, "ab") as f:
+            f.write(fake_vectors(["junk"]).tobytes())
+
+        reopened = EmbeddingCache("org/model", "abc123", self.root)
+        reopened.add(["bb"], fake_vectors(["bb"]))
+        np.testing.assert_array_equal(reopened.get(["a", "bb"]), fake_vectors(["a", "bb"]))
+        assert os.path.getsize(cache.vectors_path) == len(["a", "bb"]) * dim * 4
+
+    @patch("magpie.train.embeddings.resolve_revision", return_value="abc123")
+    @patch("magpie.train.embeddings.Encoder")
+    def test_embed_texts_only_embeds_new(self, mock_encoder, mock_resolve):
+        """Only texts missing from the cache go through the encoder."""
+        mock_encoder.return_value.side_effect = fake_vectors
+
+        first = embed_texts(["a", "bb", "a"], "org/model", root=self.root)
+        np.testing.assert_array_equal(first, fake_vectors(["a", "bb", "a"]))
+        mock_encoder.return_value.assert_called_once_with(["a", "bb"])
+
+        mock_encoder.reset_mock()
+        embed_texts(["bb", "ccc"], "org/model", root=self.root)
+        mock_encoder.return_value.assert_called_once_with(["ccc"])
+
+        mock_encoder.reset_mock()
+        embed_texts(["a", "ccc"], "org/model", root=self.root)
+        mock_encoder.assert_not_called()
+        mock_resolve.assert_called_with("org/model", "main")
+
+    def test_fit_head(self):
+        """A head separates linearly separable embeddings and survives a save/load."""
+        rng = np.random.default_rng(0)
+        labels = rng.integers(0, 2, 400)
+        embeddings = rng.normal(size=(400, dim)).astype(np.float32)
+        embeddings[:, 0] += np.where(labels == 1, 3.0, -3.0)
+
+        for hidden in (0, 16):
+            with self.subTest(hidden=hidden):
+                head = fit_head(embeddings, labels, hidden=hidden, epochs=50, learning_rate=1e-2)
+                probabilities = predict_proba(head, embeddings)
+                min_accuracy = 0.95
+                assert evaluate(probabilities, labels)["accuracy"] > min_accuracy
+
+                path = os.path.join(self.root, f"head-{hidden}")
+                save_head(head, {"dim": dim, "hidden": hidden}, path)
+                loaded, config = load_head(path)
+                assert config["hidden"] == hidden
+                np.testing.assert_allclose(predict_proba(loaded, embeddings), probabilities)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import json
+import unittest
+import urllib.request
+
+from benchmarks.fake_hn import Corpus, FakeHN
+
+from magpie.parsing import parse_upvoted_page
+
+
+class TestFakeHN(unittest.TestCase):
+    """Test the local HackerNews stand-in used by the pipeline benchmark."""
+
+    def test_corpus_is_deterministic(self):
+        """The same seed gives the same items, and upvotes are stories."""
+        corpus = Corpus(size=500, story_density=0.3, upvotes=20)
+        again = Corpus(size=500, story_density=0.3, upvotes=20)
+
+        assert corpus.upvoted == again.upvoted
+        assert corpus.item(corpus.first_id + 7) == again.item(corpus.first_id + 7)
+        assert all(corpus.item(item_id)["type"] == "story" for item_id in corpus.upvoted)
+        assert corpus.item(corpus.max_id + 1) is None
+
+    def test_server(self):
+        """Items and upvoted pages are served, parsed like HN's, and counted."""
+        per_page = 30
+        corpus = Corpus(size=1000, upvotes=45)
+
+        with FakeHN(corpus) as fake:
+            item_id = corpus.upvoted[0]
+            with urllib.request.urlopen(f"{fake.api_url}/item/{item_id}.json") as response:
+                assert json.load(response) == corpus.item(item_id)
+
+            pages = []
+            for page in (1, 2, 3):
+                url = f"{fake.web_url}/upvoted?id=someone&p={page}"
+                with urllib.request.urlopen(url) as response:
+                    pages.append(parse_upvoted_page(response.read().decode()))
+
+        assert [len(page) for page in pages] == [per_page, len(corpus.upvoted) - per_page, 0]
+        assert fake.requests == {"item": 1, "upvoted": len(pages)}
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import json
+import os
+import tempfile
+import unittest
+import urllib.request
+from unittest.mock import patch
+
+from magpie.feed import ScoreCache, poll, serve_feed, write_feed
+
+
+class FakeScorer:
+    """Scores texts by length and records what it was asked to score."""
+
+    def __init__(self):
+        self.calls: list[list[str]] = []
+
+    def score(self, texts: list[str]) -> list[float]:
+        self.calls.append(texts)
+        return [len(text) / 100 for text in texts]
+
+
+def story(item_id: int, title: str) -> dict:
+    return {"id": item_id, "type": "story", "title": title, "url": f"https://s{item_id}.com/a"}
+
+
+class TestFeed(unittest.TestCase):
+    """Test incremental scoring of the front page."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.tmp_dir.name, "scores", "v1.json")
+        self.items = {
+            1: story(1, "Short"),
+            2: story(2, "A much longer story title"),
+            3: {"id": 3, "type": "comment", "text": "not a story"},
+            4: story(4, "Medium title"),
+        }
+        self.failing: set[int] = set()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def get_items(self, item_ids, failed=None):
+        if failed is not None:
+            failed.update(self.failing & set(item_ids))
+        return [None if i in self.failing else self.items.get(i) for i in item_ids]
+
+    @patch("magpie.feed.get_cached_items_by_ids")
+    @patch("magpie.feed.fetcher")
+    def test_poll_scores_only_new_items(self, mock_fetcher, mock_get_items):
+        """Each poll fetches and scores only items it hasn't seen."""
+        mock_get_items.side_effect = self.get_items
+        scorer = FakeScorer()
+        scores = ScoreCache(self.cache_path)
+
+        mock_fetcher.fetch_json.return_value = [[1, 2, 3], [3]]
+        ranked = poll(scorer, scores)
+        assert [entry["id"] for entry in ranked] == [2, 1]
+        assert len(scorer.calls[0]) == len([1, 2])
+        assert scores.entries[3] is None
+
+        mock_fetcher.fetch_json.return_value = [[4, 1, 2], [3]]
+        ranked = poll(scorer, scores)
+        assert [entry["id"] for entry in ranked] == [2, 4, 1]
+        assert mock_get_items.call_args.args[0] == [4]
+        assert scorer.calls[1] == ["Medium title\nSource: s4.com"]
+
+        # Nothing new: no item fetches and no forward passes
+        mock_get_items.reset_mock()
+        poll(scorer, scores)
+        mock_get_items.assert_not_called()
+        assert len(scorer.calls) == len([[1, 2], [4]])
+
+    @patch("magpie.feed.get_cached_items_by_ids")
+    @patch("magpie.feed.fetcher")
+    def test_poll_retries_failed_items(self, mock_fetcher, mock_get_items):
+        """A story that couldn't be fetched is scored by the next poll."""
+        mock_get_items.side_effect = self.get_items
+        scorer = FakeScorer()
+        scores = ScoreCache(self.cache_path)
+        mock_fetcher.fetch_json.return_value = [[1, 2], []]
+
+        self.failing = {2}
+        assert [entry["id"] for entry in poll(scorer, scores)] == [1]
+        assert not self.failing & set(scores.entries)
+
+        self.failing = set()
+        assert [entry["id"] for entry in poll(scorer, scores)] == [2, 1]
+        assert mock_get_items.call_args.args[0] == [2]
+        assert scorer.calls[1] == ["A much longer story title\nSource: s2.com"]
+
+    def test_score_cache_round_trip(self):
+        """Scores persist per model version and stale off-list entries are pruned."""
+        scores = ScoreCache(self.cache_path)
+        scores.entries = {
+            1: {"id": 1, "time": 1000.0, "probability": 0.5},
+            2: {"id": 2, "time": 100.0, "probability": 0.1},
+            3: None,
+        }
+        scores.save()
+
+        loaded = ScoreCache.load("v1", self.cache_path)
+        assert loaded.entries == scores.entries
+
+        loaded.prune({3}, max_age=500, now=1200.0)
+        assert set(loaded.entries) == {1, 3}
+
+    def test_serve_feed(self):
+        """The written feed is served over HTTP."""
+        path = os.path.join(self.tmp_dir.name, "feed.json")
+        write_feed([{"id": 1, "probability": 0.9}], path, version="v1")
+
+        server = serve_feed(path, port=0)
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}/"
+            with urllib.request.urlopen(url) as response:
+                feed = json.load(response)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        assert feed["model_version"] == "v1"
+        assert feed["stories"] == [{"id": 1, "probability": 0.9}]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import ClassVar
+from unittest.mock import patch
+
+import pytest
+
+from magpie.fetch import Fetcher, FetchError, TokenBucket
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """
+    Serves `{"path": ...}`, failing the first request to each path with a 503.
+
+    Paths under `/missing/` are always a 404, and paths under `/broken/` serve
+    invalid JSON.
+    """
+
+    seen: ClassVar[set[str]] = set()
+
+    def do_GET(self):
+        if self.path.startswith("/missing/"):
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path not in self.seen:
+            self.seen.add(self.path)
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        body = (
+            b"{" if self.path.startswith("/broken/") else json.dumps({"path": self.path}).encode()
+        )
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestTokenBucket(unittest.TestCase):
+    """Test the token bucket rate limiter."""
+
+    @patch("magpie.fetch.time.monotonic")
+    def test_reserve(self, mock_monotonic):
+        """Burst up to capacity, then wait 1/rate per request."""
+        mock_monotonic.return_value = 100.0
+        bucket = TokenBucket(rate=2.0, capacity=2.0)
+
+        assert bucket.reserve() == 0.0
+        assert bucket.reserve() == 0.0
+        assert bucket.reserve() == pytest.approx(0.5)
+        assert bucket.reserve() == pytest.approx(1.0)
+
+        # Tokens refill with time, but never beyond capacity
+        mock_monotonic.return_value = 110.0
+        assert bucket.reserve() == 0.0
+        assert bucket.tokens == pytest.approx(1.0)
+
+
+class TestFetcher(unittest.TestCase):
+    """Test the asyncio fetch engine against a local HTTP server."""
+
+    def setUp(self):
+        FlakyHandler.seen = set()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.fetcher = Fetcher(requests_per_second=1000, max_in_flight=4, backoff=0.01)
+
+    def tearDown(self):
+        self.fetcher.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_fetch_json_retries(self):
+        """Results come back in order after retrying 5xx responses."""
+        urls = [f"{self.base_url}/item/{i}.json" for i in range(10)]
+        result = self.fetcher.fetch_json(urls)
+        assert result == [{"path": f"/item/{i}.json"} for i in range(10)]
+
+    def test_fetch_json_gives_up(self):
+        """A URL that keeps failing comes back as None, or raises FetchError when strict."""
+        self.fetcher.max_retries = 0
+        assert self.fetcher.fetch_json([f"{self.base_url}/item/1.json"]) == [None]
+        with pytest.raises(FetchError):
+            self.fetcher.fetch_json([f"{self.base_url}/item/2.json"], strict=True)
+
+    def test_fetch_json_failures_dont_abort_batch(self):
+        """Error statuses and invalid bodies fail only their own URL, as FetchError."""
+        urls = [f"{self.base_url}/{path}/1.json" for path in ["item", "missing", "broken"]]
+        assert self.fetcher.fetch_json(urls) == [{"path": "/item/1.json"}, None, None]
+
+        with pytest.raises(FetchError, match="HTTP 404"):
+            self.fetcher.fetch_json(urls[1:2], strict=True)
+        with pytest.raises(FetchError, match="Invalid JSON"):
+            self.fetcher.fetch_json(urls[2:], strict=True)
+
+    def test_fetch_json_empty(self):
+        """Nothing is fetched for an empty list of URLs."""
+        assert self.fetcher.fetch_json([]) == []
+
+
+if __name__ == "__main__":
+    unittest.main()
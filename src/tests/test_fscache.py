@@ -0,0 +1,231 @@
+import json
+import math
+import os
+import tempfile
+import time
+import unittest
+
+import pytest
+from benchmarks.fake_hn import Corpus
+
+from magpie.fscache import (
+    DirectoryBackend,
+    FSCache,
+    ItemAgeTTL,
+    SQLiteBackend,
+    compress,
+    load_codec,
+    migrate,
+    zstandard,
+    zstd_magic,
+)
+from magpie.records import dumps, trim_item
+
+
+class TestFSCache(unittest.TestCase):
+    """Test the cache against each storage backend."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.tmp_dir.name, "cache")
+        self.backends = {
+            "directory": DirectoryBackend(),
+            "sqlite": SQLiteBackend(os.path.join(self.tmp_dir.name, "cache.sqlite3")),
+        }
+
+    def tearDown(self):
+        self.backends["sqlite"].close()
+        self.tmp_dir.cleanup()
+
+    def write_other_files(self, cache_dir: str) -> dict[str, bytes]:
+        """Write files other commands keep under the cache directory, next to the items."""
+        files = {
+            os.path.join(cache_dir, "embeddings", "meta.json"): b'{"model": "m", "dim": 4}',
+            os.path.join(cache_dir, "embeddings", "keys.txt"): b"1\n2\n",
+            os.path.join(cache_dir, "journal.jsonl"): b'{"id": 1}\n',
+            FSCache().path("https://hn.test/v0/maxitem.json", cache_dir): b"42",
+        }
+        for path, content in files.items():
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(content)
+        return files
+
+    def read_files(self, paths) -> dict[str, bytes]:
+        """Read files back as bytes."""
+        contents = {}
+        for path in paths:
+            with open(path, "rb") as f:
+                contents[path] = f.read()
+        return contents
+
+    def test_path(self):
+        """URLs map to paths under the cache dir, with query params folded in."""
+        cache = FSCache()
+        path = cache.path("https://news.ycombinator.com/upvoted?id=pg", cache_dir="./cache")
+        assert path == os.path.join("./cache", "https", "news.ycombinator.com", "upvoted_id=pg")
+
+    def test_round_trip(self):
+        """Saved content loads back and is valid until its lifetime passes."""
+        for name, backend in self.backends.items():
+            with self.subTest(backend=name):
+                cache = FSCache(backend)
+                cache_path = cache.path("https://example.com/item/1.json", self.cache_dir)
+
+                assert not cache.valid(cache_path)
+                cache.save(cache_path, '{"id": 1}')
+                assert cache.valid(cache_path, lifetime=60)
+                assert cache.load(cache_path) == '{"id": 1}'
+
+                backend.write(cache_path, b"{}", timestamp=time.time() - 120)
+                assert not cache.valid(cache_path, lifetime=60)
+
+    def test_get_many(self):
+        """Batched reads return only entries that exist and are still valid."""
+        for name, backend in self.backends.items():
+            with self.subTest(backend=name):
+                cache = FSCache(backend)
+                paths = [cache.path(f"https://example.com/{i}", self.cache_dir) for i in range(4)]
+                cache.save_many({path: str(i) for i, path in enumerate(paths[:3])})
+                backend.write(paths[2], b"stale", timestamp=time.time() - 120)
+
+                assert cache.get_many(paths, lifetime=60) == {paths[0]: "0", paths[1]: "1"}
+
+                cache.clear(self.cache_dir)
+                assert cache.get_many(paths, lifetime=60) == {}
+
+    def test_clear_removes_other_files(self):
+        """Clearing also deletes the plain files kept under the cache directory."""
+        for name, backend in self.backends.items():
+            with self.subTest(backend=name):
+                cache = FSCache(backend)
+                path = cache.path("https://example.com/1", self.cache_dir)
+                cache.save(path, "1")
+                other_files = self.write_other_files(self.cache_dir)
+
+                cache.clear(self.cache_dir)
+                assert not cache.valid(path)
+                assert not any(os.path.exists(other) for other in other_files)
+
+    def test_atomic_write(self):
+        """Directory writes go through a temporary file that never shows up as an entry."""
+        backend = self.backends["directory"]
+        key = os.path.join(self.cache_dir, "item", "1.json")
+        backend.write(key, b'{"id": 1}')
+        backend.write(key, b'{"id": 2}')
+
+        # A temporary file left behind by a killed writer
+        with open(os.path.join(self.cache_dir, "item", ".1.json.tmp"), "wb") as f:
+            f.write(b'{"id"')
+
+        assert sorted(os.listdir(os.path.dirname(key))) == [".1.json.tmp", "1.json"]
+        assert list(backend.keys(self.cache_dir)) == [key]
+        assert backend.read(key)[0] == b'{"id": 2}'
+
+    def test_load_json_discards_corrupt_entries(self):
+        """Truncated JSON is deleted and reported missing so it gets fetched again."""
+        for name, backend in self.backends.items():
+            with self.subTest(backend=name):
+                cache = FSCache(backend)
+                cache_path = cache.path("https://example.com/upvoted?id=pg", self.cache_dir)
+
+                cache.save(cache_path, '[{"id": 1}]')
+                assert cache.load_json(cache_path) == [{"id": 1}]
+
+                cache.save(cache_path, '[{"id": 1')
+                with pytest.raises(FileNotFoundError):
+                    cache.load_json(cache_path)
+                assert backend.read(cache_path) is None
+
+    def test_item_age_ttl(self):
+        """Old items never expire, fresh items expire after a fraction of their age."""
+        policy = ItemAgeTTL(immutable_after_days=14, fresh_lifetime=900, max_lifetime=86400)
+        now = time.time()
+        day = 86400
+
+        assert policy(json.dumps({"time": now - 30 * day}), now) == math.inf
+        assert policy(json.dumps({"time": now - 60}), now) == policy.fresh_lifetime
+        assert policy(json.dumps({"time": now - 12 * day}), now) == policy.max_lifetime
+        assert policy(json.dumps({"time": now - 36000}), now) == pytest.approx(3600)
+        assert policy("null", now) == policy.max_lifetime
+
+        cache = FSCache(self.backends["sqlite"])
+        old, fresh = (cache.path(f"https://example.com/{i}", self.cache_dir) for i in range(2))
+        year_old_item = json.dumps({"time": now - 400 * day})
+        hour_old_item = json.dumps({"time": now - 3600})
+        self.backends["sqlite"].write(old, year_old_item.encode(), timestamp=now - 100 * day)
+        self.backends["sqlite"].write(fresh, hour_old_item.encode(), timestamp=now - 1800)
+
+        # A flat lifetime re-fetches the year-old item; the policy only the fresh one
+        assert cache.get_many([old, fresh], lifetime=day) == {fresh: hour_old_item}
+        assert cache.get_many([old, fresh], policy=policy) == {old: year_old_item}
+        assert cache.valid(old, policy=policy)
+        assert not cache.valid(fresh, policy=policy)
+
+        # Following the change feed since before it was saved keeps the fresh item valid
+        policy.synced_since = now - 3600
+        assert cache.valid(fresh, policy=policy)
+        policy.synced_since = now - 600
+        assert not cache.valid(fresh, policy=policy)
+
+    def test_migrate(self):
+        """Migration copies every item and keeps its timestamp, and leaves other files alone."""
+        source, target = self.backends["directory"], self.backends["sqlite"]
+        cache = FSCache(source)
+        paths = [cache.path(f"https://hn.test/v0/item/{i}.json", self.cache_dir) for i in range(5)]
+        for i, path in enumerate(paths):
+            source.write(path, str(i).encode(), timestamp=1000.0 + i)
+        other_files = self.write_other_files(self.cache_dir)
+
+        expected_count = len(paths)
+        assert migrate(source, target, self.cache_dir, batch_size=2) == expected_count
+        assert target.read_many(paths) == {
+            path: (str(i).encode(), 1000.0 + i) for i, path in enumerate(paths)
+        }
+        assert target.read_many(list(other_files)) == {}
+        assert self.read_files(other_files) == other_files
+
+    @unittest.skipIf(zstandard is None, "zstandard is not installed")
+    def test_compress(self):
+        """Entries are compressed with a trained dictionary and read back transparently."""
+        corpus = Corpus(size=2000)
+        for name, backend in self.backends.items():
+            with self.subTest(backend=name):
+                cache_dir = os.path.join(self.tmp_dir.name, name, "cache")
+                cache = FSCache(backend)
+                items = {
+                    cache.path(f"https://hn.test/v0/item/{item_id}.json", cache_dir): dumps(
+                        trim_item(corpus.item(item_id))
+                    )
+                    for item_id in range(corpus.first_id, corpus.max_id + 1)
+                }
+                cache.save_many(items)
+                other_files = self.write_other_files(cache_dir)
+                plain_size = sum(len(raw) for raw, _ in backend.read_many(list(items)).values())
+                timestamps = {key: ts for key, (_, ts) in backend.read_many(list(items)).items()}
+
+                assert compress(cache, cache_dir, sample_size=1000, dict_size=4096) == len(items)
+                stored = backend.read_many(list(items))
+                assert all(raw.startswith(zstd_magic) for raw, _ in stored.values())
+                assert sum(len(raw) for raw, _ in stored.values()) < plain_size / 2
+                assert {key: ts for key, (_, ts) in stored.items()} == timestamps
+                assert cache.get_many(list(items), lifetime=math.inf) == items
+                assert self.read_files(other_files) == other_files
+
+                # A new process picks up the dictionary; new entries are compressed too
+                reopened = FSCache(backend, load_codec(cache_dir))
+                path = cache.path("https://hn.test/v0/item/1.json", cache_dir)
+                reopened.save(path, '{"id":1}')
+                assert backend.read(path)[0].startswith(zstd_magic)
+                assert reopened.load_json(path) == {"id": 1}
+
+                # Entries from before a retrain stay readable
+                compress(reopened, cache_dir, sample_size=1000, dict_size=2048)
+                assert FSCache(backend, load_codec(cache_dir)).load_json(path) == {"id": 1}
+
+                # Without the dictionary, compressed entries are misses rather than errors
+                assert FSCache(backend).get_many([path], lifetime=math.inf) == {}
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import pytest
+
+from magpie.harvest import StoryIndex, harvest, harvest_around, neighbors_from_index
+from magpie.prepare_dataset import hn_api_url
+
+
+def fake_items(urls, **kwargs):
+    """Every third item is a story with score equal to its ID modulo 10."""
+    items = []
+    for url in urls:
+        item_id = int(url.rsplit("/", 1)[1].split(".")[0])
+        if item_id % 3 == 0:
+            items.append({"id": item_id, "type": "story", "score": item_id % 10, "time": item_id})
+        else:
+            items.append({"id": item_id, "type": "comment", "kids": [1, 2, 3]})
+    return items
+
+
+class TestHarvest(unittest.TestCase):
+    """Test story harvesting and the local story index."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.index_path = os.path.join(self.tmp_dir.name, "story_index.json")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    @patch("magpie.harvest.fetcher")
+    def test_harvest_resumes_and_persists(self, mock_fetcher):
+        """Scanned ranges are persisted and never fetched twice."""
+        mock_fetcher.fetch_json.side_effect = fake_items
+        index = StoryIndex.load(self.index_path)
+
+        added = harvest(index, 1, 51, min_score=3, chunk_size=20)
+
+        # Define constants for test expectations
+        min_score = 3
+        expected_chunks = 3
+        expected_refetched = 10
+
+        stories_in_range = [i for i in range(1, 51) if i % 3 == 0 and i % 10 >= min_score]
+        assert added == len(stories_in_range)
+        assert sorted(index.stories) == stories_in_range
+        assert index.ranges == [range(1, 51)]
+        assert mock_fetcher.fetch_json.call_count == expected_chunks
+
+        # A reloaded index only fetches the part of a wider range it hasn't seen
+        reloaded = StoryIndex.load(self.index_path)
+        assert reloaded.stories == index.stories
+        mock_fetcher.fetch_json.reset_mock()
+        harvest(reloaded, 40, 61, min_score=min_score, chunk_size=20)
+        requested = mock_fetcher.fetch_json.call_args.args[0]
+        assert requested[0].endswith("/item/51.json")
+        assert len(requested) == expected_refetched
+
+    @patch("magpie.harvest.fetcher")
+    def test_harvest_saves_periodically_and_on_interrupt(self, mock_fetcher):
+        """The index isn't rewritten after every chunk, but an interrupted harvest is saved."""
+        mock_fetcher.fetch_json.side_effect = fake_items
+        index = StoryIndex(self.index_path)
+        with patch.object(StoryIndex, "save", autospec=True) as mock_save:
+            harvest(index, 1, 101, chunk_size=10, save_interval=3600)
+        mock_save.assert_called_once_with(index)
+
+        def interrupted(urls, **kwargs):
+            if urls[0].endswith("/item/121.json"):
+                raise KeyboardInterrupt
+            return fake_items(urls)
+
+        mock_fetcher.fetch_json.side_effect = interrupted
+        with pytest.raises(KeyboardInterrupt):
+            harvest(index, 1, 201, chunk_size=10, save_interval=3600)
+        assert StoryIndex.load(self.index_path).ranges == [range(1, 121)]
+
+    @patch("magpie.harvest.fetcher")
+    def test_harvest_leaves_failed_items_unscanned(self, mock_fetcher):
+        """IDs that couldn't be fetched are retried by the next harvest."""
+
+        def flaky_items(urls, failed):
+            failed.update(url for url in urls if url.endswith(("/7.json", "/8.json")))
+            items = fake_items(urls)
+            return [None if url in failed else item for url, item in zip(urls, items, strict=True)]
+
+        mock_fetcher.fetch_json.side_effect = flaky_items
+        index = StoryIndex(self.index_path)
+        harvest(index, 1, 21, chunk_size=10)
+        assert index.ranges == [range(1, 7), range(9, 21)]
+
+        mock_fetcher.fetch_json.side_effect = fake_items
+        harvest(index, 1, 21, chunk_size=10)
+        assert index.ranges == [range(1, 21)]
+        assert mock_fetcher.fetch_json.call_args.args[0][0].endswith("/item/7.json")
+
+    @patch("magpie.harvest.fetcher")
+    def test_harvest_around_stops_at_max_item(self, mock_fetcher):
+        """IDs past the newest item are left alone, and a covered re-run makes no requests."""
+        max_item_id = 60
+
+        def items_and_max_item(urls, **kwargs):
+            if urls == [f"{hn_api_url}/maxitem.json"]:
+                return [max_item_id]
+            return fake_items(urls)
+
+        mock_fetcher.fetch_json.side_effect = items_and_max_item
+        index = StoryIndex(self.index_path)
+        upvotes = [{"id": 30}, {"id": 55}]
+        harvest_around(index, upvotes, margin=10)
+        assert index.ranges == [range(20, 61)]
+
+        reloaded = StoryIndex.load(self.index_path)
+        mock_fetcher.fetch_json.reset_mock()
+        assert harvest_around(reloaded, upvotes, margin=10) == 0
+        mock_fetcher.fetch_json.assert_not_called()
+
+        # Newer upvotes reach past the known max item, so it is asked for again
+        max_item_id = 80
+        harvest_around(reloaded, [{"id": 75}], margin=10)
+        assert reloaded.ranges == [range(20, 61), range(65, 81)]
+
+    @patch("magpie.harvest.fetcher")
+    def test_neighbors_from_index(self, mock_fetcher):
+        """Neighbors come from the index, with no network calls once it is covered."""
+        mock_fetcher.fetch_json.side_effect = fake_items
+        index = StoryIndex(self.index_path)
+        harvest(index, 1, 101, min_score=3)
+        mock_fetcher.fetch_json.reset_mock()
+
+        upvotes = [{"id": 33, "time": 33}, {"id": 90, "time": 90.5}]
+        assert harvest_around(index, upvotes, margin=10) == 0
+        mock_fetcher.fetch_json.assert_not_called()
+
+        by_id = neighbors_from_index(index, upvotes, 2, exclude_ids={33})
+        assert [[s["id"] for s in items] for items in by_id] == [[36, 27], [87, 93]]
+
+        by_time = neighbors_from_index(index, upvotes, 1, by="time", min_score=5)
+        assert [[s["id"] for s in items] for items in by_time] == [[36], [87]]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from transformers import BertConfig, BertForSequenceClassification, BertTokenizer
+
+from magpie.infer import Scorer, check_parity, export_onnx, quantize, score, story_texts
+
+vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "show", "hn", "a", "new", "story"]
+
+
+class TestInfer(unittest.TestCase):
+    """Test ONNX export, quantization and batched scoring on a tiny model."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.model_dir = os.path.join(cls.tmp_dir.name, "model")
+        cls.onnx_dir = os.path.join(cls.tmp_dir.name, "onnx")
+        os.makedirs(cls.model_dir)
+
+        vocab_path = os.path.join(cls.model_dir, "vocab.txt")
+        with open(vocab_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(vocab))
+        BertTokenizer(vocab_path).save_pretrained(cls.model_dir)
+        config = BertConfig(
+            vocab_size=len(vocab),
+            hidden_size=32,
+            num_hidden_layers=2,
+            num_attention_heads=2,
+            intermediate_size=64,
+        )
+        BertForSequenceClassification(config).save_pretrained(cls.model_dir)
+
+        export_onnx(cls.model_dir, cls.onnx_dir)
+        quantize(cls.onnx_dir)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+    def test_parity(self):
+        """Both ONNX models agree with the PyTorch model."""
+        texts = ["show hn", "a new story story story", "new", "story"] * 5
+        report = check_parity(texts, self.model_dir, self.onnx_dir)
+
+        max_fp32_diff, max_int8_diff = 1e-4, 0.05
+        assert report["fp32_max_abs_diff"] < max_fp32_diff
+        assert report["int8_max_abs_diff"] < max_int8_diff
+
+    def test_score_batches_keep_order(self):
+        """Length-sorted batching returns probabilities in input order."""
+        texts = ["a new story story story", "new", "show hn a story", "story"]
+        scorer = Scorer(self.onnx_dir, quantized=False, batch_size=2, threads=1)
+
+        batched = scorer.score(texts)
+        one_by_one = np.concatenate([scorer.score([text]) for text in texts])
+
+        np.testing.assert_allclose(batched, one_by_one, atol=1e-5)
+        assert ((batched >= 0) & (batched <= 1)).all()
+        assert score(texts, directory=self.onnx_dir).shape == (len(texts),)
+
+    def test_story_texts(self):
+        """Stories are formatted the same way as the training samples."""
+        stories = [
+            {"id": 1, "type": "story", "title": "Title", "url": "https://s1.com/a"},
+            {"id": 2, "title": "Ask HN: x"},
+        ]
+        assert story_texts(stories) == ["Title\nSource: s1.com", "Ask HN: x"]
+
+
+if __name__ == "__main__":
+    unittest.main()
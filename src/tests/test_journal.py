@@ -0,0 +1,57 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from magpie.journal import Journal
+
+
+class TestJournal(unittest.TestCase):
+    """Test the progress journal that lets dataset preparation resume."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "cache", "journal.jsonl")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_resume(self):
+        """Finished stages and records survive a crash, including a torn last line."""
+        journal = Journal(self.path, key="run")
+        assert not journal.resumed
+        journal.finish("upvotes", [{"id": 1}, {"id": 2}])
+        journal.record("neighbors", 1, [{"id": 0}])
+        journal.close()
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write('{"record": "neighbors", "id": 2, "val')
+
+        resumed = Journal(self.path, key="run")
+        assert resumed.resumed
+        assert resumed.done("upvotes")
+        assert resumed.result("upvotes") == [{"id": 1}, {"id": 2}]
+        assert resumed.get("neighbors") == {1: [{"id": 0}]}
+
+        resumed.complete()
+        assert not os.path.exists(self.path)
+
+    def test_other_runs_start_fresh(self):
+        """A journal from different settings, or a stale one, is discarded."""
+        journal = Journal(self.path, key="window")
+        journal.finish("upvotes", [])
+        journal.close()
+
+        other = Journal(self.path, key="index")
+        assert not other.resumed
+        other.finish("upvotes", [])
+        other.close()
+
+        an_hour = 3600
+        with patch("magpie.journal.time.time", return_value=os.path.getmtime(self.path) + an_hour):
+            stale = Journal(self.path, key="index", max_age=60)
+        assert not stale.resumed
+        stale.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
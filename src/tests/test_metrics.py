@@ -0,0 +1,95 @@
+import json
+import os
+import tempfile
+import unittest
+from argparse import Namespace
+
+import pytest
+
+from magpie.fscache import FSCache
+from magpie.metrics import Metrics, metrics, recording
+
+
+class TestMetrics(unittest.TestCase):
+    """Test run instrumentation and its JSON and Prometheus reports."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_report(self):
+        """Timers, counters, gauges and histograms all end up in the report."""
+        run = Metrics()
+        with run.timer("stage.fetch"):
+            pass
+        with run.timer("stage.fetch"):
+            pass
+        run.count("cache.hits", 3)
+        run.count("cache.hits")
+        run.gauge("train.tokens_per_second", 1234.5)
+        for seconds in (0.005, 0.2, 60):
+            run.observe("http.request_seconds", seconds)
+
+        report = run.report("prepare")
+        expected_hits = 4
+        assert report["run"] == "prepare"
+        assert report["timers"]["stage.fetch"]["calls"] == len(["first", "second"])
+        assert report["counters"] == {"cache.hits": expected_hits}
+        assert report["gauges"] == {"train.tokens_per_second": 1234.5}
+
+        histogram = report["histograms"]["http.request_seconds"]
+        assert histogram["count"] == len((0.005, 0.2, 60))
+        assert histogram["buckets"]["0.01"] == 1
+        assert histogram["buckets"]["0.25"] == len((0.005, 0.2))
+        assert histogram["buckets"]["+Inf"] == histogram["count"]
+
+    def test_prometheus(self):
+        """The textfile uses valid metric names, the run label and cumulative buckets."""
+        run = Metrics()
+        run.count("http.status.200", 2)
+        run.observe("http.request_seconds", 0.02)
+
+        text = run.prometheus("prepare")
+        assert 'magpie_http_status_200_total{run="prepare"} 2' in text
+        assert 'magpie_http_request_seconds_bucket{run="prepare",le="0.01"} 0' in text
+        assert 'magpie_http_request_seconds_bucket{run="prepare",le="+Inf"} 1' in text
+        assert "# TYPE magpie_http_request_seconds histogram" in text
+
+    def test_recording_writes_reports(self):
+        """A recorded run writes both reports, including its stage timer, even on failure."""
+        report_path = os.path.join(self.tmp_dir.name, "report.json")
+        prom_path = os.path.join(self.tmp_dir.name, "magpie.prom")
+        args = Namespace(metrics_report=report_path, prometheus_textfile=prom_path)
+
+        def failing_run():
+            with recording("prepare", args):
+                metrics.count("items")
+                raise RuntimeError
+
+        with pytest.raises(RuntimeError):
+            failing_run()
+
+        with open(report_path, encoding="utf-8") as f:
+            report = json.load(f)
+        assert report["counters"] == {"items": 1}
+        assert "stage.prepare" in report["timers"]
+        assert os.path.exists(prom_path)
+
+    def test_cache_hits_and_misses(self):
+        """FSCache lookups are counted as hits and misses."""
+        cache = FSCache()
+        path = cache.path("https://example.com/item/1.json", cache_dir=self.tmp_dir.name)
+        cache.save(path, "{}")
+        missing = path.replace("1.json", "2.json")
+
+        metrics.reset()
+        cache.get_many([path, missing])
+        assert cache.valid(path)
+
+        assert metrics.counters == {"cache.hits": 2, "cache.misses": 1}
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+
+import pytest
+
+from magpie.parsing import (
+    page_parsers,
+    parse_absolute_time,
+    parse_relative_time,
+    parse_upvoted_page,
+)
+from magpie.prepare_dataset import parse_upvote
+
+page = """
+<html><body><table>
+    <tr class="athing submission" id="42">
+        <td class="title"><span class="rank">1.</span></td>
+        <td class="title"><span class="titleline">
+            <a href="https://example.com/a">First Story</a>
+            <span class="sitebit comhead"> (<a href="from?site=example.com">
+                <span class="sitestr">example.com</span></a>)</span>
+        </span></td>
+    </tr>
+    <tr><td class="subtext"><span class="subline">
+        <span class="age" title="2024-06-01T12:00:00 1717243200">
+            <a href="item?id=42">3 hours ago</a>
+        </span>
+    </span></td></tr>
+    <tr class="athing submission" id="41">
+        <td class="title"><span class="titleline">
+            <a href="item?id=41">Ask HN: Second</a>
+        </span></td>
+    </tr>
+    <tr><td class="subtext">
+        <span class="age"><a href="item?id=41">an hour ago</a></span>
+    </td></tr>
+</table></body></html>
+"""
+
+
+class TestParsing(unittest.TestCase):
+    """Test upvoted page parsing and time resolution."""
+
+    def test_backends_agree(self):
+        """Every parser backend extracts the same rows."""
+        results = {name: parse_upvoted_page(page, backend=name) for name in page_parsers}
+        expected_rows = 2
+
+        for name, rows in results.items():
+            with self.subTest(backend=name):
+                assert len(rows) == expected_rows
+                (href, _, absolute), (link, title) = rows[0]
+                assert (href, absolute, link, title) == (
+                    "item?id=42",
+                    "2024-06-01T12:00:00 1717243200",
+                    "https://example.com/a",
+                    "First Story",
+                )
+                assert rows[1][0][2] is None
+                assert [parse_upvote(row)["id"] for row in rows] == [42, 41]
+
+    def test_empty_page(self):
+        """Pages without upvotes parse to nothing."""
+        for name in page_parsers:
+            assert parse_upvoted_page("<html></html>", backend=name) == []
+
+    def test_parse_absolute_time(self):
+        """Absolute times come from the unix timestamp or the UTC ISO date."""
+        expected = 1717243200.0
+        assert parse_absolute_time("2024-06-01T12:00:00 1717243200") == expected
+        assert parse_absolute_time("2024-06-01T12:00:00") == expected
+        assert parse_absolute_time("not a date") is None
+        assert parse_absolute_time(None) is None
+
+    def test_parse_relative_time(self):
+        """The "N units ago" grammar is resolved without dateparser."""
+        now = 1_000_000.0
+        assert parse_relative_time("3 hours ago", now) == pytest.approx(now - 3 * 3600)
+        assert parse_relative_time("an hour ago", now) == pytest.approx(now - 3600)
+        assert parse_relative_time("1 minute ago", now) == pytest.approx(now - 60)
+        assert parse_relative_time("2 years ago", now) == pytest.approx(now - 2 * 365 * 86400)
+        assert parse_relative_time("on June 1st", now) is None
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,66 @@
 import os
+import tempfile
 import unittest
+from collections.abc import Callable, Iterable
+from typing import Any
 from unittest.mock import MagicMock, patch
 
-from magpie.prepare_dataset import download_upvotes, get_neighbor_stories
+from magpie.datastore import latest_version, user_dir
+from magpie.fetch import FetchError
+from magpie.fscache import fscache
+from magpie.prepare_dataset import (
+    collect_neighbors,
+    create_and_process_dataset,
+    download_upvotes,
+    get_cached_items_by_ids,
+    get_host,
+    get_neighbor_stories,
+    hn_api_url,
+    merge_id_ranges,
+    run,
+    samples_to_record_batch,
+)
+
+
+def upvoted_page(item_ids: list[int]) -> str:
+    """Build a minimal upvoted page listing the given item IDs."""
+    rows = "".join(
+        f"""
+        <tr><td class="title"><span class="titleline">
+            <a href="https://example.com/{item_id}">Story {item_id}</a>
+        </span></td></tr>
+        <tr><td class="subtext">
+            <span class="age"><a href="item?id={item_id}">3 hours ago</a></span>
+        </td></tr>
+        """
+        for item_id in item_ids
+    )
+    return f"<html><body><table>{rows}</table></body></html>"
+
+
+def item_id_of(url: str) -> int:
+    """Get the ID of the item an API item URL asks for."""
+    return int(url.rsplit("/", 1)[1].split(".", maxsplit=1)[0])
+
+
+def serve_items(items: dict[int, Any], failing: Iterable[int] = ()) -> Callable:
+    """
+    Build a stand-in for `fetcher.fetch_json` that answers item URLs from `items`.
+
+    Like the real fetcher, items in `failing` come back as None, with their URLs
+    added to `failed`; unknown items come back as None (deleted or missing).
+    """
+    failing = set(failing)
+
+    def fetch_json(urls, *, strict=False, failed=None):
+        failed_urls = [url for url in urls if item_id_of(url) in failing]
+        if strict and failed_urls:
+            raise FetchError(failed_urls[0], "HTTP 503")
+        if failed is not None:
+            failed.update(failed_urls)
+        return [None if url in failed_urls else items.get(item_id_of(url)) for url in urls]
+
+    return fetch_json
 
 
 class TestPrepareDataset(unittest.TestCase):
@@ -43,7 +101,11 @@ class TestPrepareDataset(unittest.TestCase):
         mock_session.return_value.__enter__.return_value = session_instance
 
         # Set environment variable for the test
-        with patch.dict(os.environ, {"HN_USER_COOKIE": "test_cookie"}):
+        with (
+            patch.dict(os.environ, {"HN_USER_COOKIE": "test_cookie"}),
+            tempfile.TemporaryDirectory() as tmp_dir,
+            patch("magpie.prepare_dataset.cache_dir", tmp_dir),
+        ):
             result = download_upvotes("testuser")
 
         # Verify session was used correctly
@@ -57,9 +119,41 @@ class TestPrepareDataset(unittest.TestCase):
         expected_result_count = 1  # Updated to match actual HTML parsing
         assert len(result) == expected_result_count
 
-    @patch("magpie.prepare_dataset.get_item_by_id")
     @patch("magpie.prepare_dataset.time.sleep")
-    def test_get_neighbor_stories(self, mock_sleep, mock_get_item):
+    @patch("magpie.prepare_dataset.requests.Session")
+    def test_download_upvotes_incremental(self, mock_session, mock_sleep):
+        """Test that an expired upvote cache is refreshed from the newest page only."""
+        session_instance = MagicMock()
+        mock_session.return_value.__enter__.return_value = session_instance
+
+        with (
+            tempfile.TemporaryDirectory() as tmp_dir,
+            patch("magpie.prepare_dataset.cache_dir", tmp_dir),
+        ):
+            # First run scrapes every page
+            session_instance.get.side_effect = [
+                MagicMock(text=upvoted_page([5, 4])),
+                MagicMock(text=upvoted_page([3])),
+                MagicMock(text=upvoted_page([])),
+            ]
+            first = download_upvotes("testuser")
+            assert [upvote["id"] for upvote in first] == [5, 4, 3]
+
+            # Later, after the cache expired, two new upvotes sit on top of page 1
+            session_instance.get.reset_mock()
+            session_instance.get.side_effect = [MagicMock(text=upvoted_page([7, 6, 5]))]
+            with patch("magpie.prepare_dataset.fscache.valid", return_value=False):
+                second = download_upvotes("testuser")
+
+            # Only one page was requested, and the new upvotes were merged in front
+            session_instance.get.assert_called_once()
+            assert [upvote["id"] for upvote in second] == [7, 6, 5, 4, 3]
+
+            # The merged list is what gets stored
+            assert [upvote["id"] for upvote in download_upvotes("testuser")] == [7, 6, 5, 4, 3]
+
+    @patch("magpie.prepare_dataset.fetcher")
+    def test_get_neighbor_stories(self, mock_fetcher):
         """Test get_neighbor_stories function with mocked API."""
         # Create test data
         good_story = {
@@ -70,32 +164,264 @@ class TestPrepareDataset(unittest.TestCase):
             "title": "Test Story",
             "url": "https://example.com",
         }
+        other_story = {**good_story, "id": 9998, "title": "Other Story"}
         bad_story = {"type": "story", "dead": True, "score": 1, "id": 10002}
         comment = {"type": "comment", "id": 10003}
+        items = {item["id"]: item for item in [good_story, other_story, bad_story, comment]}
 
-        # Mock the API responses
-        mock_get_item.side_effect = [
-            good_story,  # First call returns a good story
-            bad_story,  # Second call returns a dead story
-            comment,  # Third call returns a comment
-            good_story,  # Fourth call returns another good story
-        ]
+        # Mock the API responses, keyed by the item ID in each URL
+        mock_fetcher.fetch_json.side_effect = serve_items(items)
 
-        # Call the function
-        result = get_neighbor_stories(10000, 2)
+        # Call the function with an empty cache
+        with (
+            tempfile.TemporaryDirectory() as tmp_dir,
+            patch("magpie.prepare_dataset.cache_dir", tmp_dir),
+        ):
+            result = get_neighbor_stories(10000, 2)
+
+            # A second call is served entirely from the cache
+            cached_result = get_neighbor_stories(10000, 2)
 
         # Define constants for test expectations
         expected_result_count = 2
-        expected_item_id = 10001
-        expected_api_calls = 4
+        expected_ids = [9998, 10001]
 
         # Verify results
         assert len(result) == expected_result_count
-        assert result[0]["id"] == expected_item_id
-        assert result[1]["id"] == expected_item_id  # Same as first due to our mock setup
+        assert [item["id"] for item in result] == expected_ids
+        assert cached_result == result
+
+        # The whole window is fetched in one concurrent batch, and only once
+        mock_fetcher.fetch_json.assert_called_once()
+        requested_urls = mock_fetcher.fetch_json.call_args.args[0]
+        assert requested_urls[0] == "https://hacker-news.firebaseio.com/v0/item/9996.json"
+        assert len(requested_urls) == 2 * 2 * expected_result_count
+
+    @patch("magpie.prepare_dataset.fetcher")
+    def test_collect_neighbors(self, mock_fetcher):
+        """Test that overlapping upvote windows are fetched once and shared."""
+        stories = {
+            item_id: {"type": "story", "score": 10, "id": item_id, "title": f"Story {item_id}"}
+            for item_id in [98, 101, 103, 195, 200]
+        }
+        mock_fetcher.fetch_json.side_effect = serve_items(stories)
+        upvotes = [{"id": 100}, {"id": 101}, {"id": 200}]
+
+        with (
+            tempfile.TemporaryDirectory() as tmp_dir,
+            patch("magpie.prepare_dataset.cache_dir", tmp_dir),
+        ):
+            result = collect_neighbors(upvotes, 1, exclude_ids={100, 101, 200})
+
+        # Upvoted items are never used as neighbors; short upvotes widen their window
+        assert [[item["id"] for item in items] for items in result] == [[98], [98], [195]]
+
+        # Every ID is requested once, however much the windows overlap
+        requested = [url for call in mock_fetcher.fetch_json.call_args_list for url in call.args[0]]
+        expected_unique_ids = 16
+        assert len(requested) == len(set(requested)) == expected_unique_ids
+
+    @patch("magpie.prepare_dataset.fetcher")
+    def test_collect_neighbors_resumes(self, mock_fetcher):
+        """Upvotes finished by an earlier run are skipped; finished ones are reported."""
+        stories = {
+            item_id: {"type": "story", "score": 10, "id": item_id, "title": f"Story {item_id}"}
+            for item_id in [98, 195, 299]
+        }
+        mock_fetcher.fetch_json.side_effect = serve_items(stories)
+        upvotes = [{"id": 100}, {"id": 200}, {"id": 300}]
+        finished = {}
+
+        with (
+            tempfile.TemporaryDirectory() as tmp_dir,
+            patch("magpie.prepare_dataset.cache_dir", tmp_dir),
+        ):
+            result = collect_neighbors(
+                upvotes,
+                1,
+                chunk_size=4,
+                done={100: [stories[98]]},
+                on_collected=finished.__setitem__,
+            )
+
+        assert [[item["id"] for item in items] for items in result] == [[98], [195], [299]]
+        assert finished == {200: [stories[195]], 300: [stories[299]]}
+
+        # The finished upvote's window was never fetched
+        requested = {
+            item_id_of(url)
+            for call in mock_fetcher.fetch_json.call_args_list
+            for url in call.args[0]
+        }
+        assert not requested & set(range(98, 102))
+
+    @patch("magpie.prepare_dataset.fetcher")
+    def test_corrupt_cache_entries_are_refetched(self, mock_fetcher):
+        """A truncated cached item is fetched again instead of crashing the run."""
+        item = {"type": "story", "id": 1, "time": 0}
+        mock_fetcher.fetch_json.side_effect = serve_items({1: item})
 
-        # Verify API was called correctly
-        assert mock_get_item.call_count == expected_api_calls
+        with (
+            tempfile.TemporaryDirectory() as tmp_dir,
+            patch("magpie.prepare_dataset.cache_dir", tmp_dir),
+        ):
+            path = fscache.path(f"{hn_api_url}/item/1.json", cache_dir=tmp_dir)
+            fscache.save(path, '{"type": "sto')
+
+            assert get_cached_items_by_ids([1]) == [item]
+            assert fscache.load_json(path) == item
+
+    @patch("magpie.prepare_dataset.fetcher")
+    def test_items_are_trimmed(self, mock_fetcher):
+        """Fetched items are cached and returned without fields the pipeline never reads."""
+        item = {"type": "story", "id": 1, "time": 0, "score": 5, "kids": [2, 3, 4]}
+        mock_fetcher.fetch_json.side_effect = serve_items({1: item})
+
+        with (
+            tempfile.TemporaryDirectory() as tmp_dir,
+            patch("magpie.prepare_dataset.cache_dir", tmp_dir),
+        ):
+            trimmed = {"type": "story", "id": 1, "time": 0, "score": 5}
+            assert get_cached_items_by_ids([1]) == [trimmed]
+
+            path = fscache.path(f"{hn_api_url}/item/1.json", cache_dir=tmp_dir)
+            assert fscache.load_json(path) == trimmed
+
+    @patch("magpie.prepare_dataset.fetcher")
+    def test_failed_items_are_reported_and_retried(self, mock_fetcher):
+        """Items that couldn't be fetched are told apart from deleted ones and not cached."""
+        item = {"type": "story", "id": 1, "time": 0}
+        mock_fetcher.fetch_json.side_effect = serve_items({1: item}, failing={2})
+
+        with (
+            tempfile.TemporaryDirectory() as tmp_dir,
+            patch("magpie.prepare_dataset.cache_dir", tmp_dir),
+        ):
+            failed = set()
+            assert get_cached_items_by_ids([1, 2, 3], failed=failed) == [item, None, None]
+            assert failed == {2}
+
+            # Only the failed item is fetched again; the deleted one is cached as null
+            other = {**item, "id": 2}
+            mock_fetcher.fetch_json.side_effect = serve_items({1: item, 2: other})
+            failed.clear()
+            assert get_cached_items_by_ids([1, 2, 3], failed=failed) == [item, other, None]
+            assert failed == set()
+            assert [item_id_of(url) for url in mock_fetcher.fetch_json.call_args.args[0]] == [2]
+
+    def test_samples_to_record_batch(self):
+        """Test that vectorized host/text derivation matches get_host."""
+        links = [
+            "https://example.com/path/to/resource",
+            "http://example.com:8080/path?q=1",
+            "https://user@sub.example.org#frag",
+            "example.com/path",
+            "",
+            None,
+        ]
+        samples = [
+            {"label": 1, "id": i, "link": link, "title": f"T{i}", "time": i}
+            for i, link in enumerate(links)
+        ]
+
+        batch = samples_to_record_batch(samples).to_pydict()
+
+        assert batch["host"] == [get_host(link or "") for link in links]
+        assert batch["text"][0] == "T0\nSource: example.com"
+        assert batch["text"][3] == "T3"
+
+    @patch("datasets.DatasetDict.push_to_hub")
+    def test_create_and_process_dataset(self, mock_push):
+        """Test that upvotes and flattened neighbors end up in a split dataset."""
+        upvotes = [
+            {"id": i, "link": f"https://up{i}.com/", "title": f"Up {i}", "time": float(i)}
+            for i in range(10)
+        ]
+        neighbors = [
+            [{"id": 100 + i, "url": f"https://n{i}.com/", "title": f"N {i}", "time": i}]
+            for i in range(10)
+        ]
+
+        with (
+            tempfile.TemporaryDirectory() as tmp_dir,
+            patch("magpie.prepare_dataset.cache_dir", tmp_dir),
+            patch("magpie.datastore.dataset_dir", os.path.join(tmp_dir, "data")),
+        ):
+            dataset = create_and_process_dataset(upvotes, neighbors)
+            rows = [*dataset["train"], *dataset["test"]]
+            version = latest_version()
+            mock_push.assert_not_called()
+
+            # Unchanged samples reuse the saved version, and only push when asked to
+            rerun = create_and_process_dataset(upvotes, neighbors, push_to_hub="user/repo")
+            assert latest_version() == version
+            assert rerun["train"]["id"] == dataset["train"]["id"]
+            mock_push.assert_called_once_with("user/repo")
+
+            # New samples make a new version, and the existing rows keep their split
+            more = [
+                {"id": i, "link": f"https://up{i}.com/", "title": f"Up {i}", "time": float(i)}
+                for i in range(10, 40)
+            ]
+            grown = create_and_process_dataset(upvotes + more, neighbors)
+            assert latest_version() != version
+            assert set(dataset["train"]["id"]) <= set(grown["train"]["id"])
+            assert set(dataset["test"]["id"]) <= set(grown["test"]["id"])
+
+        expected_rows = 20
+        assert len(rows) == expected_rows
+        assert sum(row["label"] for row in rows) == len(upvotes)
+        assert {row["host"] for row in rows if row["label"] == 0} == {
+            f"n{i}.com" for i in range(10)
+        }
+
+    @patch("magpie.prepare_dataset.download_upvotes")
+    @patch("magpie.prepare_dataset.fetcher")
+    def test_run_for_several_users(self, mock_fetcher, mock_download):
+        """Users share one pool of neighbors, and each gets a dataset of their own upvotes."""
+        stories = {
+            item_id: {"type": "story", "score": 10, "id": item_id, "title": f"Story {item_id}"}
+            for item_id in [98, 195, 299]
+        }
+
+        def upvote(item_id):
+            return {"id": item_id, "link": f"https://up{item_id}.com/", "title": "Up", "time": 0.0}
+
+        mock_fetcher.fetch_json.side_effect = serve_items(stories)
+        upvotes = {"alice": [upvote(100), upvote(200)], "bob": [upvote(200), upvote(300)]}
+        mock_download.side_effect = lambda username, incremental=True: upvotes[username]
+
+        with (
+            tempfile.TemporaryDirectory() as tmp_dir,
+            patch("magpie.prepare_dataset.cache_dir", tmp_dir),
+            patch("magpie.datastore.dataset_dir", os.path.join(tmp_dir, "data")),
+        ):
+            datasets = run(usernames=["alice", "bob"])
+
+            # Neither is the default user, so both got their own dataset directory
+            assert latest_version() is None
+            assert latest_version(user_dir("alice")) is not None
+            assert latest_version(user_dir("bob")) is not None
+
+        labels = {
+            username: {(row["id"], row["label"]) for row in [*dataset["train"], *dataset["test"]]}
+            for username, dataset in datasets.items()
+        }
+        assert labels == {
+            "alice": {(100, 1), (200, 1), (98, 0), (195, 0)},
+            "bob": {(200, 1), (300, 1), (195, 0), (299, 0)},
+        }
+
+        # The neighbors of the upvote they share were only looked up once
+        requested = [url for call in mock_fetcher.fetch_json.call_args_list for url in call.args[0]]
+        assert len(requested) == len(set(requested))
+
+    def test_merge_id_ranges(self):
+        """Test merging of overlapping and adjacent ID ranges."""
+        merged = merge_id_ranges(
+            [range(10, 14), range(1, 5), range(12, 20), range(5, 6), range(30, 30)]
+        )
+        assert merged == [range(1, 6), range(10, 20)]
 
 
 if __name__ == "__main__":
@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from datasets import Dataset, DatasetDict
+from transformers import BertTokenizer
+
+from magpie.train.pretokenize import TokenizedCollator, pretokenize, tokenizer_fingerprint
+
+vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "show", "hn", "a", "new", "story"]
+
+
+def make_tokenizer(directory: str, words: list[str]) -> BertTokenizer:
+    """Build a tiny word-level BERT tokenizer."""
+    path = os.path.join(directory, "vocab.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(words))
+    return BertTokenizer(path)
+
+
+class TestPretokenize(unittest.TestCase):
+    """Test cached tokenization and padding of pre-tokenized batches."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp_dir.name, "tokenized")
+        self.tokenizer = make_tokenizer(self.tmp_dir.name, vocab)
+        texts = ["show hn a new story", "story", "a story", "new"]
+        self.dataset = DatasetDict(
+            {
+                "train": Dataset.from_dict(
+                    {
+                        "text": texts[:2],
+                        "label": [1, 0],
+                        "time": [1.0, 2.0],
+                    }
+                ),
+                "test": Dataset.from_dict({"text": texts[2:], "label": [0, 1], "time": [3.0, 4.0]}),
+            }
+        )
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_pretokenize(self):
+        """Splits are tokenized with lengths, the test split sorted by length."""
+        tokenized = pretokenize(self.dataset, self.tokenizer, max_length=4, root=self.root)
+
+        assert set(tokenized["train"].column_names) >= {"input_ids", "labels", "length", "time"}
+        assert "text" not in tokenized["train"].column_names
+        # [CLS] + 5 words + [SEP], truncated to 4 tokens
+        assert tokenized["train"]["length"] == [4, 3]
+        assert tokenized["test"]["length"] == [3, 4]
+        assert tokenized["test"]["labels"] == [1, 0]
+
+    def test_pretokenize_is_cached(self):
+        """Tokenization runs once per dataset, tokenizer and max length."""
+        pretokenize(self.dataset, self.tokenizer, root=self.root)
+
+        with patch("datasets.DatasetDict.map") as mock_map:
+            pretokenize(self.dataset, self.tokenizer, root=self.root)
+            mock_map.assert_not_called()
+
+        other_dir = os.path.join(self.tmp_dir.name, "other")
+        os.makedirs(other_dir)
+        other_tokenizer = make_tokenizer(other_dir, [*vocab, "extra"])
+        assert tokenizer_fingerprint(other_tokenizer) != tokenizer_fingerprint(self.tokenizer)
+
+        pretokenize(self.dataset, other_tokenizer, root=self.root)
+        pretokenize(self.dataset, self.tokenizer, max_length=8, root=self.root)
+        expected_entries = 3
+        assert len(os.listdir(self.root)) == expected_entries
+
+    def test_collator(self):
+        """Batches are padded to their longest example, without bookkeeping columns."""
+        tokenized = pretokenize(self.dataset, self.tokenizer, root=self.root)
+        collator = TokenizedCollator(self.tokenizer, pad_to_multiple_of=None)
+
+        batch = collator(list(tokenized["test"]))
+
+        assert "length" not in batch
+        assert "time" not in batch
+        assert batch["input_ids"].shape == (2, max(tokenized["test"]["length"]))
+        assert batch["labels"].tolist() == [1, 0]
+
+
+if __name__ == "__main__":
+    unittest.main()
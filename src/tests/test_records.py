@@ -0,0 +1,59 @@
+import json
+import unittest
+
+from magpie.records import Story, dumps, loads, trim_item
+
+
+def api_item(item_id: int) -> dict:
+    """A story as the Firebase API returns it, comment IDs and all."""
+    return {
+        "id": item_id,
+        "type": "story",
+        "by": "pg",
+        "time": 1700000000,
+        "title": "A popular story",
+        "url": "https://example.com/",
+        "score": 500,
+        "descendants": 300,
+        "kids": list(range(item_id + 1, item_id + 301)),
+    }
+
+
+class TestRecords(unittest.TestCase):
+    """Test item trimming, the Story record and the JSON codec."""
+
+    def test_trim_item(self):
+        """Only the fields the pipeline reads survive, and the item shrinks a lot."""
+        item = api_item(1)
+        trimmed = trim_item(item)
+
+        assert set(trimmed) == {"id", "type", "by", "time", "title", "url", "score"}
+        min_shrink = 5
+        assert len(json.dumps(item)) > min_shrink * len(dumps(trimmed))
+        assert trim_item(None) is None
+
+    def test_story_round_trip(self):
+        """A Story converts back to the trimmed item, and has no per-instance dict."""
+        story = Story.from_item(api_item(1))
+        assert story.as_item() == trim_item(api_item(1))
+        assert Story.from_item(story.as_item()) == story
+        assert not hasattr(story, "__dict__")
+
+        assert Story(2, title="Ask HN").as_item() == {
+            "id": 2,
+            "type": "story",
+            "title": "Ask HN",
+            "score": 0,
+        }
+
+    def test_codec(self):
+        """Values round-trip through compact JSON, read back from text or bytes."""
+        data = {"stories": [trim_item(api_item(1))], "ranges": [[1, 2]]}
+        encoded = dumps(data)
+        assert json.loads(encoded) == data
+        assert ", " not in encoded
+        assert loads(encoded) == loads(encoded.encode()) == data
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import math
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from benchmarks.fake_hn import Corpus, FakeHN
+
+from magpie.fscache import fscache
+from magpie.prepare_dataset import get_cached_items_by_ids
+from magpie.refresh import FeedState, poll
+
+
+class TestRefresh(unittest.TestCase):
+    """Test following the change feed against the local HN stand-in."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.corpus = Corpus(size=500, story_density=0.5)
+        self.fake = FakeHN(self.corpus).start()
+        self.state = FeedState(os.path.join(self.tmp_dir.name, "changefeed.json"))
+
+        self.patches = [
+            patch("magpie.prepare_dataset.hn_api_url", self.fake.api_url),
+            patch("magpie.prepare_dataset.cache_dir", self.tmp_dir.name),
+            patch("magpie.refresh.hn_api_url", self.fake.api_url),
+            patch("magpie.refresh.cache_dir", self.tmp_dir.name),
+        ]
+        for p in self.patches:
+            p.start()
+
+        # Cache a few stories, then edit some cached and some uncached items
+        self.cached_ids = self.corpus.story_ids[:5]
+        get_cached_items_by_ids(self.cached_ids)
+        self.changed_ids = [*self.cached_ids[:2], *self.corpus.story_ids[-3:]]
+        for item_id in self.changed_ids:
+            self.corpus.update(item_id, score=1000)
+        self.fake.requests.clear()
+
+    def tearDown(self):
+        for p in reversed(self.patches):
+            p.stop()
+        self.fake.stop()
+        self.tmp_dir.cleanup()
+
+    def test_poll_refreshes_only_cached_changed_items(self):
+        """Changed items that are cached are fetched again; nothing else is."""
+        count = poll(self.state)
+
+        assert count == len(self.cached_ids[:2])
+        assert self.fake.requests == {"updates": 1, "item": 2}
+        with patch("magpie.prepare_dataset.fetcher") as mock_fetcher:
+            items = get_cached_items_by_ids(self.cached_ids)
+            mock_fetcher.fetch_json.assert_not_called()
+        assert [item["score"] for item in items[:2]] == [1000, 1000]
+        assert all(item["score"] != 1000 for item in items[2:])  # noqa: PLR2004
+
+    def test_poll_invalidates_only(self):
+        """In invalidate-only mode, changed cache entries are deleted without fetching them."""
+        count = poll(self.state, invalidate_only=True)
+
+        assert count == len(self.cached_ids[:2])
+        assert self.fake.requests == {"updates": 1}
+        paths = [
+            fscache.path(f"{self.fake.api_url}/item/{item_id}.json", cache_dir=self.tmp_dir.name)
+            for item_id in self.cached_ids
+        ]
+        assert sorted(fscache.backend.read_many(paths)) == sorted(paths[2:])
+
+    def test_feed_state(self):
+        """The synced time holds while polls keep coming and resets after a gap."""
+        assert self.state.synced_since() == math.inf
+
+        poll(self.state)
+        since = self.state.since
+        assert since is not None
+        assert FeedState.load(self.state.path).synced_since() == since
+
+        # The state is a plain file, so commands using any cache backend see it
+        with patch.object(fscache, "backend", None):
+            assert FeedState.load(self.state.path).since == since
+
+        # A poll within the gap continues the run
+        self.state.mark_polled(since + 60)
+        assert self.state.synced_since(now=since + 120) == since
+
+        # Without polls for longer than the gap, nothing is known to be fresh
+        assert self.state.synced_since(now=since + 60 + self.state.max_gap + 1) == math.inf
+
+        # A poll after a gap starts a new run
+        later = since + 60 + self.state.max_gap + 1
+        self.state.mark_polled(later)
+        assert self.state.synced_since(now=later) == later
+
+
+if __name__ == "__main__":
+    unittest.main()
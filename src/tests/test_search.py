@@ -0,0 +1,153 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from urllib.parse import urlencode
+
+from benchmarks.fake_hn import Corpus, FakeHN
+
+from magpie.fetch import fetcher
+from magpie.harvest import StoryIndex
+from magpie.prepare_dataset import get_cached_items_by_ids
+from magpie.search import backfill, backfill_around, scanned_ranges, search_stories
+
+
+class TestSearch(unittest.TestCase):
+    """Test bulk story backfill against the local search API stand-in."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.corpus = Corpus(size=2000, story_density=0.3)
+        self.fake = FakeHN(self.corpus).start()
+        self.min_score = 2
+
+        # Stories in the middle of the corpus, by time
+        self.start_time = int(self.corpus.start_time) + 3000
+        self.end_time = int(self.corpus.start_time) + 9000
+        self.expected = {
+            item_id
+            for item_id in self.corpus.story_ids
+            if self.start_time <= self.corpus.item(item_id)["time"] < self.end_time
+            and self.corpus.item(item_id)["score"] >= self.min_score
+        }
+
+    def tearDown(self):
+        self.fake.stop()
+        self.tmp_dir.cleanup()
+
+    def test_search_stories_pages_through_slices(self):
+        """Every matching story is returned once, with full pages queried again."""
+        page_size = 20
+        with patch("magpie.search.search_api_url", self.fake.search_url):
+            batches = list(
+                search_stories(
+                    self.start_time,
+                    self.end_time,
+                    self.min_score,
+                    slice_seconds=2000,
+                    page_size=page_size,
+                )
+            )
+
+        ids = [story["id"] for batch in batches for story in batch]
+        assert len(ids) == len(set(ids))
+        assert set(ids) == self.expected
+
+        # Far fewer requests than items in the range
+        items_in_range = (self.end_time - self.start_time) // 7
+        assert self.fake.requests["search"] < items_in_range / page_size
+        assert self.fake.requests["item"] == 0
+
+    def test_backfill_fills_index_and_item_cache(self):
+        """Backfilled stories are served from the item cache and mark their IDs as scanned."""
+        index = StoryIndex(os.path.join(self.tmp_dir.name, "story_index.json"))
+
+        with (
+            patch("magpie.search.search_api_url", self.fake.search_url),
+            patch("magpie.search.cache_dir", self.tmp_dir.name),
+            patch("magpie.prepare_dataset.cache_dir", self.tmp_dir.name),
+        ):
+            added = backfill(index, self.start_time, self.end_time, self.min_score)
+
+            with patch("magpie.prepare_dataset.fetcher") as mock_fetcher:
+                story_id = min(self.expected)
+                [item] = get_cached_items_by_ids([story_id])
+                mock_fetcher.fetch_json.assert_not_called()
+
+        assert added == len(self.expected)
+        assert item["title"] == self.corpus.item(story_id)["title"]
+        assert index.missing_ranges(range(min(self.expected), max(self.expected) + 1)) == []
+
+    def test_backfill_skips_searched_time_ranges(self):
+        """Re-runs only search time ranges no earlier backfill enumerated."""
+        index_path = os.path.join(self.tmp_dir.name, "story_index.json")
+        middle = (self.start_time + self.end_time) // 2
+        upvotes = [{"id": 1, "time": middle}]
+
+        with (
+            patch("magpie.search.search_api_url", self.fake.search_url),
+            patch("magpie.search.cache_dir", self.tmp_dir.name),
+        ):
+            index = StoryIndex(index_path)
+            backfill_around(index, upvotes, margin=middle - self.start_time, min_score=1)
+            assert index.searched == [range(self.start_time, 2 * middle - self.start_time)]
+
+            requests = self.fake.requests["search"]
+            reloaded = StoryIndex.load(index_path)
+            assert backfill_around(reloaded, upvotes, margin=100, min_score=1) == 0
+            assert self.fake.requests["search"] == requests
+
+            # Widening the window only searches the new part
+            backfill(reloaded, self.start_time - 500, self.end_time, min_score=1)
+            assert reloaded.searched == [range(self.start_time - 500, self.end_time)]
+            assert self.fake.requests["search"] == requests + 1
+
+    def test_backfill_leaves_failed_slices_unscanned(self):
+        """The IDs of a time slice whose search failed are left for per-item harvesting."""
+        index = StoryIndex(os.path.join(self.tmp_dir.name, "story_index.json"))
+        slice_seconds = 2000
+        failed_start = self.start_time + slice_seconds
+        failed_filter = urlencode({"f": f"created_at_i>={failed_start},"})[2:]
+        fetch_json = fetcher.fetch_json
+
+        def fail_one_slice(urls, **kwargs):
+            pages = fetch_json(urls, **kwargs)
+            return [
+                None if failed_filter in url else page
+                for url, page in zip(urls, pages, strict=True)
+            ]
+
+        with (
+            patch("magpie.search.search_api_url", self.fake.search_url),
+            patch("magpie.search.cache_dir", self.tmp_dir.name),
+            patch.object(fetcher, "fetch_json", side_effect=fail_one_slice),
+        ):
+            backfill(
+                index, self.start_time, self.end_time, self.min_score, slice_seconds=slice_seconds
+            )
+
+        in_failed_slice = {
+            item_id
+            for item_id in self.expected
+            if failed_start <= self.corpus.item(item_id)["time"] < failed_start + slice_seconds
+        }
+        assert in_failed_slice
+        assert set(index.stories) == self.expected - in_failed_slice
+
+        missing = index.missing_ranges(range(min(self.expected), max(self.expected) + 1))
+        for item_id in self.expected:
+            assert any(item_id in r for r in missing) == (item_id in in_failed_slice)
+
+    def test_scanned_ranges(self):
+        """Only adjacent, fully enumerated slices are merged into scanned ID ranges."""
+        stories = [(5, 50), (15, 150), (25, 250), (35, 350), (12, 120)]
+        # The slice from 20 to 29 was cut short, so 150..350 isn't covered
+        enumerated = [(10, 19), (0, 9), (30, 39)]
+
+        assert scanned_ranges(stories, enumerated) == [range(50, 151), range(350, 351)]
+        assert scanned_ranges(stories, []) == []
+        assert scanned_ranges([], enumerated) == []
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,16 @@
 import importlib.util
+import subprocess
+import sys
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 
 import pytest
+from datasets import Dataset, DatasetDict
 from transformers import PreTrainedModel, PreTrainedTokenizer
 
+from magpie.train import train
+from magpie.train.model import select_increment
+
 # Check if train.py is available
 skip_train_tests = importlib.util.find_spec("magpie.train") is None
 
@@ -34,6 +40,44 @@ class TestTrain(unittest.TestCase):
         # This is a placeholder test that always passes when run
         assert True, "Test is skipped via pytest.mark.skipif"
 
+    def test_imports_are_light(self):
+        """Importing the package and its commands doesn't load the heavy libraries."""
+        heavy = ["torch", "transformers", "datasets", "dateparser", "liqfit"]
+        code = (
+            "import sys, magpie.__main__, magpie.prepare_dataset, magpie.train; "
+            f"print([m for m in {heavy!r} if m in sys.modules])"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        )
+        assert result.stdout.strip() == "[]"
+
+    @patch("magpie.train.model.trained_data_version", return_value="v1")
+    @patch("magpie.train.model.load_training_data", return_value=(MagicMock(), "v1"))
+    def test_train_skips_unchanged_data(self, mock_load, mock_trained):
+        """Training is skipped when the model already saw this dataset version."""
+        assert not train()
+        mock_load.assert_called_once()
+
+    def test_select_increment(self):
+        """Only rows new since the previous version are selected, plus a replay sample."""
+        previous = DatasetDict(
+            {
+                "train": Dataset.from_dict({"id": [1, 2, 3, 4, 5]}),
+                "test": Dataset.from_dict({"id": [8]}),
+            }
+        )
+        current = Dataset.from_dict({"id": [1, 6, 2, 3, 5, 7, 4]})
+
+        selected = select_increment(current, previous, replay_ratio=1.0)
+        new_ids, old_ids = {6, 7}, {1, 2, 3, 4, 5}
+        assert new_ids <= set(selected["id"])
+        assert len(set(selected["id"]) & old_ids) == len(new_ids)
+        assert selected["id"] == [i for i in current["id"] if i in selected["id"]]
+
+        assert len(select_increment(current, previous, replay_ratio=0)) == len(new_ids)
+        assert len(select_increment(current.select([0, 2]), previous)) == 0
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1 +0,0 @@
-# HN SDK type stubs
@@ -1 +0,0 @@
-# HN SDK client stubs
@@ -1 +0,0 @@
-# HN SDK v0 client stubs
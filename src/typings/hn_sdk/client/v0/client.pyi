@@ -1,3 +0,0 @@
-from typing import Any
-
-def get_item_by_id(item_id: int) -> dict[str, Any]: ...